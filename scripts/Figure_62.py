@@ -11,7 +11,9 @@ from scipy import interpolate as interpolate
 import seaborn as sns
 import pandas as pd
 from matplotlib.colors import LogNorm
-from lib import load_data
+from lib import (
+    phase, MASS_BINS, density_cube, density_panel, plot_density_panel,
+    setup_plots, savefig)
 
 plt.style.use('science')
 sns.set_palette("colorblind")
@@ -23,6 +25,7 @@ plt.rc('axes', labelsize=8.)
 plt.rc('legend', fontsize=4.5)
 
 plt.rcParams["errorbar.capsize"]
+setup_plots()
 
 fig, ax = plt.subplots(3, 4, sharex=True, sharey=True, figsize=[7.03058, 6])
 fig.subplots_adjust(right=0.96, hspace=0.075, wspace=0.075, left=0.15)
@@ -31,74 +34,22 @@ cbar_ax = fig.add_axes([0.97, 0.15, 0.015, 0.7])
 data_path = "../data/"
 fig_path = "../figures/"
 
-mask = False
-mask_val = 1.e-13
-
-path = data_path+'pop_EUV/'
-profile_name = "Full sample"
-data_euv = load_data(path, profile_name=profile_name, mask=mask, 
-                     mask_val=mask_val)
-
-path = data_path+'pop_EUV/03Msun/'
-profile_name_03 = "$M_\\star \\leq 0.3 M_\\odot$"
-data_euv_03 = load_data(path, profile_name=profile_name_03, mask=mask,
-                        mask_val=mask_val)
-
-path = data_path+'pop_EUV/06Msun/'
-profile_name_06 = "$0.3 < M_\\star \\leq 0.6 M_\\odot$"
-data_euv_06 = load_data(path, profile_name=profile_name_06, mask=mask,
-                        mask_val=mask_val)
-
-path = data_path+'pop_EUV/1Msun/'
-profile_name_1 = "$0.6 < M_\\star \\leq M_\\odot$"
-data_euv_1 = load_data(path, profile_name=profile_name_1, mask=mask,
-                       mask_val=mask_val)
-
-path = data_path+'pop_XEUV/'
-data_xeuv = load_data(path, profile_name=profile_name, mask=mask,
-                      mask_val=mask_val)
-
-path = data_path+'pop_XEUV/03Msun/'
-data_xeuv_03 = load_data(path, profile_name=profile_name_03, mask=mask,
-                         mask_val=mask_val)
-
-path = data_path+'pop_XEUV/06Msun/'
-data_xeuv_06 = load_data(path, profile_name=profile_name_06, mask=mask,
-                         mask_val=mask_val)
-
-path = data_path+'pop_XEUV/1Msun/'
-data_xeuv_1 = load_data(path, profile_name=profile_name_1, mask=mask,
-                        mask_val=mask_val)
-
-path = data_path+'pop_FUV/'
-data_fuv = load_data(path, profile_name=profile_name, mask=mask,
-                      mask_val=mask_val)
-
-path = data_path+'pop_FUV/03Msun/'
-data_fuv_03 = load_data(path, profile_name=profile_name_03, mask=mask,
-                         mask_val=mask_val)
-
-path = data_path+'pop_FUV/06Msun/'
-data_fuv_06 = load_data(path, profile_name=profile_name_06, mask=mask,
-                         mask_val=mask_val)
-
-path = data_path+'pop_FUV/1Msun/'
-data_fuv_1 = load_data(path, profile_name=profile_name_1, mask=mask,
-                        mask_val=mask_val)
-
-low_acc_data = pd.read_csv(data_path+'low_accretors.dat', sep=' ')
-low_acc_data["Mdot"] *= 1.e-10
-low_acc_data["dMdot"] *= 1.e-10
-low_acc_data_03 = low_acc_data[low_acc_data["M$_\star$"] <= 0.3]
-low_acc_data_06 = low_acc_data[low_acc_data["M$_\star$"] > 0.3]
-low_acc_data_06 = low_acc_data_06[low_acc_data_06["M$_\star$"] <= 0.6]
-low_acc_data_1 = low_acc_data[low_acc_data["M$_\star$"] > 0.6]
-
-z = sns.histplot(data=data_euv, x="age", y="mdot_acc",
-                 binwidth=(0.1*20./6., 0.1), cbar=False, stat='density',
-                 cmap='turbo', norm=LogNorm(vmin=1.e-4, vmax=1.e-1),
-                 vmin=None, vmax=None, log_scale=(False, True),
-                 cbar_kws={'label': 'probability density'}, kde=True, ax=ax[0][0])
+cube_euv = density_cube("EUV", data_path=data_path)
+cube_xeuv = density_cube("XEUV", data_path=data_path)
+cube_fuv = density_cube("FUV", data_path=data_path)
+
+with phase("load"):
+    low_acc_data = pd.read_csv(data_path+'low_accretors.dat', sep=' ')
+    low_acc_data["Mdot"] *= 1.e-10
+    low_acc_data["dMdot"] *= 1.e-10
+    low_acc_data_03 = low_acc_data[low_acc_data["M$_\star$"] <= 0.3]
+    low_acc_data_06 = low_acc_data[low_acc_data["M$_\star$"] > 0.3]
+    low_acc_data_06 = low_acc_data_06[low_acc_data_06["M$_\star$"] <= 0.6]
+    low_acc_data_1 = low_acc_data[low_acc_data["M$_\star$"] > 0.6]
+
+z = plot_density_panel(ax[0][0], cube_euv,
+                       density_panel(cube_euv),
+                       cmap='turbo', norm=LogNorm(vmin=1.e-4, vmax=1.e-1))
 ax[0][0].errorbar(x=low_acc_data["t"], y=low_acc_data["Mdot"],
                   xerr=low_acc_data["dt"], yerr=low_acc_data["dMdot"],
                   fmt='none', barsabove=False, color='black', alpha=0.5)
@@ -112,11 +63,9 @@ ax[0][0].set_xlim(0., 20.)
 ax[0][0].set_ylim(1e-12, 1e-7)
 ax[0][0].set_title("Full sample")
 
-z1 = sns.histplot(data=data_euv_03, x="age", y="mdot_acc",
-                  binwidth=(0.1*20./6., 0.1), cbar=False, stat='density',
-                  cmap='turbo', norm=LogNorm(vmin=1.e-4, vmax=1.e-1),
-                  vmin=None, vmax=None, log_scale=(False, True),
-                  cbar_kws={'label': 'probability density'}, kde=True, ax=ax[0][1])
+z1 = plot_density_panel(ax[0][1], cube_euv,
+                        density_panel(cube_euv, *MASS_BINS["03Msun"][2:]),
+                        cmap='turbo', norm=LogNorm(vmin=1.e-4, vmax=1.e-1))
 ax[0][1].errorbar(x=low_acc_data_03["t"], y=low_acc_data_03["Mdot"],
                   xerr=low_acc_data_03["dt"], yerr=low_acc_data_03["dMdot"],
                   fmt='none', barsabove=False, color='black', alpha=0.5)
@@ -129,11 +78,9 @@ ax[0][1].set_xlim(0., 20.)
 ax[0][1].set_ylim(1e-12, 1e-7)
 ax[0][1].set_title("$M_\\star \\leq 0.3 M_\\odot$")
 
-z2 = sns.histplot(data=data_euv_06, x="age", y="mdot_acc",
-                  binwidth=(0.1*20./6., 0.1), cbar=False, stat='density',
-                  cmap='turbo', norm=LogNorm(vmin=1.e-4, vmax=1.e-1),
-                  vmin=None, vmax=None, log_scale=(False, True),
-                  cbar_kws={'label': 'probability density'}, kde=True, ax=ax[0][2])
+z2 = plot_density_panel(ax[0][2], cube_euv,
+                        density_panel(cube_euv, *MASS_BINS["06Msun"][2:]),
+                        cmap='turbo', norm=LogNorm(vmin=1.e-4, vmax=1.e-1))
 ax[0][2].errorbar(x=low_acc_data_06["t"], y=low_acc_data_06["Mdot"],
                   xerr=low_acc_data_06["dt"], yerr=low_acc_data_06["dMdot"],
                   fmt='none', barsabove=False, color='black', alpha=0.5)
@@ -146,11 +93,9 @@ ax[0][2].set_xlim(0., 20.)
 ax[0][2].set_ylim(1e-12, 1e-7)
 ax[0][2].set_title("$0.3 < M_\\star \\leq 0.6 M_\\odot$")
 
-z3 = sns.histplot(data=data_euv_1, x="age", y="mdot_acc",
-                  binwidth=(0.1*20./6., 0.1), cbar=False, stat='density',
-                  cmap='turbo', norm=LogNorm(vmin=1.e-4, vmax=1.e-1),
-                  vmin=None, vmax=None, log_scale=(False, True),
-                  cbar_kws={'label': 'probability density'}, kde=True, ax=ax[0][3])
+z3 = plot_density_panel(ax[0][3], cube_euv,
+                        density_panel(cube_euv, *MASS_BINS["1Msun"][2:]),
+                        cmap='turbo', norm=LogNorm(vmin=1.e-4, vmax=1.e-1))
 ax[0][3].errorbar(x=low_acc_data_1["t"], y=low_acc_data_1["Mdot"],
                   xerr=low_acc_data_1["dt"], yerr=low_acc_data_1["dMdot"],
                   fmt='none', barsabove=False, color='black', alpha=0.5)
@@ -163,12 +108,10 @@ ax[0][3].set_xlim(0., 20.)
 ax[0][3].set_ylim(1e-12, 1e-7)
 ax[0][3].set_title("$0.6 < M_\\star \\leq 1 M_\\odot$")
 
-z4 = sns.histplot(data=data_xeuv, x="age", y="mdot_acc",
-                  binwidth=(0.1*20./6., 0.1), cbar=True, stat='density',
-                  cmap='turbo', norm=LogNorm(vmin=1.e-4, vmax=1.e-1),
-                  vmin=None, vmax=None, log_scale=(False, True),
-                  cbar_kws={'label': 'probability density'}, cbar_ax=cbar_ax,
-                  kde=True, ax=ax[1][0])
+z4 = plot_density_panel(ax[1][0], cube_xeuv,
+                        density_panel(cube_xeuv),
+                        cmap='turbo', norm=LogNorm(vmin=1.e-4, vmax=1.e-1))
+fig.colorbar(z4, cax=cbar_ax, label='probability density')
 ax[1][0].set_yscale('log')
 ax[1][0].errorbar(x=low_acc_data["t"], y=low_acc_data["Mdot"],
                   xerr=low_acc_data["dt"], yerr=low_acc_data["dMdot"],
@@ -182,12 +125,9 @@ ax[1][0].set_xlabel('age / Myr')
 ax[1][0].set_xlim(0., 20.)
 ax[1][0].set_ylim(1e-12, 1e-7)
 
-z5 = sns.histplot(data=data_xeuv_03, x="age", y="mdot_acc",
-                  binwidth=(0.1*20./6., 0.1), cbar=False, stat='density',
-                  cmap='turbo', norm=LogNorm(vmin=1.e-4, vmax=1.e-1),
-                  vmin=None, vmax=None, log_scale=(False, True),
-                  cbar_kws={'label': 'probability density'},
-                  kde=True, ax=ax[1][1])
+z5 = plot_density_panel(ax[1][1], cube_xeuv,
+                        density_panel(cube_xeuv, *MASS_BINS["03Msun"][2:]),
+                        cmap='turbo', norm=LogNorm(vmin=1.e-4, vmax=1.e-1))
 ax[1][1].set_yscale('log')
 ax[1][1].errorbar(x=low_acc_data_03["t"], y=low_acc_data_03["Mdot"],
                   xerr=low_acc_data_03["dt"], yerr=low_acc_data_03["dMdot"],
@@ -200,12 +140,9 @@ ax[1][1].set_xlabel('age / Myr')
 ax[1][1].set_xlim(0., 20.)
 ax[1][1].set_ylim(1e-12, 1e-7)
 
-z6 = sns.histplot(data=data_xeuv_06, x="age", y="mdot_acc",
-                  binwidth=(0.1*20./6., 0.1), cbar=False, stat='density',
-                  cmap='turbo', norm=LogNorm(vmin=1.e-4, vmax=1.e-1),
-                  vmin=None, vmax=None, log_scale=(False, True),
-                  cbar_kws={'label': 'probability density'},
-                  kde=True, ax=ax[1][2])
+z6 = plot_density_panel(ax[1][2], cube_xeuv,
+                        density_panel(cube_xeuv, *MASS_BINS["06Msun"][2:]),
+                        cmap='turbo', norm=LogNorm(vmin=1.e-4, vmax=1.e-1))
 ax[1][2].set_yscale('log')
 ax[1][2].errorbar(x=low_acc_data_06["t"], y=low_acc_data_06["Mdot"],
                   xerr=low_acc_data_06["dt"], yerr=low_acc_data_06["dMdot"],
@@ -218,12 +155,9 @@ ax[1][2].set_xlabel('age / Myr')
 ax[1][2].set_xlim(0., 20.)
 ax[1][2].set_ylim(1e-12, 1e-7)
 
-z7 = sns.histplot(data=data_xeuv_1, x="age", y="mdot_acc",
-                  binwidth=(0.1*20./6., 0.1), cbar=False, stat='density',
-                  cmap='turbo', norm=LogNorm(vmin=1.e-4, vmax=1.e-1),
-                  vmin=None, vmax=None, log_scale=(False, True),
-                  cbar_kws={'label': 'probability density'},
-                  kde=True, ax=ax[1][3])
+z7 = plot_density_panel(ax[1][3], cube_xeuv,
+                        density_panel(cube_xeuv, *MASS_BINS["1Msun"][2:]),
+                        cmap='turbo', norm=LogNorm(vmin=1.e-4, vmax=1.e-1))
 ax[1][3].set_yscale('log')
 ax[1][3].errorbar(x=low_acc_data_1["t"], y=low_acc_data_1["Mdot"],
                   xerr=low_acc_data_1["dt"], yerr=low_acc_data_1["dMdot"],
@@ -236,12 +170,10 @@ ax[1][3].set_xlabel('age / Myr')
 ax[1][3].set_xlim(0., 20.)
 ax[1][3].set_ylim(1e-12, 1e-7)
 
-z8 = sns.histplot(data=data_fuv, x="age", y="mdot_acc",
-                  binwidth=(0.1*20./6., 0.1), cbar=True, stat='density',
-                  cmap='turbo', norm=LogNorm(vmin=1.e-4, vmax=1.e-1),
-                  vmin=None, vmax=None, log_scale=(False, True),
-                  cbar_kws={'label': 'probability density'}, cbar_ax=cbar_ax,
-                  kde=True, ax=ax[2][0])
+z8 = plot_density_panel(ax[2][0], cube_fuv,
+                        density_panel(cube_fuv),
+                        cmap='turbo', norm=LogNorm(vmin=1.e-4, vmax=1.e-1))
+fig.colorbar(z8, cax=cbar_ax, label='probability density')
 ax[2][0].set_yscale('log')
 ax[2][0].errorbar(x=low_acc_data["t"], y=low_acc_data["Mdot"],
                   xerr=low_acc_data["dt"], yerr=low_acc_data["dMdot"],
@@ -255,12 +187,9 @@ ax[2][0].set_xlabel('age / Myr')
 ax[2][0].set_xlim(0., 20.)
 ax[2][0].set_ylim(1e-12, 1e-7)
 
-z9 = sns.histplot(data=data_fuv_03, x="age", y="mdot_acc",
-                  binwidth=(0.1*20./6., 0.1), cbar=False, stat='density',
-                  cmap='turbo', norm=LogNorm(vmin=1.e-4, vmax=1.e-1),
-                  vmin=None, vmax=None, log_scale=(False, True),
-                  cbar_kws={'label': 'probability density'},
-                  kde=True, ax=ax[2][1])
+z9 = plot_density_panel(ax[2][1], cube_fuv,
+                        density_panel(cube_fuv, *MASS_BINS["03Msun"][2:]),
+                        cmap='turbo', norm=LogNorm(vmin=1.e-4, vmax=1.e-1))
 ax[2][1].set_yscale('log')
 ax[2][1].errorbar(x=low_acc_data_03["t"], y=low_acc_data_03["Mdot"],
                   xerr=low_acc_data_03["dt"], yerr=low_acc_data_03["dMdot"],
@@ -273,12 +202,9 @@ ax[2][1].set_xlabel('age / Myr')
 ax[2][1].set_xlim(0., 20.)
 ax[2][1].set_ylim(1e-12, 1e-7)
 
-z10 = sns.histplot(data=data_fuv_06, x="age", y="mdot_acc",
-                  binwidth=(0.1*20./6., 0.1), cbar=False, stat='density',
-                  cmap='turbo', norm=LogNorm(vmin=1.e-4, vmax=1.e-1),
-                  vmin=None, vmax=None, log_scale=(False, True),
-                  cbar_kws={'label': 'probability density'},
-                  kde=True, ax=ax[2][2])
+z10 = plot_density_panel(ax[2][2], cube_fuv,
+                         density_panel(cube_fuv, *MASS_BINS["06Msun"][2:]),
+                         cmap='turbo', norm=LogNorm(vmin=1.e-4, vmax=1.e-1))
 ax[2][2].set_yscale('log')
 ax[2][2].errorbar(x=low_acc_data_06["t"], y=low_acc_data_06["Mdot"],
                   xerr=low_acc_data_06["dt"], yerr=low_acc_data_06["dMdot"],
@@ -291,12 +217,9 @@ ax[2][2].set_xlabel('age / Myr')
 ax[2][2].set_xlim(0., 20.)
 ax[2][2].set_ylim(1e-12, 1e-7)
 
-z11 = sns.histplot(data=data_fuv_1, x="age", y="mdot_acc",
-                  binwidth=(0.1*20./6., 0.1), cbar=False, stat='density',
-                  cmap='turbo', norm=LogNorm(vmin=1.e-4, vmax=1.e-1),
-                  vmin=None, vmax=None, log_scale=(False, True),
-                  cbar_kws={'label': 'probability density'},
-                  kde=True, ax=ax[2][3])
+z11 = plot_density_panel(ax[2][3], cube_fuv,
+                         density_panel(cube_fuv, *MASS_BINS["1Msun"][2:]),
+                         cmap='turbo', norm=LogNorm(vmin=1.e-4, vmax=1.e-1))
 ax[2][3].set_yscale('log')
 ax[2][3].errorbar(x=low_acc_data_1["t"], y=low_acc_data_1["Mdot"],
                   xerr=low_acc_data_1["dt"], yerr=low_acc_data_1["dMdot"],
@@ -309,4 +232,4 @@ ax[2][3].set_xlabel('age / Myr')
 ax[2][3].set_xlim(0., 20.)
 ax[2][3].set_ylim(1e-12, 1e-7)
 
-fig.savefig(fig_path+'Fig62.png', format='png', dpi=400)
+savefig(fig, fig_path+'Fig62.png', format='png', dpi=400)
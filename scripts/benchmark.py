@@ -0,0 +1,235 @@
+"""
+Script to benchmark the analysis library and the figure scripts.
+
+Synthetic populations (lib.write_synthetic_population) of 1e4 to 1e7 discs are
+written to a scratch copy of data/ (binary columns, plus the text columns up
+to --text-max rows) and every stage the figures go through is timed on them:
+IMF weights and sampling, Lx and Phi sampling, loading and masking the
+populations, the KDEs and the density histograms, and each figure script from
+start to savefig, split in the phases recorded by lib.phase (load, sampling,
+kde, binning, savefig and the remaining plotting time as "other"). The timings
+are written to benchmarks/results.json and compared with
+benchmarks/baseline.json; stages slower than the baseline by more than
+--threshold are reported as regressions, and the exit status is nonzero if
+there is any.
+
+    python benchmark.py [--sizes 1e4 1e5] [--repeat 3] [--no-figures] [--draft]
+                        [--threshold 0.2] [--save-baseline]
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from lib import (IMF, MODELS, binned_kde, density_cube, kde_curves, load_data,
+                 load_XLF, make_rng, mask_accretion, sample_IMF, sample_Lx,
+                 sample_Phi, write_synthetic_population)
+from make_figures import FIGURES
+
+scripts_path = os.path.dirname(os.path.abspath(__file__))+"/"
+data_path = scripts_path+"../data/"
+bench_path = scripts_path+"../benchmarks/"
+
+SIZES = [10**4, 10**5, 10**6, 10**7]
+
+
+def scratch_tree(root, size, text=False):
+    """
+    Build root/data with links to the data files and synthetic populations,
+    and root/scripts with links to the scripts, so that the figure scripts run
+    unchanged from root/scripts.
+    """
+    os.makedirs(root+"data/")
+    os.makedirs(root+"figures/")
+    os.makedirs(root+"scripts/")
+    for name in os.listdir(data_path):
+        if not name.startswith("pop_"):
+            os.symlink(os.path.abspath(data_path+name), root+"data/"+name)
+    for name in os.listdir(scripts_path):
+        if name.endswith(".py"):
+            os.symlink(scripts_path+name, root+"scripts/"+name)
+    for model in MODELS:
+        write_synthetic_population(root+"data/pop_"+model+"/", model, size,
+                                   text=text, data_path=data_path)
+
+
+def timeit(func, repeat=3):
+    """
+    Return the best wall time of repeat calls of func.
+    """
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter()-start)
+    return best
+
+
+def library_stages(root, size, text=False):
+    """
+    Return the library stages to time on the scratch tree, as {name: func}.
+    """
+    pop = root+"data/pop_EUV/"
+    fuv = root+"data/pop_FUV/"
+    masses = np.linspace(0.1, 1.1, size)
+    Mstar = sample_IMF(size, rng=make_rng("benchmark", size))
+    XLF = load_XLF(data_path)
+    data = load_data(pop, mask=False)
+    lmdot = np.log10(data["mdot_acc"].to_numpy())
+    md_alpha = np.array([np.load(fuv+"md.npy"), np.load(fuv+"alpha.npy")]).T
+
+    stages = {
+        "IMF": lambda: IMF(masses),
+        "sample_IMF": lambda: sample_IMF(size),
+        "sample_Lx": lambda: sample_Lx(Mstar, XLF),
+        "sample_Phi": lambda: sample_Phi(Mstar),
+        "load_data": lambda: load_data(pop),
+        "mask_accretion": lambda: mask_accretion(data, 1.e-11),
+        "kde_curves": lambda: kde_curves(lmdot, cut=3.),
+        "binned_kde_2d": lambda: binned_kde(md_alpha, log_scale=(False, True)),
+        "density_cube": lambda: density_cube("EUV", data_path=root+"data/",
+                                             cache=False),
+    }
+    if text:
+        # the same population parsed from the text columns
+        def load_text():
+            os.rename(pop+"manifest.json", pop+"manifest.off")
+            try:
+                load_data(pop)
+            finally:
+                os.rename(pop+"manifest.off", pop+"manifest.json")
+        stages["load_data_text"] = load_text
+    return stages
+
+
+def figure_stages(root, env=None):
+    """
+    Return the figure scripts to time on the scratch tree, as {name: func}.
+
+    Their phase reports are written to root/profile/, without tracing the
+    memory which would slow them down. A script that fails raises
+    CalledProcessError with its stderr.
+    """
+    os.makedirs(root+"profile/")
+    env = dict(os.environ if env is None else env,
+               LOW_ACCRETORS_PROFILE=root+"profile/",
+               LOW_ACCRETORS_PROFILE_MEMORY="0")
+
+    def run(name):
+        subprocess.run([sys.executable, name+".py"], cwd=root+"scripts/",
+                       env=env, capture_output=True, text=True, check=True)
+    return {name: (lambda name=name: run(name)) for name in FIGURES}
+
+
+def run_benchmarks(sizes, repeat=3, figures=True, text_max=10**6, env=None,
+                   verbose=True):
+    """
+    Time every stage for every population size.
+
+    Returns {"<size>/<stage>": seconds}; stages that failed are left out and
+    reported.
+    """
+    results = {}
+    for size in sizes:
+        root = tempfile.mkdtemp(prefix="low_accretors_bench_")+"/"
+        try:
+            text = size <= text_max
+            scratch_tree(root, size, text=text)
+            stages = library_stages(root, size, text=text)
+            if figures:
+                stages.update({"figure/"+name: func for name, func
+                               in figure_stages(root, env).items()})
+            for name, func in stages.items():
+                key = f"{size:.0e}/{name}"
+                # each figure is run once, it is dominated by its own I/O
+                n = 1 if name.startswith("figure/") else repeat
+                try:
+                    results[key] = timeit(func, n)
+                except subprocess.CalledProcessError as err:
+                    if verbose:
+                        last = err.stderr.strip().splitlines()
+                        print(f"{key:32s} FAILED  {last[-1] if last else ''}")
+                    continue
+                if verbose:
+                    print(f"{key:32s} {results[key]:10.4f} s", flush=True)
+                profile = root+"profile/"+name[len("figure/"):]+".json"
+                if name.startswith("figure/") and os.path.exists(profile):
+                    with open(profile) as f:
+                        phases = json.load(f)["phases"]
+                    for phase, record in phases.items():
+                        results[key+"/"+phase] = record["wall"]
+        finally:
+            shutil.rmtree(root)
+    return results
+
+
+def compare(results, baseline, threshold=0.2, min_time=0.01):
+    """
+    Return the stages slower than the baseline by more than threshold, as
+    {key: (baseline, result)}. Stages faster than min_time in the baseline
+    are too noisy to compare and are ignored.
+    """
+    return {key: (baseline[key], results[key]) for key in results
+            if key in baseline and baseline[key] >= min_time
+            and results[key] > baseline[key]*(1.+threshold)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--sizes", nargs="*", type=float, default=SIZES,
+                        help="population sizes (default: 1e4 1e5 1e6 1e7)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="calls per library stage, the best is kept")
+    parser.add_argument("--no-figures", action="store_true",
+                        help="do not time the figure scripts")
+    parser.add_argument("--draft", action="store_true",
+                        help="time the figure scripts in draft mode")
+    parser.add_argument("--text-max", type=float, default=1e6,
+                        help="largest population also written as text")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative slowdown reported as a regression")
+    parser.add_argument("--baseline", default=bench_path+"baseline.json")
+    parser.add_argument("--output", default=bench_path+"results.json")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store these results as the new baseline")
+    args = parser.parse_args()
+
+    env = None
+    if args.draft:
+        env = dict(os.environ, LOW_ACCRETORS_DRAFT="1")
+
+    results = run_benchmarks([int(size) for size in args.sizes],
+                             repeat=args.repeat, figures=not args.no_figures,
+                             text_max=args.text_max, env=env)
+    report = {"machine": platform.platform(), "python": platform.python_version(),
+              "numpy": np.__version__, "results": results}
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=1)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=1)
+        print("baseline saved to", args.baseline)
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        print("no baseline to compare with, run with --save-baseline")
+        sys.exit(0)
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+
+    regressions = compare(results, baseline, threshold=args.threshold)
+    for key, (before, after) in regressions.items():
+        print(f"REGRESSION {key}: {before:.4f} s -> {after:.4f} s "
+              f"({after/before-1.:+.0%})")
+    if not regressions:
+        print(f"no regression above {args.threshold:.0%} of the baseline")
+    sys.exit(bool(regressions))
@@ -0,0 +1,262 @@
+"""
+Script to calibrate the disc parameters on the observed disc lifetime.
+
+The lifetimes of discs on a dense grid of (alpha, R1, Md, Mstar, flux) are
+computed with disc.py and the winds of winds.py, in chunks evolved together
+in a pool of processes, each disc stopping as soon as its accretion rate falls
+below --mdot-min (the disc lifetime of Section 3) or at --t-max. Lifetimes are
+cached per grid point in --cache-path, so extending or refining the grid only
+evolves the new points; the cache is kept apart for every version of the disc
+solver, the winds and the radial grid, so a new wind prescription is evolved
+again. The discs with a lifetime in --lifetime (Myr) are then fitted with the
+relation of the model:
+
+    R1 = a alpha + b Md + c                           (EUV)
+    alpha = 10^(a + b log10(R1) + c log10(Md))        (FUV)
+
+with Md in units of Mstar, as eqs. (r1_alpha) and (r1_alpha_Md) of the paper.
+The paper has no relation for XEUV, whose discs span the whole parameter
+space of Table 2; the EUV form is fitted to its scans, and a parameter that
+is fixed in the scan (Md = 0.1 by default) is reported as such instead of
+being fitted, so the default XEUV fit is R1(alpha). By default the grid is the one of the paper for the median star, Mstar = 0.3
+Msun with its mean Phi or Lx, over the ranges of SCAN_RANGES for each model
+(log10 alpha, R1 in au, log spaced, and Md):
+
+    EUV     alpha 1e-4 - 1e-2, R1 10 - 1000, Md 0.01 - 0.1
+    XEUV    alpha 1e-4 - 1e-2, R1 10 - 100,  Md 0.1 (Table 2)
+    FUV     alpha 1e-7 - 1e-3, R1 10 - 100,  Md 0.01 - 0.1
+
+The FUV range of alpha covers the relation of the paper, alpha = 3e-7 to
+2e-4 for R1 and Md in the ranges of Table 2.
+
+    python calibrate.py EUV [--alpha -4 -2 21] [--r1 10 1000 31]
+                            [--md 0.01 0.1 10] [--mstar 0.3] [--flux 41.2]
+                            [--lifetime 2 3] [--workers 8]
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import disc
+import run_population
+import winds
+from disc import evolve_discs_lbp, radial_grid
+from lib import MODELS, Phi_Mstar, stellar_properties
+from run_population import model_wind
+
+# relations of the paper, eqs. (r1_alpha) and (r1_alpha_Md)
+PAPER_FITS = {
+    "EUV": (60.4, 3009.7, 226.6),
+    "FUV": (-9.41, 1.678, -1.211),
+}
+
+# default scan of each model, (min, max, number of values) of log10(alpha),
+# R1 (au) and the disc mass (Mstar)
+SCAN_RANGES = {
+    "EUV": {"alpha": (-4., -2., 21), "r1": (10., 1000., 31),
+            "md": (0.01, 0.1, 10)},
+    "XEUV": {"alpha": (-4., -2., 21), "r1": (10., 100., 31),
+             "md": (0.1, 0.1, 1)},
+    "FUV": {"alpha": (-7., -3., 41), "r1": (10., 100., 31),
+            "md": (0.01, 0.1, 10)},
+}
+
+
+def mean_flux(model, Mstar):
+    """
+    Return the mean log Phi (log Lx for XEUV) of stars of mass Mstar.
+    """
+    Mstar = np.asarray(Mstar, dtype=float)
+    if model == "XEUV":
+        return 1.54*np.log10(Mstar) + 30.31
+    return Phi_Mstar(Mstar)
+
+
+def scan_grid(alpha, r1, md, Mstar, flux):
+    """
+    Return the points of the scan, as an (N x 5) array with columns alpha,
+    r1 (au), md (units of Mstar), Mstar (Msun) and flux (log Phi or log Lx),
+    from the values of each parameter.
+    """
+    axes = np.meshgrid(alpha, r1, md, Mstar, flux, indexing="ij")
+    return np.column_stack([axis.ravel() for axis in axes])
+
+
+def _lifetime_chunk(model, points, t_max, mdot_min, scheme):
+    # disc lifetimes of a chunk of grid points, np.inf if longer than t_max
+    alpha, r1, md, Mstar, flux = points.T
+    grid = radial_grid()
+    Rstar, Lstar = stellar_properties(Mstar)
+    wind, Mdot_wind = model_wind(model, grid, {"Mstar": Mstar, "flux": flux,
+                                               "Rstar": Rstar, "Lstar": Lstar,
+                                               "alpha": alpha, "r1": r1,
+                                               "md": md})
+    result = evolve_discs_lbp(md*Mstar, r1, alpha, Mstar, wind,
+                              Mdot_wind=Mdot_wind, times=[0., t_max],
+                              grid=grid, mdot_min=mdot_min, scheme=scheme)
+    return result["t_disp"]
+
+
+def _evolution_digest():
+    # digest of what the lifetimes depend on besides the options: the source
+    # of the disc solver and of the winds, the current values of the wind
+    # constants, and the radial grid
+    digest = hashlib.sha1(radial_grid()[1].tobytes())
+    for module in (disc, winds, run_population):
+        with open(module.__file__, "rb") as f:
+            digest.update(f.read())
+    for name in sorted(vars(winds)):
+        if name.isupper():
+            digest.update(f"{name}={getattr(winds, name)!r}".encode())
+    return digest.hexdigest()
+
+
+def disc_lifetimes(model, points, t_max=1.e7, mdot_min=1.e-11,
+                   scheme="crank-nicolson", chunk_size=200, workers=None,
+                   cache_path=None, verbose=True):
+    """
+    Return the lifetimes (yr) of the discs of the grid points (see scan_grid),
+    np.inf for those living longer than t_max.
+
+    With cache_path, the lifetimes are read from and added to a cache file of
+    the model, of these options and of the source of disc.py, winds.py and
+    run_population.py, the wind constants and the radial grid, and only the
+    missing points are evolved; changing the wind prescription starts a new
+    cache.
+    """
+    points = np.asarray(points, dtype=float)
+    options = {"model": model, "t_max": t_max, "mdot_min": mdot_min,
+               "scheme": scheme, "evolution": _evolution_digest()}
+    cache = {}
+    if cache_path is not None:
+        key = hashlib.sha1(json.dumps(options, sort_keys=True).encode())
+        fname = cache_path+f"lifetimes_{model}_{key.hexdigest()[:10]}.npz"
+        if os.path.exists(fname):
+            with np.load(fname) as f:
+                cache = dict(zip(map(tuple, f["points"]), f["t_disp"]))
+
+    missing = np.array([tuple(p) not in cache for p in points], dtype=bool)
+    todo = np.unique(points[missing], axis=0)
+    if verbose:
+        print(f"{len(points)-missing.sum()} of {len(points)} points cached, "
+              f"evolving {len(todo)} discs", flush=True)
+    if len(todo):
+        start = time.perf_counter()
+        chunks = [todo[i:i+chunk_size] for i in range(0, len(todo), chunk_size)]
+        with ProcessPoolExecutor(workers) as pool:
+            t_disp = np.concatenate(list(pool.map(
+                _lifetime_chunk, [model]*len(chunks), chunks,
+                [t_max]*len(chunks), [mdot_min]*len(chunks),
+                [scheme]*len(chunks))))
+        cache.update(zip(map(tuple, todo), t_disp))
+        if verbose:
+            print(f"evolved in {time.perf_counter()-start:.1f} s")
+        if cache_path is not None:
+            os.makedirs(cache_path, exist_ok=True)
+            np.savez(fname, points=np.array(list(cache)),
+                     t_disp=np.array(list(cache.values())))
+    return np.array([cache[tuple(p)] for p in points])
+
+
+def fit_relation(model, points, t_disp, lifetime=(2., 3.)):
+    """
+    Fit the relation of the model to the grid points whose lifetime is in
+    the range lifetime (Myr); returns the coefficients (a, b, c) and the
+    number of points fitted.
+
+    A parameter that does not vary between the points fitted (Md for the
+    default XEUV scan) is not fitted, its coefficient being None, since it
+    cannot be told apart from the constant c.
+    """
+    keep = (t_disp >= lifetime[0]*1.e6) & (t_disp <= lifetime[1]*1.e6)
+    alpha, r1, md = points[keep, :3].T
+    if model == "FUV":
+        terms = [np.log10(r1), np.log10(md)]
+        y = np.log10(alpha)
+    else:
+        terms = [alpha, md]
+        y = r1
+    if keep.sum() < 3:
+        raise ValueError(f"Only {keep.sum()} discs with a lifetime in "
+                         f"{lifetime} Myr, extend the grid.")
+    varies = [np.ptp(x) > 0. for x in terms]
+    A = np.column_stack([x for x, v in zip(terms, varies) if v]
+                        + [np.ones(y.size)])
+    coeffs = iter(np.linalg.lstsq(A, y, rcond=None)[0])
+    fitted = [next(coeffs) if v else None for v in varies]
+    constant = next(coeffs)
+    if model == "FUV":
+        return (constant, *fitted), int(keep.sum())
+    return (*fitted, constant), int(keep.sum())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("model", choices=MODELS)
+    parser.add_argument("--alpha", nargs=3, type=float, default=None,
+                        metavar=("MIN", "MAX", "N"),
+                        help="log10(alpha) range and number of values "
+                             "(default: SCAN_RANGES of the model)")
+    parser.add_argument("--r1", nargs=3, type=float, default=None,
+                        metavar=("MIN", "MAX", "N"),
+                        help="R1 range (au, log spaced) and number of values")
+    parser.add_argument("--md", nargs=3, type=float, default=None,
+                        metavar=("MIN", "MAX", "N"),
+                        help="disc mass range (Mstar) and number of values")
+    parser.add_argument("--mstar", nargs="*", type=float, default=[0.3])
+    parser.add_argument("--flux", nargs="*", type=float, default=None,
+                        help="log10 Phi (log10 Lx for XEUV), default the mean")
+    parser.add_argument("--lifetime", nargs=2, type=float, default=[2., 3.],
+                        help="disc lifetimes fitted (Myr)")
+    parser.add_argument("--t-max", type=float, default=1.e7,
+                        help="evolution time after which a disc is stopped")
+    parser.add_argument("--mdot-min", type=float, default=1.e-11,
+                        help="accretion rate defining the disc lifetime")
+    parser.add_argument("--scheme", default="crank-nicolson",
+                        choices=["explicit", "crank-nicolson", "implicit"])
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--cache-path", default="../data/calibration/")
+    args = parser.parse_args()
+
+    ranges = {name: getattr(args, name) or default
+              for name, default in SCAN_RANGES[args.model].items()}
+    alpha = np.logspace(ranges["alpha"][0], ranges["alpha"][1],
+                        int(ranges["alpha"][2]))
+    r1 = np.geomspace(ranges["r1"][0], ranges["r1"][1], int(ranges["r1"][2]))
+    md = np.linspace(ranges["md"][0], ranges["md"][1], int(ranges["md"][2]))
+    if args.flux is None:
+        # each star with its own mean flux
+        points = scan_grid(alpha, r1, md, args.mstar, [0.])
+        points[:, 4] = mean_flux(args.model, points[:, 3])
+    else:
+        points = scan_grid(alpha, r1, md, args.mstar, args.flux)
+
+    t_disp = disc_lifetimes(args.model, points, t_max=args.t_max,
+                            mdot_min=args.mdot_min, scheme=args.scheme,
+                            workers=args.workers, cache_path=args.cache_path)
+    (a, b, c), n = fit_relation(args.model, points, t_disp,
+                                lifetime=args.lifetime)
+    print(f"{n} of {len(points)} discs live {args.lifetime[0]:g}-"
+          f"{args.lifetime[1]:g} Myr")
+    if args.model == "FUV":
+        terms = [(b, "log10(R1)", "R1", 1), (c, "log10(Md)", "Md", 2)]
+        print(f"alpha = 10^({a:.3f}"
+              + "".join(f" {coeff:+.3f} {term}"
+                        for coeff, term, _, _ in terms if coeff is not None)
+              + ")")
+    else:
+        terms = [(a, "alpha", "alpha", 0), (b, "Md", "Md", 2)]
+        print("R1 ="
+              + "".join(f" {coeff:+.1f} {term}"
+                        for coeff, term, _, _ in terms if coeff is not None)
+              + f" {c:+.1f} au")
+    for coeff, _, name, column in terms:
+        if coeff is None:
+            print(f"{name} fixed at {points[0, column]:g}, not fitted")
+    if args.model in PAPER_FITS:
+        print("paper:", ", ".join(f"{x:g}" for x in PAPER_FITS[args.model]))
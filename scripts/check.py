@@ -0,0 +1,373 @@
+"""
+Script to check the numerical methods of the library against references.
+
+Every check computes a few errors of a method against an independent
+reference on small, seeded problems and compares them with a tolerance:
+
+    kde     lib.binned_kde and lib.kde_curves against scipy.stats.gaussian_kde
+            (1D with cut=0 and cut=3, log scale, clip, and a correlated 2D
+            sample)
+
+    disc    disc.solve_tridiagonal against a dense solve, disc.evolve_discs
+            without wind (Crank-Nicolson and implicit) against the
+            similarity solution of Lynden-Bell & Pringle (1974) up to the
+            viscous time (on a grid reaching 1e-4 au, since the zero-torque
+            inner edge of the default grid at 0.1 au departs from it by
+            ~sqrt(0.1 au/R1)), the disc mass against the mass accreted with
+            zero wind, and the Crank-Nicolson and implicit schemes against
+            the explicit one with an EUV wind, and end to end on FUV discs
+            drawn as in run_population.py, which must also lose at least the
+            mass they accrete
+
+    emulator
+            emulator.emulate on a small EUV grid: at the grid points against
+            the histories it stores, inside the cells against discs evolved
+            directly, and the refusal of samples too far outside the grid
+
+    disc_fraction
+            lib.disc_fraction_curves in the stellar-mass bins, and its
+            bootstrap bands, against counting the discs alive at every age
+            (with dispersal times at the ages and surviving discs); the bands
+            must contain the disc fraction
+
+    imf     lib.sample_IMF with mass limits below, above and across the
+            break, against the cumulative distribution of lib.IMF
+
+The errors are printed with their tolerance and the exit status is nonzero if
+any is above it.
+
+    python check.py [kde disc emulator disc_fraction imf ...]
+"""
+import argparse
+import sys
+
+import numpy as np
+
+from disc import (apply_operator, diffusion_operator, evolve_discs,
+                  evolve_discs_lbp, lbp_accretion, lbp_viscous_time,
+                  radial_grid, solve_tridiagonal, viscosity)
+from calibrate import mean_flux
+from emulator import _history_chunk, build_emulator, emulate
+from lib import (BINARY_FRACTION, IMF, MASS_BINS, binned_kde,
+                 disc_fraction_curves, kde_curves, sample_IMF, seed_sequence)
+from run_population import TIMES, draw_discs, model_wind
+from winds import euv_wind
+
+
+def check_kde():
+    """
+    Return the largest errors of the binned KDEs relative to the peak of the
+    density of gaussian_kde on the same grid.
+    """
+    from scipy.stats import gaussian_kde
+
+    rng = np.random.default_rng(0)
+    errors = []
+    x = rng.lognormal(0., 1., 300)
+    for cut in (0., 3.):
+        (grid,), density = binned_kde(np.log(x), cut=cut)
+        ref = gaussian_kde(np.log(x))(grid)
+        errors.append((f"1D cut={cut:g}", np.abs(density-ref).max()/ref.max(),
+                       1.e-3))
+    (grid,), density = binned_kde(x, log_scale=True)
+    ref = gaussian_kde(np.log10(x))(np.log10(grid))
+    errors.append(("1D log scale", np.abs(density-ref).max()/ref.max(), 1.e-3))
+    (grid,), density = binned_kde(np.log(x), clip=[(-0.5, 1.)])
+    ref = gaussian_kde(np.log(x))(grid)
+    errors.append(("1D clip", np.abs(density-ref).max()/ref.max(), 1.e-3))
+
+    # hue groups weighted by their share of the sample
+    hue = np.where(rng.uniform(size=x.size) < 0.3, "a", "b")
+    curves = kde_curves(np.log10(x), hue=hue)
+    err = 0.
+    for key, (grid, density) in curves.items():
+        sample = np.log10(x[hue == key])
+        ref = gaussian_kde(sample)(grid)*sample.size/x.size
+        err = max(err, np.abs(density-ref).max()/ref.max())
+    errors.append(("kde_curves hue", err, 1.e-3))
+
+    x = rng.multivariate_normal([0., 0.], [[1., 0.8], [0.8, 1.]], 5000)
+    (gx, gy), density = binned_kde(x)
+    X, Y = np.meshgrid(gx, gy, indexing="ij")
+    ref = gaussian_kde(x.T)(np.vstack([X.ravel(), Y.ravel()])).reshape(X.shape)
+    errors.append(("2D correlated", np.abs(density-ref).max()/ref.max(),
+                   5.e-3))
+    return errors
+
+
+# discs of the disc checks: Md (Msun), R1 (au), alpha and Mstar (Msun)
+DISCS = {"Md": np.array([0.03, 0.01, 0.1]), "R1": np.array([30., 10., 100.]),
+         "alpha": np.array([1.e-3, 1.e-2, 1.e-4]),
+         "Mstar": np.array([0.5, 1., 0.3])}
+SCHEMES = ("explicit", "crank-nicolson", "implicit")
+
+
+def check_disc():
+    """
+    Return the errors of the tridiagonal solver, of the viscous evolution
+    against the similarity solution, of the mass budget and between schemes.
+    """
+    rng = np.random.default_rng(0)
+    errors = []
+    lower, upper = rng.uniform(-1., 0., (2, 5, 50))
+    diag = 2.5 + rng.uniform(0., 1., (5, 50))
+    rhs = rng.normal(size=(5, 50))
+    x = solve_tridiagonal(lower, diag, upper, rhs)
+    err = 0.
+    for row in range(5):
+        A = (np.diag(diag[row]) + np.diag(lower[row, 1:], -1)
+             + np.diag(upper[row, :-1], 1))
+        ref = np.linalg.solve(A, rhs[row])
+        err = max(err, np.abs(x[row]-ref).max()/np.abs(ref).max())
+    errors.append(("solve_tridiagonal", err, 1.e-12))
+
+    # similarity solution, up to the viscous time of each disc (the explicit
+    # steps are too short on this grid, it is compared with the others below)
+    grid = radial_grid(r_in=1.e-4, n=400, spacing="log")
+    t_nu = lbp_viscous_time(DISCS["R1"], DISCS["alpha"], DISCS["Mstar"])
+    for scheme, tolerance in (("crank-nicolson", 0.02), ("implicit", 0.03)):
+        err = 0.
+        for i in range(t_nu.size):
+            disc = {key: value[i:i+1] for key, value in DISCS.items()}
+            times = t_nu[i]*np.linspace(0., 1., 11)
+            result = evolve_discs(disc["Md"], disc["R1"], disc["alpha"],
+                                  disc["Mstar"], times=times, grid=grid,
+                                  scheme=scheme)
+            Macc, Md = lbp_accretion(times, disc["Md"], disc["R1"],
+                                     disc["alpha"], disc["Mstar"])
+            err = max(err, np.abs(result["Macc"][0, 1:]/Macc[0, 1:]-1.).max(),
+                      np.abs(result["Md"][0]/Md[0]-1.).max())
+        errors.append((f"LBP {scheme}", err, tolerance))
+
+    # with zero wind the disc only loses the mass accreted through the inner
+    # edge: the operator applied to any profile, summed over the cell areas,
+    # is -k_in w_0 Sigma_0
+    R, edges = grid = radial_grid()
+    area = np.pi*(edges[1:]**2 - edges[:-1]**2)
+    lower, diag, upper, w, k_in = diffusion_operator(
+        R, edges, viscosity(R, DISCS["alpha"], DISCS["Mstar"]))
+    sigma = rng.uniform(0., 1., (t_nu.size, R.size))
+    change = apply_operator(lower, diag, upper, sigma)*area
+    err = (np.abs(change.sum(axis=1)+k_in*w[:, 0]*sigma[:, 0])
+           / np.abs(change).sum(axis=1)).max()
+    errors.append(("operator mass budget", err, 1.e-12))
+
+    # and over the evolution, against the trapezoidal integral of the
+    # recorded accretion rate after the first output (the rate starts with
+    # a transient at the inner edge, faster than the outputs), to the
+    # accuracy of this quadrature
+    times = np.linspace(0., 2.e6, 2001)
+    for scheme in SCHEMES:
+        result = evolve_discs(DISCS["Md"], DISCS["R1"], DISCS["alpha"],
+                              DISCS["Mstar"], times=times, grid=grid,
+                              scheme=scheme)
+        Macc, Md = result["Macc"][:, 1:], result["Md"][:, 1:]
+        accreted = np.cumsum(0.5*(Macc[:, 1:]+Macc[:, :-1])*np.diff(times[1:]),
+                             axis=1)
+        err = np.abs(Md[:, :1]-Md[:, 1:]-accreted).max(axis=1)/DISCS["Md"]
+        errors.append((f"mass budget {scheme}", err.max(), 5.e-3))
+
+    # the three schemes with an EUV wind, to dispersal, comparing the rates
+    # after the first output (see above) while the discs accrete
+    discs = {key: np.tile(value, 2) for key, value in DISCS.items()}
+    discs["Md"] = discs["Md"]*np.repeat([1., 0.1], 3)
+    times = np.linspace(0., 1.e7, 101)
+    results = {scheme: evolve_discs(discs["Md"], discs["R1"], discs["alpha"],
+                                    discs["Mstar"],
+                                    wind=euv_wind(R, discs["Mstar"], 41.),
+                                    times=times, grid=grid, mdot_min=1.e-11,
+                                    scheme=scheme)
+               for scheme in SCHEMES}
+    ref = results["explicit"]
+    for scheme, tolerance in zip(SCHEMES[1:], (0.05, 0.1)):
+        result = results[scheme]
+        alive = (ref["Macc"] > 1.e-10) & (result["Macc"] > 1.e-10)
+        alive[:, :2] = False
+        err = np.abs(result["Macc"][alive]/ref["Macc"][alive]-1.).max()
+        errors.append((f"Macc {scheme}", err, tolerance))
+        both = np.isfinite(ref["t_disp"]) | np.isfinite(result["t_disp"])
+        err = np.abs(result["t_disp"][both]/ref["t_disp"][both]-1.).max()
+        errors.append((f"t_disp {scheme}", err, 0.05))
+
+    # FUV discs drawn as in run_population, end to end: the wind follows the
+    # accretion rate and the stellar properties of every disc, so it is
+    # checked through the three schemes and the mass it removes on top of
+    # the accreted mass
+    discs = draw_discs("FUV", 6, seed_sequence("check", "FUV"))
+    wind, Mdot_wind = model_wind("FUV", grid, discs)
+    results = {scheme: evolve_discs_lbp(discs["md"]*discs["Mstar"],
+                                        discs["r1"], discs["alpha"],
+                                        discs["Mstar"], wind,
+                                        Mdot_wind=Mdot_wind, times=TIMES,
+                                        grid=grid, mdot_min=1.e-11,
+                                        scheme=scheme)
+               for scheme in SCHEMES}
+    ref = results["explicit"]
+    for scheme in SCHEMES[1:]:
+        result = results[scheme]
+        both = np.isfinite(ref["t_disp"]) | np.isfinite(result["t_disp"])
+        err = np.abs(result["t_disp"][both]/ref["t_disp"][both]-1.).max()
+        errors.append((f"FUV t_disp {scheme}", err, 0.1))
+    for scheme, result in results.items():
+        Macc, Md = result["Macc"], result["Md"]
+        accreted = np.cumsum(0.5*(Macc[:, 1:]+Macc[:, :-1])*np.diff(TIMES),
+                             axis=1)
+        # mass accreted beyond the mass the disc lost, relative to its mass
+        short = (Md[:, 1:]+accreted-Md[:, :1])/Md[:, :1]
+        errors.append((f"FUV wind loss {scheme}", max(short.max(), 0.),
+                       5.e-3))
+    return errors
+
+
+def check_emulator():
+    """
+    Return the errors of an emulator interpolating at its grid points and
+    inside its cells, and whether it refuses discs outside its grid.
+    """
+    rng = np.random.default_rng(0)
+    errors = []
+    axes = {"alpha": np.logspace(-3.5, -2.5, 3),
+            "r1": np.geomspace(200., 600., 3),
+            "md": np.linspace(0.02, 0.08, 3),
+            "Mstar": np.array([0.3, 0.6]),
+            "dflux": np.array([-0.25, 0.25])}
+    emu = build_emulator("EUV", axes=axes, workers=1)
+
+    # at the grid points the interpolation returns the stored histories, but
+    # for the resampling at TAU_STEPS fractions of the dispersal time, which
+    # smooths the last drop before it
+    grid = np.meshgrid(*axes.values(), indexing="ij")
+    alpha, r1, md, Mstar, dflux = (axis.ravel() for axis in grid)
+    result = emulate(emu, alpha, r1, md, Mstar, mean_flux("EUV", Mstar)+dflux)
+    stored = 10.**emu["logMacc"].reshape(alpha.size, -1).astype(float)
+    alive = result["Macc"] > 0.
+    error = np.abs(result["Macc"][alive]/stored[alive]-1.)
+    errors.append(("grid points Macc (median)", np.median(error), 1.e-3))
+    errors.append(("grid points Macc (99%)", np.percentile(error, 99.), 0.1))
+    t_disp = emu["t_disp"].ravel()
+    both = np.isfinite(t_disp) | np.isfinite(result["t_disp"])
+    errors.append(("grid points t_disp", np.abs(
+        result["t_disp"][both]/t_disp[both]-1.).max(), 1.e-12))
+
+    # inside the cells, against discs evolved directly
+    n = 40
+    points = np.column_stack([10**rng.uniform(-3.5, -2.5, n),
+                              np.exp(rng.uniform(np.log(200.), np.log(600.),
+                                                 n)),
+                              rng.uniform(0.02, 0.08, n),
+                              rng.uniform(0.3, 0.6, n),
+                              rng.uniform(-0.25, 0.25, n)])
+    logMacc, t_disp = _history_chunk("EUV", points, "crank-nicolson")
+    alpha, r1, md, Mstar, dflux = points.T
+    result = emulate(emu, alpha, r1, md, Mstar, mean_flux("EUV", Mstar)+dflux)
+    alive = (result["Macc"] > 0.) & (logMacc > np.log10(1.e-11))
+    errors.append(("cells Macc (median)", np.median(np.abs(
+        result["Macc"][alive]/10.**logMacc[alive]-1.)), 0.2))
+    both = np.isfinite(t_disp) & np.isfinite(result["t_disp"])
+    errors.append(("cells t_disp (median)", np.median(np.abs(
+        result["t_disp"][both]/t_disp[both]-1.)), 0.1))
+
+    # 5% of the discs outside the grid: 1 if they are not refused
+    alpha[:n//20] = 1.e-5
+    try:
+        emulate(emu, alpha, r1, md, Mstar, mean_flux("EUV", Mstar)+dflux)
+        refused = False
+    except ValueError:
+        refused = True
+    errors.append(("outside the grid refused", float(not refused), 0.))
+    return errors
+
+
+def check_disc_fraction():
+    """
+    Return the errors of lib.disc_fraction_curves and of its bootstrap
+    against counting the discs alive at every age.
+    """
+    rng = np.random.default_rng(0)
+    n = 2000
+    Mstar = rng.uniform(0.1, 1., n)
+    # rounded so that some ages fall on dispersal times, with survivors
+    t_disp = np.round(10**rng.normal(6.5, 0.5, n), -5)
+    t_disp[:n//10] = np.inf
+    ages = np.linspace(0., 2.e7, 41)
+    scale = 100.*(1.-BINARY_FRACTION)
+    n_boot, quantiles = 50, (0.16, 0.84)
+    curves = disc_fraction_curves(t_disp, ages, Mstar=Mstar, n_boot=n_boot,
+                                  quantiles=quantiles,
+                                  rng=np.random.default_rng(1))
+
+    # the resamplings drawn as disc_fraction_curves does, from the sorted
+    # dispersal times of every bin in the order of MASS_BINS
+    boot_rng = np.random.default_rng(1)
+    errors = []
+    outside = 0
+    for key, (_, _, Mmin, Mmax) in MASS_BINS.items():
+        t = np.sort(t_disp[(Mstar > Mmin) & (Mstar <= Mmax)])
+        frac = scale*np.mean(t[:, None] > ages, axis=0)
+        errors.append((f"{key} fraction", np.abs(
+            curves[key]["frac"]-frac).max(), 1.e-12))
+        boot = [scale*np.mean(t[boot_rng.integers(0, t.size, t.size), None]
+                              > ages, axis=0) for _ in range(n_boot)]
+        low, high = np.quantile(boot, quantiles, axis=0)
+        errors.append((f"{key} bootstrap", max(
+            np.abs(curves[key]["low"]-low).max(),
+            np.abs(curves[key]["high"]-high).max()), 1.e-12))
+        outside += np.sum((frac < curves[key]["low"]-1.e-12)
+                          | (frac > curves[key]["high"]+1.e-12))
+    errors.append(("ages outside the bands", outside, 0))
+    return errors
+
+
+def check_imf():
+    """
+    Return the errors of lib.sample_IMF with mass limits on either side of
+    the break of the IMF: masses outside the limits and the KS statistic
+    against the cumulative distribution of lib.IMF integrated numerically.
+    """
+    from scipy.stats import kstest
+
+    n = 20000
+    errors = []
+    for mass_ini, mass_end in ((0.1, 0.4), (0.6, 1.1), (0.3, 0.8)):
+        masses = sample_IMF(n, mass_ini=mass_ini, mass_end=mass_end,
+                            rng=np.random.default_rng(0))
+        label = f"{mass_ini:g}-{mass_end:g} Msun"
+        errors.append((f"{label} below", max(mass_ini-masses.min(), 0.), 0.))
+        errors.append((f"{label} above", max(masses.max()-mass_end, 0.), 0.))
+
+        grid = np.geomspace(mass_ini, mass_end, 100001)
+        weights = IMF(grid)[:, 1]
+        cdf = np.concatenate(([0.], np.cumsum(
+            0.5*(weights[1:]+weights[:-1])*np.diff(grid))))
+        cdf /= cdf[-1]
+        # critical value of the KS statistic at 1%
+        errors.append((f"{label} KS", kstest(
+            masses, lambda m: np.interp(m, grid, cdf)).statistic,
+            1.63/np.sqrt(n)))
+    return errors
+
+
+CHECKS = {"kde": check_kde, "disc": check_disc, "emulator": check_emulator,
+          "disc_fraction": check_disc_fraction, "imf": check_imf}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("checks", nargs="*", default=list(CHECKS),
+                        metavar="CHECK", help="checks to run (default: all "
+                                              "of "+", ".join(CHECKS)+")")
+    args = parser.parse_args()
+    for name in args.checks:
+        if name not in CHECKS:
+            parser.error(f"unknown check {name}")
+
+    failed = 0
+    for name in args.checks:
+        for label, error, tolerance in CHECKS[name]():
+            ok = error <= tolerance
+            failed += not ok
+            print(f"{name:>13} {label:<28} {error:.2e} (<= {tolerance:.0e})",
+                  "ok" if ok else "FAIL")
+    if failed:
+        print(f"{failed} check(s) failed")
+    sys.exit(bool(failed))
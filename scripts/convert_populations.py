@@ -0,0 +1,17 @@
+"""
+Script to convert the population synthesis outputs to binary columns.
+
+Every pop_*/ folder (and its stellar-mass subfolders) found in data/ gets one
+.npy file per text column plus a manifest, which lib.read_column and
+lib.load_data then memory-map instead of parsing the text files.
+"""
+import glob
+from lib import convert_population
+
+data_path = "../data/"
+
+for path in sorted(glob.glob(data_path+"pop_*/")) + sorted(glob.glob(data_path+"pop_*/*/")):
+    if not glob.glob(path+"*.dat"):
+        continue
+    manifest = convert_population(path)
+    print(path, manifest["rows"], "rows:", ", ".join(manifest["columns"]))
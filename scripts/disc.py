@@ -0,0 +1,386 @@
+"""
+Viscous evolution of populations of protoplanetary discs.
+
+The surface density of N discs is stored as a (disc x radius) array and all
+discs are advanced together with NumPy, solving
+
+    dSigma/dt = 3/R d/dR[R^1/2 d/dR(nu Sigma R^1/2)] - Sigma_w
+
+on a radial grid, with nu = alpha cs^2/Omega for a passively heated disc with
+T = T_1AU (R/au)^-1/2 (so that nu is proportional to R). Units are au, yr and
+Msun throughout.
+"""
+import numpy as np
+
+from lib import MASS_BINS, disc_fraction, dispersal_times, write_population
+
+# physical constants (cgs), and G Msun in au^3/yr^2
+K_B = 1.380649e-16
+M_H = 1.6735575e-24
+AU = 1.495978707e13
+YR = 3.15576e7
+GM_SUN = 4.*np.pi**2
+
+# midplane temperature at 1 au and mean molecular weight of the disc gas
+T_1AU = 100.
+MU_DISC = 2.35
+
+
+def radial_grid(r_in=0.1, r_out=2000., n=200, spacing="sqrt"):
+    """
+    Return the cell centres and the n+1 cell edges of a radial grid in au.
+
+    spacing="sqrt" spaces the cells uniformly in R^1/2, for which the viscous
+    diffusion time of a cell does not depend on R when nu is proportional to
+    R (so an explicit step is not set by the innermost cell); "log" spaces
+    them logarithmically, resolving the inner disc better.
+    """
+    if spacing == "sqrt":
+        edges = np.linspace(np.sqrt(r_in), np.sqrt(r_out), n+1)**2
+    elif spacing == "log":
+        edges = np.geomspace(r_in, r_out, n+1)
+    else:
+        raise ValueError(f"Unknown grid spacing {spacing}.")
+    return np.sqrt(edges[1:]*edges[:-1]), edges
+
+
+def sound_speed2(R):
+    """
+    Return the squared isothermal sound speed of the disc gas in au^2/yr^2.
+    """
+    return K_B*T_1AU*R**-0.5/(MU_DISC*M_H)*(YR/AU)**2
+
+
+def viscosity(R, alpha, Mstar):
+    """
+    Return nu = alpha cs^2/Omega in au^2/yr, one row per disc.
+    """
+    omega = np.sqrt(GM_SUN*np.asarray(Mstar, dtype=float)[:, None]/R**3)
+    return np.asarray(alpha, dtype=float)[:, None]*sound_speed2(R)/omega
+
+
+def lbp_profile(R, edges, Md, R1, T=1.):
+    """
+    Return the Lynden-Bell & Pringle (1974) surface density of discs of
+    initial mass Md (Msun) and scaling radius R1 (au) at the scaled time
+    T = 1 + t/t_nu, Md/(2 pi R1 R) T^-3/2 exp(-R/(R1 T)).
+
+    The profile is normalised so that the mass on the grid is exactly the
+    disc mass Md T^-1/2.
+    """
+    Md = np.asarray(Md, dtype=float)[:, None]
+    R1 = np.asarray(R1, dtype=float)[:, None]
+    T = np.broadcast_to(np.asarray(T, dtype=float), Md.shape[:1])[:, None]
+    sigma = np.exp(-R/(R1*T))/(2.*np.pi*R1*R)
+    area = np.pi*(edges[1:]**2 - edges[:-1]**2)
+    return sigma*Md/np.sqrt(T)/(sigma*area).sum(axis=1, keepdims=True)
+
+
+def lbp_viscous_time(R1, alpha, Mstar):
+    """
+    Return the viscous time t_nu = R1^2/(3 nu(R1)) of discs in yr.
+    """
+    R1 = np.asarray(R1, dtype=float)
+    omega = np.sqrt(GM_SUN*np.asarray(Mstar, dtype=float)/R1**3)
+    return R1**2*omega/(3.*np.asarray(alpha, dtype=float)*sound_speed2(R1))
+
+
+def lbp_accretion(times, Md, R1, alpha, Mstar):
+    """
+    Return the accretion rate (Msun/yr) and mass (Msun) of discs following
+    the similarity solution of Lynden-Bell & Pringle (1974) for nu ~ R.
+
+    Mdot_acc = Md/(2 t_nu) T^-3/2 and M_d = Md T^-1/2 with T = 1 + t/t_nu,
+    evaluated at times (yr) for every disc, as (disc x time) arrays.
+    """
+    t_nu = lbp_viscous_time(R1, alpha, Mstar)[:, None]
+    T = 1.+np.asarray(times, dtype=float)/t_nu
+    Md = np.asarray(Md, dtype=float)[:, None]
+    return Md/(2.*t_nu)*T**-1.5, Md/np.sqrt(T)
+
+
+def lbp_switch_time(Md, R1, alpha, Mstar, Mdot_wind, margin=10.):
+    """
+    Return the time (yr) at which the similarity accretion rate falls below
+    margin times the integrated wind rate Mdot_wind (Msun/yr) of each disc.
+
+    Before then the wind cannot open a gap and the disc is well described by
+    the similarity solution, so it only needs to be evolved numerically from
+    this time on; it is 0 for discs accreting less than that from the start.
+    """
+    t_nu = lbp_viscous_time(R1, alpha, Mstar)
+    Mdot = margin*np.asarray(Mdot_wind, dtype=float)
+    T = (np.asarray(Md, dtype=float)/(2.*t_nu*Mdot))**(2./3.)
+    return t_nu*np.maximum(T-1., 0.)
+
+
+def diffusion_operator(R, edges, nu):
+    """
+    Return the tridiagonal operator of the viscous term on the grid.
+
+    With G = nu Sigma R^1/2, the mass flux through the cell edges is
+    6 pi R^1/2 dG/dR; G vanishes at the inner edge (zero torque) and no mass
+    leaves through the outer edge. Returns (lower, diag, upper, w, k_in) such
+    that dSigma_i/dt = lower_i Sigma_i-1 + diag_i Sigma_i + upper_i Sigma_i+1
+    for every disc, with G = w Sigma and the accretion rate onto the star
+    k_in G_0.
+    """
+    area = np.pi*(edges[1:]**2 - edges[:-1]**2)
+    # coupling through every cell edge, the inner one to the G = 0 boundary
+    dR = np.diff(np.concatenate(([edges[0]], R)))
+    k = np.zeros(R.size+1)
+    k[:-1] = 6.*np.pi*np.sqrt(edges[:-1])/dR
+
+    w = nu*np.sqrt(R)
+    lower = np.zeros_like(w)
+    upper = np.zeros_like(w)
+    lower[:, 1:] = k[1:-1]*w[:, :-1]/area[1:]
+    upper[:, :-1] = k[1:-1]*w[:, 1:]/area[:-1]
+    diag = -(k[:-1]+k[1:])*w/area
+    return lower, diag, upper, w, k[0]
+
+
+def apply_operator(lower, diag, upper, sigma):
+    """
+    Return the tridiagonal operator applied to sigma, row by row.
+    """
+    out = diag*sigma
+    out[:, 1:] += lower[:, 1:]*sigma[:, :-1]
+    out[:, :-1] += upper[:, :-1]*sigma[:, 1:]
+    return out
+
+
+def solve_tridiagonal(lower, diag, upper, rhs):
+    """
+    Solve the tridiagonal systems lower_i x_i-1 + diag_i x_i + upper_i x_i+1 =
+    rhs_i row by row with the Thomas algorithm, vectorised over the rows.
+
+    There is no pivoting, which is stable for the diagonally dominant systems
+    of the implicit steps of the viscous operator.
+    """
+    a, b, c, d = (np.ascontiguousarray(x.T) for x in (lower, diag, upper, rhs))
+    cp = np.empty_like(b)
+    dp = np.empty_like(b)
+    cp[0] = c[0]/b[0]
+    dp[0] = d[0]/b[0]
+    for i in range(1, b.shape[0]):
+        m = 1./(b[i] - a[i]*cp[i-1])
+        cp[i] = c[i]*m
+        dp[i] = (d[i] - a[i]*dp[i-1])*m
+    for i in range(b.shape[0]-2, -1, -1):
+        dp[i] -= cp[i]*dp[i+1]
+    return dp.T
+
+
+def evolve_discs(Md, R1, alpha, Mstar, wind=None, times=None, grid=None,
+                 t_start=None, mdot_min=1.e-13, cfl=0.5, compact=0.05,
+                 scheme="explicit", tol=0.05):
+    """
+    Evolve N discs together and record their accretion rate and mass.
+
+    Md (Msun), R1 (au), alpha and Mstar (Msun) give one value per disc; the
+    discs start from the Lynden-Bell & Pringle profile. wind is the surface
+    mass-loss rate in Msun/au^2/yr, either a (disc x radius) array constant
+    in time or a function wind(t, sigma, rows) of the time of the discs, their
+    surface density and their indices. The accretion rate and the disc mass
+    are recorded at times (yr, default every 0.1 Myr up to 20 Myr); a disc is
+    dispersed once its accretion rate falls below mdot_min and is then no
+    longer evolved, with zero rate and mass at the later times. With t_start
+    (yr, per disc) the discs start from the similarity solution at that time
+    and the outputs before it are taken from lbp_accretion; see
+    lbp_switch_time and evolve_discs_lbp.
+
+    Every disc is advanced with its own time step. With scheme="explicit" it
+    is cfl times the diffusion time of the stiffest cell of the disc. With
+    "crank-nicolson" (or "implicit", backward Euler) the viscous term is
+    implicit and the wind explicit, the tridiagonal systems of all the discs
+    are solved together by solve_tridiagonal, and the steps are controlled
+    so that the accretion rate and the disc mass change by about tol per step
+    (steps changing them by more than twice tol are redone), landing on the
+    output times. Finished discs are removed from the work arrays once they
+    are more than a fraction compact of them.
+
+    Returns a dict with times, Macc and Md (disc x time) and t_disp (np.inf
+    for discs that are not dispersed by the last time).
+    """
+    Md, R1, alpha, Mstar = np.broadcast_arrays(
+        *(np.asarray(x, dtype=float) for x in (Md, R1, alpha, Mstar)))
+    n_disc = Md.size
+    if times is None:
+        times = np.linspace(0., 2.e7, 201)
+    times = np.asarray(times, dtype=float)
+    R, edges = radial_grid() if grid is None else grid
+    area = np.pi*(edges[1:]**2 - edges[:-1]**2)
+
+    t = np.zeros(n_disc)
+    if t_start is not None:
+        t = np.broadcast_to(np.asarray(t_start, dtype=float), t.shape).copy()
+    sigma = lbp_profile(R, edges, Md, R1,
+                        1.+t/lbp_viscous_time(R1, alpha, Mstar))
+    lower, diag, upper, w, k_in = diffusion_operator(R, edges,
+                                                     viscosity(R, alpha, Mstar))
+    dt = cfl/np.max(-diag, axis=1)
+    if scheme not in ("explicit", "crank-nicolson", "implicit"):
+        raise ValueError(f"Unknown time stepping scheme {scheme}.")
+    theta = 0.5 if scheme == "crank-nicolson" else 1.
+    sink = None
+    if wind is not None and not callable(wind):
+        sink = np.asarray(wind, dtype=float)
+
+    out_Macc = np.zeros((n_disc, times.size))
+    out_Md = np.zeros((n_disc, times.size))
+    t_disp = np.full(n_disc, np.inf)
+
+    k = np.searchsorted(times, t, side="left")
+    before = times < t[:, None]
+    if before.any():
+        Macc_lbp, Md_lbp = lbp_accretion(times, Md, R1, alpha, Mstar)
+        out_Macc[before] = Macc_lbp[before]
+        out_Md[before] = Md_lbp[before]
+
+    rows = np.arange(n_disc)
+    finished = np.zeros(n_disc, dtype=bool)
+    while rows.size:
+        Macc = k_in*w[:, 0]*sigma[:, 0]
+
+        # record the outputs reached by the discs
+        due = ~finished & (times[np.minimum(k, times.size-1)] <= t)
+        due &= k < times.size
+        while due.any():
+            out_Macc[rows[due], k[due]] = Macc[due]
+            out_Md[rows[due], k[due]] = (sigma[due]*area).sum(axis=1)
+            k[due] += 1
+            due &= (k < times.size)
+            due[due] = times[k[due]] <= t[due]
+
+        dispersed = ~finished & (Macc < mdot_min)
+        t_disp[rows[dispersed]] = t[dispersed]
+        finished |= dispersed | (k >= times.size)
+
+        if finished.sum() > compact*rows.size or finished.all():
+            keep = ~finished
+            rows, t, k, finished = rows[keep], t[keep], k[keep], finished[keep]
+            sigma, lower, diag, upper = (sigma[keep], lower[keep], diag[keep],
+                                         upper[keep])
+            w, dt = w[keep], dt[keep]
+            if sink is not None:
+                sink = sink[keep]
+            if not rows.size:
+                break
+
+        if scheme == "explicit":
+            step = np.where(finished, 0., dt)
+            change = apply_operator(lower, diag, upper, sigma)
+            if sink is not None:
+                change -= sink
+            elif wind is not None:
+                change -= wind(t, sigma, rows)
+            sigma += step[:, None]*change
+            np.maximum(sigma, 0., out=sigma)
+            t += step
+            continue
+
+        # implicit viscous term, with the step landing on the next output
+        target = times[np.minimum(k, times.size-1)]
+        landed = ~finished & (t+dt >= target)
+        step = np.where(finished, 0., np.where(landed, target-t, dt))
+        rhs = sigma.copy()
+        if theta < 1.:
+            rhs += (1.-theta)*step[:, None]*apply_operator(lower, diag, upper,
+                                                           sigma)
+        if sink is not None:
+            rhs -= step[:, None]*sink
+        elif wind is not None:
+            rhs -= step[:, None]*wind(t, sigma, rows)
+        h = -theta*step[:, None]
+        new = solve_tridiagonal(h*lower, 1.+h*diag, h*upper, rhs)
+        np.maximum(new, 0., out=new)
+
+        # relative change of the accretion rate and of the disc mass
+        mass = (sigma*area).sum(axis=1)
+        err = np.maximum(
+            np.abs(new[:, 0]-sigma[:, 0])/np.maximum(sigma[:, 0], 1.e-300),
+            np.abs((new*area).sum(axis=1)-mass)/np.maximum(mass, 1.e-300))
+        accept = finished | (err <= 2.*tol)
+        sigma[accept] = new[accept]
+        t = np.where(accept, np.where(landed, target, t+step), t)
+        dt = np.where(accept & landed & (step < dt), dt,
+                      step*np.clip(np.sqrt(tol/np.maximum(err, 1.e-300)),
+                                   0.2, 2.))
+
+    return {"times": times, "Macc": out_Macc, "Md": out_Md, "t_disp": t_disp}
+
+
+def evolve_discs_lbp(Md, R1, alpha, Mstar, wind, Mdot_wind=None, margin=10.,
+                     **kwargs):
+    """
+    Evolve discs as evolve_discs, skipping the phase described by the
+    similarity solution.
+
+    Every disc is evolved numerically only from lbp_switch_time on, when its
+    accretion rate approaches margin times its integrated wind rate Mdot_wind
+    (Msun/yr); the mass lost to the wind before then is neglected. Mdot_wind
+    is computed from wind when it is an array, and must be given when it is a
+    function.
+    """
+    if Mdot_wind is None:
+        if callable(wind):
+            raise ValueError("Mdot_wind is needed with a wind function.")
+        R, edges = kwargs.get("grid") or radial_grid()
+        area = np.pi*(edges[1:]**2 - edges[:-1]**2)
+        Mdot_wind = (np.asarray(wind)*area).sum(axis=1)
+    t_start = lbp_switch_time(Md, R1, alpha, Mstar, Mdot_wind, margin=margin)
+    return evolve_discs(Md, R1, alpha, Mstar, wind=wind, t_start=t_start,
+                        **kwargs)
+
+
+def population_columns(result, discs=None, params=None, threshold=None):
+    """
+    Return the population columns (Macc, age, frac) of evolved discs.
+
+    Every disc gives one row per output time; frac is the percentage of the
+    selected discs that are not dispersed at that age, a disc being dispersed
+    at t_disp or, with threshold, once its accretion rate falls below it (see
+    lib.dispersal_times), and t_disp is that dispersal time. params are extra
+    per-disc columns (e.g. Mstar, r1, md, alpha) repeated on every row of the
+    disc.
+    """
+    if discs is None:
+        discs = np.ones(result["t_disp"].size, dtype=bool)
+    times = result["times"]
+    n_disc = np.count_nonzero(discs)
+    t_disp = result["t_disp"][discs]
+    if threshold is not None:
+        t_disp = dispersal_times(result["Macc"][discs], times, threshold)
+    columns = {
+        "Macc": result["Macc"][discs].ravel(),
+        "age": np.tile(times, n_disc),
+        "frac": np.tile(disc_fraction(t_disp, times), n_disc),
+        "t_disp": np.repeat(t_disp, times.size),
+    }
+    for name, values in (params or {}).items():
+        columns[name] = np.repeat(np.asarray(values)[discs], times.size)
+    return columns
+
+
+def write_disc_population(path, result, Mstar, params=None, text=False, **meta):
+    """
+    Write evolved discs in the pop_* layout read by lib.load_data.
+
+    path gets the full sample, with the stellar mass and the extra per-disc
+    params (e.g. flux, r1, md and alpha) and sorted by stellar mass so that
+    any mass range is a slice of it (lib.sorted_rows), and the stellar-mass
+    subfolders of MASS_BINS, each with its own disc fraction. Returns the
+    number of rows of every folder.
+    """
+    Mstar = np.asarray(Mstar)
+    params = dict(params or {}, Mstar=Mstar)
+    rows = {}
+    for key, (subfolder, _, Mmin, Mmax) in MASS_BINS.items():
+        discs = (Mstar > Mmin) & (Mstar <= Mmax)
+        columns = population_columns(result, discs,
+                                     params if not subfolder else None)
+        rows[key] = write_population(path+subfolder, columns, text=text,
+                                     sort_by=None if subfolder else "Mstar",
+                                     **meta)["rows"]
+    return rows
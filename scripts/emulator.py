@@ -0,0 +1,313 @@
+"""
+Script to build and sample an emulator of the disc accretion histories.
+
+The accretion rate at the output times and the dispersal time of discs are
+computed once on a grid of (alpha, R1, Md, Mstar, flux) for a wind model, the
+flux being the offset of log Phi (log Lx for XEUV) from the mean of the
+stellar mass, and stored as a compressed table (log10 Macc as float32) in
+data/emulator_<model>.npz. New populations of any size are then drawn from the
+population spec of run_population.py and their histories interpolated
+multilinearly on the grid (in log alpha and log R1), without evolving any
+disc, and written in the pop_<model> layout read by lib.load_data.
+
+    python emulator.py build EUV [--workers 8] [--data-path ../data/]
+    python emulator.py draw EUV [--size 10000] [--seed 0] [--text] [--force]
+"""
+import argparse
+import itertools
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from calibrate import mean_flux
+from disc import evolve_discs_lbp, radial_grid, write_disc_population
+from lib import (MODELS, chunk_streams, load_XLF, read_manifest,
+                 stellar_properties)
+from run_population import TIMES, draw_discs, model_wind
+
+# axes of the emulator grid, all but dflux interpolated in log; accretion
+# rates are stored down to MDOT_FLOOR (Msun/yr) so that the interpolation
+# stays smooth where a corner of a cell has dispersed
+AXES = ("alpha", "r1", "md", "Mstar", "dflux")
+LOG_AXES = ("alpha", "r1", "md", "Mstar")
+MDOT_FLOOR = 1.e-13
+# fractions of the dispersal time (or of the last output time if later) at
+# which the histories are interpolated
+TAU_STEPS = 201
+
+
+def default_axes(model):
+    """
+    Return the grid of the emulator of a model, {axis: values}, covering the
+    parameter space of Table 2 (for FUV, alpha = 3e-7 to 2e-4 from the
+    relation of R1 and Md) and 3 sigma of the log Phi distribution, or
+    99.9% of the XLF offsets for XEUV.
+    """
+    axes = {
+        "alpha": np.logspace(-4., -2., 9),
+        "r1": np.geomspace(10., 1000., 9),
+        "md": np.linspace(0.01, 0.1, 5),
+        "Mstar": np.linspace(0.1, 1.1, 6),
+        "dflux": np.linspace(-0.75, 0.75, 5),
+    }
+    if model == "XEUV":
+        axes["r1"] = np.geomspace(10., 100., 7)
+        axes["md"] = np.array([0.1])
+        axes["dflux"] = np.linspace(-2., 2., 9)
+    elif model == "FUV":
+        axes["alpha"] = np.logspace(-7., -3., 9)
+        axes["r1"] = np.geomspace(10., 100., 7)
+    return axes
+
+
+def _history_chunk(model, points, scheme):
+    # log10 accretion histories and dispersal times of a chunk of grid points
+    alpha, r1, md, Mstar, dflux = points.T
+    flux = mean_flux(model, Mstar) + dflux
+    grid = radial_grid()
+    Rstar, Lstar = stellar_properties(Mstar)
+    wind, Mdot_wind = model_wind(model, grid, {"Mstar": Mstar, "flux": flux,
+                                               "Rstar": Rstar, "Lstar": Lstar,
+                                               "alpha": alpha, "r1": r1,
+                                               "md": md})
+    result = evolve_discs_lbp(md*Mstar, r1, alpha, Mstar, wind,
+                              Mdot_wind=Mdot_wind, times=TIMES, grid=grid,
+                              mdot_min=MDOT_FLOOR, scheme=scheme)
+    logMacc = np.log10(np.maximum(result["Macc"], MDOT_FLOOR))
+    return logMacc.astype(np.float32), result["t_disp"]
+
+
+def build_emulator(model, axes=None, scheme="crank-nicolson", chunk_size=200,
+                   workers=None):
+    """
+    Evolve the discs of the emulator grid of a model in a process pool.
+
+    Returns the emulator, a dict with the model, the times, the grid axes,
+    logMacc (grid shape x time) and t_disp (grid shape, np.inf for discs
+    surviving the last time).
+    """
+    axes = default_axes(model) if axes is None else axes
+    grid = np.meshgrid(*(axes[name] for name in AXES), indexing="ij")
+    points = np.column_stack([axis.ravel() for axis in grid])
+    chunks = [points[i:i+chunk_size] for i in range(0, len(points), chunk_size)]
+    with ProcessPoolExecutor(workers) as pool:
+        results = list(pool.map(_history_chunk, [model]*len(chunks), chunks,
+                                [scheme]*len(chunks)))
+    shape = grid[0].shape
+    emu = {"model": model, "times": TIMES,
+           "logMacc": np.concatenate([r[0] for r in results]).reshape(
+               shape+(TIMES.size,)),
+           "t_disp": np.concatenate([r[1] for r in results]).reshape(shape)}
+    emu.update({name: np.asarray(axes[name], dtype=float) for name in AXES})
+    return emu
+
+
+def save_emulator(fname, emu):
+    """
+    Write an emulator to fname (.npz, compressed).
+    """
+    np.savez_compressed(fname, **emu)
+
+
+def load_emulator(fname):
+    """
+    Return the emulator stored in fname.
+    """
+    with np.load(fname) as f:
+        emu = {key: f[key] for key in f.files}
+    emu["model"] = str(emu["model"])
+    return emu
+
+
+def outside_grid(emu, alpha, r1, md, Mstar, flux):
+    """
+    Return the fraction of discs outside the grid of the emulator along each
+    axis, {axis: fraction}, and along any axis ("any").
+    """
+    params = list(np.broadcast_arrays(*(np.asarray(x, dtype=float) for x in
+                                        (alpha, r1, md, Mstar, flux))))
+    params[4] = params[4] - mean_flux(emu["model"], params[3])
+    outside = {}
+    for name, x in zip(AXES, params):
+        axis = emu[name]
+        # margin for the values drawn at the ends of the axes
+        tol = 1.e-9*np.abs(axis).max()
+        outside[name] = (x < axis[0]-tol) | (x > axis[-1]+tol)
+    outside["any"] = np.logical_or.reduce(list(outside.values()))
+    return {name: float(np.mean(out)) if out.size else 0.
+            for name, out in outside.items()}
+
+
+def _cell_weights(emu, name, values):
+    # lower index and weight of the upper neighbour of values on an axis,
+    # clipped to the grid
+    axis = emu[name]
+    x = np.asarray(values, dtype=float)
+    if name in LOG_AXES:
+        axis, x = np.log10(axis), np.log10(x)
+    if axis.size == 1:
+        return np.zeros(x.shape, dtype=int), np.zeros(x.shape)
+    x = np.clip(x, axis[0], axis[-1])
+    i = np.clip(np.searchsorted(axis, x, side="right")-1, 0, axis.size-2)
+    return i, (x-axis[i])/(axis[i+1]-axis[i])
+
+
+def _corners(emu, cells):
+    # weight and flat grid index of the 32 corners of the cell of every disc
+    for corner in itertools.product((0, 1), repeat=len(AXES)):
+        w = np.ones(cells[0][0].shape)
+        idx = []
+        for (i, f), (name, c) in zip(cells, zip(AXES, corner)):
+            w *= f if c else 1.-f
+            idx.append(np.minimum(i+c, emu[name].size-1))
+        yield w, np.ravel_multi_index(idx, emu["t_disp"].shape)
+
+
+def _scaled_histories(emu, t_ref):
+    # log Macc of every grid point at TAU_STEPS fractions of the time t_ref
+    # (yr) of the grid point, from 0 to 1, interpolated between the outputs
+    times = emu["times"]
+    last = times.size-1
+    pos = np.minimum(np.linspace(0., 1., TAU_STEPS)*t_ref.reshape(-1, 1)
+                     / (times[1]-times[0]), last)
+    i = np.minimum(pos.astype(int), last-1)
+    f = pos - i
+    history = emu["logMacc"].reshape(-1, times.size)
+    low = np.take_along_axis(history, i, axis=1)
+    return low + f*(np.take_along_axis(history, i+1, axis=1)-low)
+
+
+def emulate(emu, alpha, r1, md, Mstar, flux, block=10000, max_outside=0.01):
+    """
+    Return the interpolated accretion histories of discs, as evolve_discs.
+
+    alpha, r1 (au), md (units of Mstar), Mstar (Msun) and flux (log Phi or log
+    Lx) give one value per disc. log t_disp is interpolated multilinearly
+    between the 32 corners of the grid cell of every disc, and so is log Macc
+    as a function of the fraction of the dispersal time of every corner (or
+    of the last output time if later, at TAU_STEPS fractions), so that the
+    final drop of the accretion rate is shifted in time rather than averaged
+    with rates already at the floor; the output times must be evenly spaced,
+    as TIMES. The discs are emulated in blocks of block discs, and the
+    accretion rate is zero from the interpolated dispersal time on. Discs
+    outside the grid are clipped to it
+    as long as they are at most a fraction max_outside of them, otherwise
+    ValueError is raised (see outside_grid). Returns a dict with times, Macc
+    (disc x time), t_disp and outside, the fraction of discs clipped.
+    """
+    outside = outside_grid(emu, alpha, r1, md, Mstar, flux)
+    if outside["any"] > max_outside:
+        raise ValueError(
+            f"{outside['any']:.1%} of the discs are outside the grid of the "
+            f"emulator (more than {max_outside:.1%}): "
+            + ", ".join(f"{name} {frac:.1%}" for name, frac in outside.items()
+                        if name != "any" and frac > 0.))
+    params = list(np.broadcast_arrays(*(np.asarray(x, dtype=float) for x in
+                                        (alpha, r1, md, Mstar, flux))))
+    params[4] = params[4] - mean_flux(emu["model"], params[3])
+    times = emu["times"]
+    n_disc = params[0].size
+    # dispersal times beyond the last output are interpolated as 10 times
+    # it, and the histories are scaled to the dispersal time up to the last
+    # output
+    t_disp = emu["t_disp"].ravel()
+    log_tdisp = np.log10(np.minimum(t_disp, 10.*times[-1]))
+    t_ref = np.minimum(t_disp, times[-1])
+    log_tref = np.log10(t_ref)
+    scaled = _scaled_histories(emu, t_ref)
+
+    Macc = np.empty((n_disc, times.size))
+    t_disp = np.empty(n_disc)
+    for start in range(0, n_disc, block):
+        stop = min(start+block, n_disc)
+        cells = [_cell_weights(emu, name, x[start:stop])
+                 for name, x in zip(AXES, params)]
+        logt = np.zeros(stop-start)
+        logref = np.zeros(stop-start)
+        logMacc = np.zeros((stop-start, TAU_STEPS))
+        for w, idx in _corners(emu, cells):
+            logt += w*log_tdisp[idx]
+            logref += w*log_tref[idx]
+            logMacc += w[:, None]*scaled[idx]
+        # back to the output times
+        pos = np.minimum(times/10**logref[:, None], 1.)*(TAU_STEPS-1)
+        i = np.minimum(pos.astype(int), TAU_STEPS-2)
+        f = pos - i
+        low = np.take_along_axis(logMacc, i, axis=1)
+        logMacc = low + f*(np.take_along_axis(logMacc, i+1, axis=1)-low)
+        t_disp[start:stop] = np.where(logt < np.log10(times[-1]), 10**logt,
+                                      np.inf)
+        Macc[start:stop] = np.where(times < t_disp[start:stop, None],
+                                    10**logMacc, 0.)
+    return {"times": times, "Macc": Macc, "t_disp": t_disp,
+            "outside": outside["any"]}
+
+
+def draw_population(path, emu, size, seed=0, chunk_size=10000, text=False,
+                    data_path="../data/"):
+    """
+    Draw size discs from the population spec of the emulator model (see
+    run_population.draw_discs), emulate their histories and write them to
+    the pop_* folder path, recording the fraction of discs outside the grid
+    in the manifest. Returns the number of rows of every folder.
+    """
+    model = emu["model"]
+    XLF = load_XLF(data_path) if model == "XEUV" else None
+    discs = [draw_discs(model, stop-start, seed_seq, XLF) for start, stop,
+             seed_seq in chunk_streams(size, chunk_size, MODELS.index(model),
+                                       seed=seed)]
+    discs = {key: np.concatenate([d[key] for d in discs]) for key in discs[0]}
+    result = emulate(emu, discs["alpha"], discs["r1"], discs["md"],
+                     discs["Mstar"], discs["flux"])
+    params = {key: discs[key]
+              for key in ("flux", "Rstar", "Lstar", "r1", "md", "alpha")}
+    return write_disc_population(path, result, discs["Mstar"], params=params,
+                                 text=text, emulator={
+                                     "model": model, "size": size,
+                                     "seed": seed,
+                                     "outside": result["outside"]})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("command", choices=["build", "draw"])
+    parser.add_argument("model", choices=MODELS)
+    parser.add_argument("--data-path", default="../data/")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes of build (default: one per core)")
+    parser.add_argument("--scheme", default="crank-nicolson",
+                        choices=["explicit", "crank-nicolson", "implicit"])
+    parser.add_argument("--size", type=float, default=1e4,
+                        help="number of discs drawn")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--text", action="store_true",
+                        help="also write the .dat text columns")
+    parser.add_argument("--force", action="store_true",
+                        help="overwrite a population that was not emulated")
+    args = parser.parse_args()
+
+    fname = args.data_path+"emulator_"+args.model+".npz"
+    start = time.perf_counter()
+    if args.command == "build":
+        emu = build_emulator(args.model, scheme=args.scheme,
+                             workers=args.workers)
+        save_emulator(fname, emu)
+        print(fname, f"{emu['t_disp'].size} discs "
+              f"({time.perf_counter()-start:.1f} s)")
+        sys.exit(0)
+
+    path = args.data_path+"pop_"+args.model+"/"
+    manifest = read_manifest(path)
+    ours = manifest is not None and "emulator" in manifest
+    if os.path.isdir(path) and os.listdir(path) and not ours and not args.force:
+        print(path, "holds a population that was not emulated, "
+              "use --force to overwrite it", file=sys.stderr)
+        sys.exit(1)
+    counts = draw_population(path, load_emulator(fname), int(args.size),
+                             seed=args.seed, text=args.text,
+                             data_path=args.data_path)
+    print(path, ", ".join(f"{key} {rows}" for key, rows in counts.items()),
+          f"({time.perf_counter()-start:.1f} s)")
@@ -9,7 +9,7 @@ import scienceplots
 from scipy import interpolate as interpolate
 import seaborn as sns
 import pandas as pd
-from scipy import stats
+from lib import phase, kde_curves, setup_plots, savefig
 
 plt.style.use('science')
 sns.set_palette("pastel")
@@ -22,52 +22,54 @@ plt.rc('axes', labelsize=18.)
 plt.rc('lines', linewidth=3.)
 
 plt.rcParams["errorbar.capsize"]
+setup_plots()
 
 fig = plt.figure(figsize=[8.5, 8.5])
 
 data_path = "../data/"
 fig_path = "../figures/"
 
-ONC025_Lx, ONC025_cdf = np.loadtxt(data_path+'LxfuncONC025.dat',
-                                   unpack=True, comments='#')
-inv_cdf_ONC025 = interpolate.interp1d(ONC025_cdf, ONC025_Lx)
+with phase("load"):
+    ONC025_Lx, ONC025_cdf = np.loadtxt(data_path+'LxfuncONC025.dat',
+                                       unpack=True, comments='#')
+    inv_cdf_ONC025 = interpolate.interp1d(ONC025_cdf, ONC025_Lx)
 
-ONC05_Lx, ONC05_cdf = np.loadtxt(data_path+'LxfuncONC05.dat',
-                                 unpack=True, comments='#')
-inv_cdf_ONC05 = interpolate.interp1d(ONC05_cdf, ONC05_Lx)
+    ONC05_Lx, ONC05_cdf = np.loadtxt(data_path+'LxfuncONC05.dat',
+                                     unpack=True, comments='#')
+    inv_cdf_ONC05 = interpolate.interp1d(ONC05_cdf, ONC05_Lx)
 
-ONC1_Lx, ONC1_cdf = np.loadtxt(data_path+'LxfuncONC1.dat',
-                               unpack=True, comments='#')
-inv_cdf_ONC1 = interpolate.interp1d(ONC1_cdf, ONC1_Lx)
+    ONC1_Lx, ONC1_cdf = np.loadtxt(data_path+'LxfuncONC1.dat',
+                                   unpack=True, comments='#')
+    inv_cdf_ONC1 = interpolate.interp1d(ONC1_cdf, ONC1_Lx)
 
 bins_Lx = np.linspace(27, 32, num=1000)
 
 sample = np.array(['COUP $M \\leq 0.25 M_\\odot$'] * np.size(bins_Lx))
-kde_ONC025 = stats.gaussian_kde(inv_cdf_ONC025(ONC025_cdf), bw_method='scott')
+grid, density = kde_curves(inv_cdf_ONC025(ONC025_cdf), cut=3.)[None]
 data_025 = pd.DataFrame(
     {
         "$\\log_{10}(L_X[erg\\, s^{-1}])$": bins_Lx,
-        "Probability density": kde_ONC025.evaluate(bins_Lx),
+        "Probability density": np.interp(bins_Lx, grid, density, left=0., right=0.),
         "sample": sample
     }
 )
 
 sample = np.array(['COUP $0.25 < M \\leq 0.5 M_\\odot$'] * np.size(bins_Lx))
-kde_ONC05 = stats.gaussian_kde(inv_cdf_ONC05(ONC05_cdf), bw_method='scott')
+grid, density = kde_curves(inv_cdf_ONC05(ONC05_cdf), cut=3.)[None]
 data_05 = pd.DataFrame(
     {
-        "$\\log_{10}(L_X[erg \\, s^{-1}])$": bins_Lx,
-        "Probability density": kde_ONC05.evaluate(bins_Lx),
+        "$\\log_{10}(L_X[erg\\, s^{-1}])$": bins_Lx,
+        "Probability density": np.interp(bins_Lx, grid, density, left=0., right=0.),
         "sample": sample
     }
 )
 
 sample = np.array(['COUP $0.5 < M \\leq 1 M_\\odot$'] * np.size(bins_Lx))
-kde_ONC1 = stats.gaussian_kde(inv_cdf_ONC1(ONC1_cdf), bw_method='scott')
+grid, density = kde_curves(inv_cdf_ONC1(ONC1_cdf), cut=3.)[None]
 data_1 = pd.DataFrame(
     {
-        "$\\log_{10}(L_X[erg \\, s^{-1}])$": bins_Lx,
-        "Probability density": kde_ONC1.evaluate(bins_Lx),
+        "$\\log_{10}(L_X[erg\\, s^{-1}])$": bins_Lx,
+        "Probability density": np.interp(bins_Lx, grid, density, left=0., right=0.),
         "sample": sample
     }
 )
@@ -85,4 +87,4 @@ plt.vlines(np.mean(inv_cdf_ONC1(ONC1_cdf)), 0., 0.7, ls='--',
 plt.ylim(0, 0.8)
 plt.xlim(27, 32)
 
-fig.savefig(fig_path+"Fig2.png", format='png', dpi=400)
+savefig(fig, fig_path+"Fig2.png", format='png', dpi=400)
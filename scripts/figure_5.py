@@ -10,6 +10,7 @@ from astropy import constants as const
 from scipy import interpolate as interpolate
 import seaborn as sns
 from matplotlib.colors import LogNorm
+from lib import read_column, binned_kde, kde_levels, setup_plots, savefig
 
 plt.style.use('science')
 sns.set_palette("pastel")
@@ -22,6 +23,7 @@ plt.rc('axes', labelsize=18.)
 plt.rc('lines', linewidth=3.)
 
 plt.rcParams["errorbar.capsize"]
+setup_plots()
 
 fig, ax = plt.subplots(1, 2, sharey=True, figsize=[17., 8.5])
 
@@ -29,20 +31,24 @@ data_path = "../data/"
 fig_path = "../figures/"
 path = data_path+"pop_FUV/"
 
-r1_arr = np.loadtxt(path+"r1.dat")
-md_arr = np.loadtxt(path+"md.dat")
-alpha_arr = np.loadtxt(path+"alpha.dat")
-
-sns.kdeplot(x=md_arr, y=alpha_arr, fill=True, common_norm=True,
-            log_scale=(False, True), cmap='turbo', cbar=True,
-            cbar_kws={'label': 'density', 'orientation': 'horizontal',
-                      'ticks': [20, 40, 50]},
-            levels=500, ax=ax[0])
-sns.kdeplot(x=r1_arr, y=alpha_arr, fill=True, common_norm=True,
-            log_scale=(False, True), cmap='turbo', cbar=True,
-            cbar_kws={'label': 'density', 'orientation': 'horizontal',
-                      'ticks': [0.01, 0.015, 0.017]},
-            levels=500, ax=ax[1])
+r1_arr = read_column(path, "r1")
+md_arr = read_column(path, "md")
+alpha_arr = read_column(path, "alpha")
+
+(md_grid, alpha_grid), density = binned_kde(np.array([md_arr, alpha_arr]).T,
+                                             log_scale=(False, True))
+cs0 = ax[0].contourf(md_grid, alpha_grid, density.T, cmap='turbo',
+                     levels=kde_levels(density, levels=500))
+fig.colorbar(cs0, ax=ax[0], label='density', orientation='horizontal',
+             ticks=[20, 40, 50])
+
+(r1_grid, alpha_grid), density = binned_kde(np.array([r1_arr, alpha_arr]).T,
+                                            log_scale=(False, True))
+cs1 = ax[1].contourf(r1_grid, alpha_grid, density.T, cmap='turbo',
+                     levels=kde_levels(density, levels=500))
+fig.colorbar(cs1, ax=ax[1], label='density', orientation='horizontal',
+             ticks=[0.01, 0.015, 0.017])
+ax[0].set_yscale('log')
 
 ax[0].set_xlim(0.01, 0.05)
 ax[0].set_ylim(1.e-4, 1.e-2)
@@ -53,4 +59,4 @@ ax[1].set_ylim(1.e-4, 1.e-2)
 ax[1].set_xlabel('$R_1$ / au')
 fig.tight_layout()
 
-fig.savefig(fig_path+'Fig51.png', format='png', dpi=400)
+savefig(fig, fig_path+'Fig51.png', format='png', dpi=400)
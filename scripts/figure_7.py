@@ -9,7 +9,9 @@ import scienceplots
 from scipy import interpolate as interpolate
 import seaborn as sns
 import pandas as pd
-from lib import mask_accretion
+from lib import (
+    mask_accretion, read_column, kde_curves, plot_kde_curves, setup_plots,
+    phase, savefig)
 
 plt.style.use('science')
 sns.set_palette("pastel")
@@ -21,6 +23,7 @@ plt.rc('axes', labelsize=8.)
 plt.rc('legend', fontsize=8.)
 
 plt.rcParams["errorbar.capsize"]
+setup_plots()
 
 fig, ax = plt.subplots(1, 4, figsize=[7.03058, 2.])
 
@@ -29,8 +32,8 @@ fig_path = "../figures/"
 
 path = data_path+"pop_EUV/"
 
-Macc_arr_euv = np.loadtxt(path+"Macc.dat")
-age_arr_euv = np.loadtxt(path+"age.dat")
+Macc_arr_euv = read_column(path, "Macc")
+age_arr_euv = read_column(path, "age")
 
 arr_stacked_euv = np.array([age_arr_euv/1e6, Macc_arr_euv]).T
 
@@ -51,8 +54,8 @@ data_euv = mask_accretion(data_euv, 1.e-12)
 
 path = data_path+"pop_XEUV/"
 
-Macc_arr_xeuv = np.loadtxt(path+"Macc.dat")
-age_arr_xeuv = np.loadtxt(path+"age.dat")
+Macc_arr_xeuv = read_column(path, "Macc")
+age_arr_xeuv = read_column(path, "age")
 
 arr_stacked_xeuv = np.array([age_arr_xeuv/1e6, Macc_arr_xeuv]).T
 
@@ -73,8 +76,8 @@ data_xeuv = mask_accretion(data_xeuv, 1.e-12)
 
 path = data_path+"pop_FUV/"
 
-Macc_arr_fuv = np.loadtxt(path+"Macc.dat")
-age_arr_fuv = np.loadtxt(path+"age.dat")
+Macc_arr_fuv = read_column(path, "Macc")
+age_arr_fuv = read_column(path, "age")
 
 arr_stacked_fuv = np.array([age_arr_fuv/1e6, Macc_arr_fuv]).T
 
@@ -95,8 +98,8 @@ data_fuv = mask_accretion(data_fuv, 1.e-12)
 
 path = data_path+"pop_EUV/03Msun/"
 
-Macc_arr_euv03 = np.loadtxt(path+"Macc.dat")
-age_arr_euv03 = np.loadtxt(path+"age.dat")
+Macc_arr_euv03 = read_column(path, "Macc")
+age_arr_euv03 = read_column(path, "age")
 
 arr_stacked_euv03 = np.array([age_arr_euv03/1e6, Macc_arr_euv03]).T
 
@@ -117,8 +120,8 @@ data_euv_03Msun = mask_accretion(data_euv_03Msun, 1.e-12)
 
 path = data_path+"pop_XEUV/03Msun/"
 
-Macc_arr = np.loadtxt(path+"Macc.dat")
-age_arr = np.loadtxt(path+"age.dat")
+Macc_arr = read_column(path, "Macc")
+age_arr = read_column(path, "age")
 
 arr_stacked = np.array([age_arr/1e6, Macc_arr]).T
 
@@ -139,8 +142,8 @@ data_xeuv_03Msun = mask_accretion(data_xeuv_03Msun, 1.e-12)
 
 path = data_path+"pop_FUV/03Msun/"
 
-Macc_arr = np.loadtxt(path+"Macc.dat")
-age_arr = np.loadtxt(path+"age.dat")
+Macc_arr = read_column(path, "Macc")
+age_arr = read_column(path, "age")
 
 arr_stacked = np.array([age_arr/1e6, Macc_arr]).T
 
@@ -161,8 +164,8 @@ data_fuv_03Msun = mask_accretion(data_fuv_03Msun, 1.e-12)
 
 path = data_path+"pop_EUV/06Msun/"
 
-Macc_arr = np.loadtxt(path+"Macc.dat")
-age_arr = np.loadtxt(path+"age.dat")
+Macc_arr = read_column(path, "Macc")
+age_arr = read_column(path, "age")
 
 arr_stacked = np.array([age_arr/1e6, Macc_arr]).T
 
@@ -183,8 +186,8 @@ data_euv_06Msun = mask_accretion(data_euv_06Msun, 1.e-12)
 
 path = data_path+"pop_XEUV/06Msun/"
 
-Macc_arr = np.loadtxt(path+"Macc.dat")
-age_arr = np.loadtxt(path+"age.dat")
+Macc_arr = read_column(path, "Macc")
+age_arr = read_column(path, "age")
 
 arr_stacked = np.array([age_arr/1e6, Macc_arr]).T
 
@@ -205,8 +208,8 @@ data_xeuv_06Msun = mask_accretion(data_xeuv_06Msun, 1.e-12)
 
 path = data_path+"pop_FUV/06Msun/"
 
-Macc_arr = np.loadtxt(path+"Macc.dat")
-age_arr = np.loadtxt(path+"age.dat")
+Macc_arr = read_column(path, "Macc")
+age_arr = read_column(path, "age")
 
 arr_stacked = np.array([age_arr/1e6, Macc_arr]).T
 
@@ -227,8 +230,8 @@ data_fuv_06Msun = mask_accretion(data_fuv_06Msun, 1.e-12)
 
 path = data_path+"pop_EUV/1Msun/"
 
-Macc_arr = np.loadtxt(path+"Macc.dat")
-age_arr = np.loadtxt(path+"age.dat")
+Macc_arr = read_column(path, "Macc")
+age_arr = read_column(path, "age")
 
 arr_stacked = np.array([age_arr/1e6, Macc_arr]).T
 
@@ -249,8 +252,8 @@ data_euv_1Msun = mask_accretion(data_euv_1Msun, 1.e-12)
 
 path = data_path+"pop_XEUV/1Msun/"
 
-Macc_arr = np.loadtxt(path+"Macc.dat")
-age_arr = np.loadtxt(path+"age.dat")
+Macc_arr = read_column(path, "Macc")
+age_arr = read_column(path, "age")
 
 arr_stacked = np.array([age_arr/1e6, Macc_arr]).T
 
@@ -271,8 +274,8 @@ data_xeuv_1Msun = mask_accretion(data_xeuv_1Msun, 1.e-12)
 
 path = data_path+"pop_FUV/1Msun/"
 
-Macc_arr = np.loadtxt(path+"Macc.dat")
-age_arr = np.loadtxt(path+"age.dat")
+Macc_arr = read_column(path, "Macc")
+age_arr = read_column(path, "age")
 
 arr_stacked = np.array([age_arr/1e6, Macc_arr]).T
 
@@ -300,16 +303,19 @@ data_fuv.reset_index(drop=True, inplace=True)
 data = pd.concat([data_euv, data_xeuv, data_fuv])
 data.reset_index(drop=True, inplace=True)
 
-low_acc_data = pd.read_csv(data_path+'low_accretors.dat', sep=' ')
-low_acc_data["Mdot"] *= 1.e-10
-low_acc_data["dMdot"] *= 1.e-10
-low_acc_data_03 = low_acc_data[low_acc_data["M$_\star$"] <= 0.3]
-low_acc_data_06 = low_acc_data[low_acc_data["M$_\star$"] > 0.3]
-low_acc_data_06 = low_acc_data_06[low_acc_data_06["M$_\star$"] <= 0.6]
-low_acc_data_1 = low_acc_data[low_acc_data["M$_\star$"] > 0.6]
+with phase("load"):
+    low_acc_data = pd.read_csv(data_path+'low_accretors.dat', sep=' ')
+    low_acc_data["Mdot"] *= 1.e-10
+    low_acc_data["dMdot"] *= 1.e-10
+    low_acc_data_03 = low_acc_data[low_acc_data["M$_\star$"] <= 0.3]
+    low_acc_data_06 = low_acc_data[low_acc_data["M$_\star$"] > 0.3]
+    low_acc_data_06 = low_acc_data_06[low_acc_data_06["M$_\star$"] <= 0.6]
+    low_acc_data_1 = low_acc_data[low_acc_data["M$_\star$"] > 0.6]
 
 sns.histplot(data, x='mdot_acc', hue="profile", stat='density', log_scale=True,
-             bins=20, ax=ax[0], kde=True)
+             bins=20, ax=ax[0])
+plot_kde_curves(ax[0], kde_curves(data["mdot_acc"], hue=data["profile"],
+                                  log_scale=True))
 ax[0].vlines(np.median(data_euv["mdot_acc"][~np.isnan(data_euv["mdot_acc"])]),
              0, 0.32, ls='-.', color='lightskyblue')
 ax[0].vlines(np.median(data_xeuv["mdot_acc"][~np.isnan(data_xeuv["mdot_acc"])]),
@@ -329,7 +335,9 @@ ax[0].legend(loc='upper right')
 ax[0].set_title("Full sample")
 
 sns.histplot(data_03, x='mdot_acc', hue="profile", stat='density', log_scale=True,
-             bins=20, ax=ax[1], kde=True)
+             bins=20, ax=ax[1])
+plot_kde_curves(ax[1], kde_curves(data_03["mdot_acc"], hue=data_03["profile"],
+                                  log_scale=True))
 ax[1].vlines(np.median(data_euv_03Msun["mdot_acc"][~np.isnan(data_euv_03Msun["mdot_acc"])]),
              0, 0.32, ls='-.', color='lightskyblue')
 ax[1].vlines(np.median(data_xeuv_03Msun["mdot_acc"][~np.isnan(data_xeuv_03Msun["mdot_acc"])]),
@@ -342,7 +350,9 @@ ax[1].legend(loc='upper right')
 ax[1].set_title("$M_\\star \\leq 0.3 M_\\odot$")
 
 sns.histplot(data_06, x='mdot_acc', hue="profile", stat='density', log_scale=True,
-             bins=20, ax=ax[2], kde=True)
+             bins=20, ax=ax[2])
+plot_kde_curves(ax[2], kde_curves(data_06["mdot_acc"], hue=data_06["profile"],
+                                  log_scale=True))
 ax[2].vlines(np.median(data_euv_06Msun["mdot_acc"][~np.isnan(data_euv_06Msun["mdot_acc"])]),
              0, 0.5, ls='-.', color='lightskyblue')
 ax[2].vlines(np.median(data_xeuv_06Msun["mdot_acc"][~np.isnan(data_xeuv_06Msun["mdot_acc"])]),
@@ -355,7 +365,9 @@ ax[2].legend(loc='upper right')
 ax[2].set_title("$0.3 < M_\\star \\leq 0.6 M_\\odot$")
 
 sns.histplot(data_1, x='mdot_acc', hue="profile", stat='density', log_scale=True,
-             bins=20, ax=ax[3], kde=True)
+             bins=20, ax=ax[3])
+plot_kde_curves(ax[3], kde_curves(data_1["mdot_acc"], hue=data_1["profile"],
+                                  log_scale=True))
 ax[3].vlines(np.median(data_euv_1Msun["mdot_acc"][~np.isnan(data_euv_1Msun["mdot_acc"])]),
              0, 0.65, ls='-.', color='lightskyblue')
 ax[3].vlines(np.median(data_xeuv_1Msun["mdot_acc"][~np.isnan(data_xeuv_1Msun["mdot_acc"])]),
@@ -369,4 +381,4 @@ ax[3].set_title("$0.6 < M_\\star \\leq 1 M_\\odot$")
 
 fig.tight_layout()
 
-fig.savefig(fig_path+'Fig7.png', format='png', dpi=400)
+savefig(fig, fig_path+'Fig7.png', format='png', dpi=400)
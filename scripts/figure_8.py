@@ -10,7 +10,7 @@ import scienceplots
 from astropy import constants as const
 from scipy import interpolate as interpolate
 import seaborn as sns
-from lib import load_data
+from lib import phase, MASS_BINS, load_populations, setup_plots, savefig
 
 plt.style.use('science')
 sns.set_palette("pastel")
@@ -22,6 +22,7 @@ plt.rc('axes', labelsize=8.)
 plt.rc('legend', fontsize=8.)
 
 plt.rcParams["errorbar.capsize"]
+setup_plots()
 
 fig, ax = plt.subplots(3, 1, sharex=True, figsize=[3.37689, 6.])
 fig.subplots_adjust(left=0.15, wspace=0.075, hspace=0.075)
@@ -29,63 +30,38 @@ fig.subplots_adjust(left=0.15, wspace=0.075, hspace=0.075)
 data_path = "../data/"
 fig_path = "../figures/"
 
-data_Mamajek = np.genfromtxt(data_path+'disc_fraction_Mamajek2009.csv',
-                             delimiter=',')
+with phase("load"):
+    data_Mamajek = np.genfromtxt(data_path+'disc_fraction_Mamajek2009.csv',
+                                 delimiter=',')
 
 mask = True
 mask_val = 1.e-11
 
-path = data_path+'pop_EUV/'
-profile_name = "Full sample"
-data_euv = load_data(path, profile_name=profile_name, mask=mask, 
-                     mask_val=mask_val)
+profile_name = MASS_BINS["full"][1]
+profile_name_03 = MASS_BINS["03Msun"][1]
+profile_name_06 = MASS_BINS["06Msun"][1]
+profile_name_1 = MASS_BINS["1Msun"][1]
 
-path = data_path+'pop_EUV/03Msun/'
-profile_name_03 = "$M_\\star \\leq 0.3 M_\\odot$"
-data_euv_03 = load_data(path, profile_name=profile_name_03, mask=mask,
-                        mask_val=mask_val)
+data = load_populations([(model, mass_bin) for model in ["EUV", "XEUV", "FUV"]
+                         for mass_bin in MASS_BINS],
+                        data_path=data_path, mask=mask, mask_val=mask_val)
+pops = {key: pop for key, pop in data.groupby(["profile", "mass_bin"],
+                                              observed=True)}
 
-path = data_path+'pop_EUV/06Msun/'
-profile_name_06 = "$0.3 < M_\\star \\leq 0.6 M_\\odot$"
-data_euv_06 = load_data(path, profile_name=profile_name_06, mask=mask,
-                        mask_val=mask_val)
+data_euv = pops[("EUV", "full")]
+data_euv_03 = pops[("EUV", "03Msun")]
+data_euv_06 = pops[("EUV", "06Msun")]
+data_euv_1 = pops[("EUV", "1Msun")]
 
-path = data_path+'pop_EUV/1Msun/'
-profile_name_1 = "$0.6 < M_\\star \\leq M_\\odot$"
-data_euv_1 = load_data(path, profile_name=profile_name_1, mask=mask,
-                       mask_val=mask_val)
+data_xeuv = pops[("XEUV", "full")]
+data_xeuv_03 = pops[("XEUV", "03Msun")]
+data_xeuv_06 = pops[("XEUV", "06Msun")]
+data_xeuv_1 = pops[("XEUV", "1Msun")]
 
-path = data_path+'pop_XEUV/'
-data_xeuv = load_data(path, profile_name=profile_name, mask=mask,
-                      mask_val=mask_val)
-
-path = data_path+'pop_XEUV/03Msun/'
-data_xeuv_03 = load_data(path, profile_name=profile_name_03, mask=mask,
-                         mask_val=mask_val)
-
-path = data_path+'pop_XEUV/06Msun/'
-data_xeuv_06 = load_data(path, profile_name=profile_name_06, mask=mask,
-                         mask_val=mask_val)
-
-path = data_path+'pop_XEUV/1Msun/'
-data_xeuv_1 = load_data(path, profile_name=profile_name_1, mask=mask,
-                        mask_val=mask_val)
-
-path = data_path+'pop_FUV/'
-data_fuv = load_data(path, profile_name=profile_name, mask=mask,
-                     mask_val=mask_val)
-
-path = data_path+'pop_FUV/03Msun/'
-data_fuv_03 = load_data(path, profile_name=profile_name_03, mask=mask,
-                         mask_val=mask_val)
-
-path = data_path+'pop_FUV/06Msun/'
-data_fuv_06 = load_data(path, profile_name=profile_name_06, mask=mask,
-                         mask_val=mask_val)
-
-path = data_path+'pop_FUV/1Msun/'
-data_fuv_1 = load_data(path, profile_name=profile_name_1, mask=mask,
-                        mask_val=mask_val)
+data_fuv = pops[("FUV", "full")]
+data_fuv_03 = pops[("FUV", "03Msun")]
+data_fuv_06 = pops[("FUV", "06Msun")]
+data_fuv_1 = pops[("FUV", "1Msun")]
 
 ax[0].plot(data_euv["age"], data_euv["disk_fraction"], '.',
            color='black', markersize=2, label=profile_name)
@@ -157,4 +133,4 @@ ax[1].set_ylabel('XEUV\ndisk fraction / \\%')
 ax[2].set_ylabel('FUV\ndisk fraction / \\%')
 ax[2].set_xlabel(r'age / Myr')
 
-fig.savefig(fig_path+'Fig81.png', format='png', dpi=400)
+savefig(fig, fig_path+'Fig81.png', format='png', dpi=400)
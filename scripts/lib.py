@@ -1,5 +1,177 @@
+import atexit
+import contextlib
+import json
+import numbers
+import os
+import sys
+import time
+import tracemalloc
+import warnings
+import zlib
+
 import numpy as np
 
+# COUP X-ray luminosity functions of Guedel+2007: upper mass edge of the bin,
+# reference stellar mass of the bin and table with the (inverted
+# Kaplan-Meier) cumulative distribution
+COUP_BINS = [
+    (0.25, 0.16, "LxfuncONC025.dat"),
+    (0.5, 0.36, "LxfuncONC05.dat"),
+    (np.inf, 0.7, "LxfuncONC1.dat"),
+]
+
+# per-disc columns written by the population synthesis runs: besides the
+# accretion rate, age and disc fraction of every row, the stellar mass, the
+# flux (log Phi, or log Lx for XEUV), the disc parameters and the dispersal
+# time (yr) of the disc of the row
+POPULATION_COLUMNS = ["Macc", "age", "frac", "r1", "md", "alpha", "Mstar",
+                      "flux", "Rstar", "Lstar", "t_disp"]
+MANIFEST = "manifest.json"
+
+# radius (Rsun) and luminosity (Lsun) of a 1 Msun pre-main-sequence star and
+# their slopes with the stellar mass, a power-law fit of the 2 Myr isochrone
+# of Baraffe et al. (2015) between 0.1 and 1 Msun
+STAR_RADIUS = (2.0, 0.5)
+STAR_LUMINOSITY = (1.0, 1.5)
+
+# photoevaporation models and stellar-mass bins of the population synthesis,
+# with the subfolder holding each bin, its label in the figures and its
+# stellar mass range in Msun
+MODELS = ["EUV", "XEUV", "FUV"]
+MASS_BINS = {
+    "full": ("", "Full sample", 0., np.inf),
+    "03Msun": ("03Msun/", "$M_\\star \\leq 0.3 M_\\odot$", 0., 0.3),
+    "06Msun": ("06Msun/", "$0.3 < M_\\star \\leq 0.6 M_\\odot$", 0.3, 0.6),
+    "1Msun": ("1Msun/", "$0.6 < M_\\star \\leq M_\\odot$", 0.6, np.inf),
+}
+
+# fraction of discs formed by binary interactions (Owen et al. 2011), by which
+# the disc fractions of the populations are scaled down (1 - 0.14 = 0.86)
+BINARY_FRACTION = 0.14
+
+# synthetic stand-in populations (write_synthetic_population): oldest age in
+# yr, and per model the median disc lifetime in Myr for a 0.3 Msun star, its
+# lognormal width in dex and its power-law dependence on the stellar mass
+# (lifetimes grow with Mstar for EUV and FUV and slightly decrease for X-rays,
+# Section 4 of the paper); the discs are drawn in blocks of SYNTHETIC_BLOCK
+SYNTHETIC_AGE_MAX = 2.e7
+SYNTHETIC_BLOCK = 100000
+SYNTHETIC_LIFETIMES = {
+    "EUV": (2.5, 0.3, 0.8),
+    "XEUV": (2.5, 0.25, -0.2),
+    "FUV": (2.5, 0.3, 0.6),
+}
+
+# root seed of the random streams of make_rng and chunk_streams, so that the
+# figures and populations are reproducible; LOW_ACCRETORS_SEED changes it
+SEED = int(os.environ.get("LOW_ACCRETORS_SEED", "0"))
+
+# draft rendering, switched on by LOW_ACCRETORS_DRAFT=1 or --draft: Agg
+# backend, mathtext instead of LaTeX, low DPI and optionally only every
+# LOW_ACCRETORS_DRAFT_STRIDE-th disc of the populations
+DRAFT = (os.environ.get("LOW_ACCRETORS_DRAFT", "0") not in ("", "0")
+         or "--draft" in sys.argv)
+DRAFT_DPI = int(os.environ.get("LOW_ACCRETORS_DRAFT_DPI", "100"))
+DRAFT_STRIDE = (int(os.environ.get("LOW_ACCRETORS_DRAFT_STRIDE", "1"))
+                if DRAFT else 1)
+
+# output formats of savefig, e.g. LOW_ACCRETORS_FORMAT=pdf or pdf,png; vector
+# formats get their dense layers rasterized
+FORMATS = [fmt for fmt in os.environ.get("LOW_ACCRETORS_FORMAT", "").split(",") if fmt]
+VECTOR_FORMATS = ["pdf", "svg", "eps", "ps"]
+
+# phase profiling, switched on by LOW_ACCRETORS_PROFILE: 1 prints a one-line
+# summary at exit, a path writes a JSON report there (or <script>.json inside
+# it if it is a directory). tracemalloc slows down plotting a lot, so
+# LOW_ACCRETORS_PROFILE_MEMORY=0 keeps the timings only
+PROFILE = os.environ.get("LOW_ACCRETORS_PROFILE", "0") not in ("", "0")
+PROFILE_MEMORY = os.environ.get("LOW_ACCRETORS_PROFILE_MEMORY", "1") not in ("", "0")
+_PHASES = {}
+_PHASE_STACK = []
+_PROFILE_START = (time.perf_counter(), time.process_time())
+
+
+@contextlib.contextmanager
+def phase(name):
+    """
+    Time a phase of a script: wall time, CPU time and tracemalloc peak.
+
+    Use it as a context manager (with phase("load"): ...) or as a decorator
+    (@phase("kde")). Phases with the same name add up, a phase entered again
+    inside itself is counted once, and a phase nested in another one is also
+    included in its parent. Nothing is recorded unless PROFILE is set.
+    """
+    if not PROFILE or any(entry[0] == name for entry in _PHASE_STACK):
+        yield
+        return
+
+    _, peak = tracemalloc.get_traced_memory()
+    if _PHASE_STACK:
+        _PHASE_STACK[-1][3] = max(_PHASE_STACK[-1][3], peak)
+    tracemalloc.reset_peak()
+    entry = [name, time.perf_counter(), time.process_time(), 0]
+    _PHASE_STACK.append(entry)
+    try:
+        yield
+    finally:
+        _PHASE_STACK.pop()
+        _, peak = tracemalloc.get_traced_memory()
+        peak = max(peak, entry[3])
+        if _PHASE_STACK:
+            _PHASE_STACK[-1][3] = max(_PHASE_STACK[-1][3], peak)
+        record = _PHASES.setdefault(name, {"calls": 0, "wall": 0., "cpu": 0.,
+                                           "peak_mb": 0., "top": 0.})
+        record["calls"] += 1
+        record["wall"] += time.perf_counter()-entry[1]
+        record["cpu"] += time.process_time()-entry[2]
+        record["peak_mb"] = max(record["peak_mb"], peak/2**20)
+        if not _PHASE_STACK:
+            record["top"] += time.perf_counter()-entry[1]
+
+
+def profile_report():
+    """
+    Return the phases recorded so far, with the time spent outside any phase
+    (mostly plotting) as "other" and the whole run since lib was imported as
+    "total".
+    """
+    wall = time.perf_counter()-_PROFILE_START[0]
+    cpu = time.process_time()-_PROFILE_START[1]
+    phases = {name: {key: val for key, val in record.items() if key != "top"}
+              for name, record in _PHASES.items()}
+    phases["other"] = {"calls": 1, "cpu": None, "peak_mb": None,
+                       "wall": wall-sum(rec["top"] for rec in _PHASES.values())}
+    _, peak = tracemalloc.get_traced_memory()
+    return {"script": os.path.basename(sys.argv[0]),
+            "total": {"wall": wall, "cpu": cpu,
+                      "peak_mb": max([peak/2**20]+[rec["peak_mb"] for rec
+                                                   in _PHASES.values()])},
+            "phases": phases}
+
+
+def _write_profile():
+    report = profile_report()
+    value = os.environ["LOW_ACCRETORS_PROFILE"]
+    if value == "1":
+        parts = [f"{name} {rec['wall']:.2f} s"
+                 + (f" {rec['peak_mb']:.0f} MB" if rec["peak_mb"] else "")
+                 for name, rec in report["phases"].items()]
+        total = report["total"]
+        print(f"{report['script']}: total {total['wall']:.2f} s"
+              + (f" {total['peak_mb']:.0f} MB" if total["peak_mb"] else "")
+              + " | "+" | ".join(parts), file=sys.stderr)
+        return
+    if os.path.isdir(value):
+        value = os.path.join(value, os.path.splitext(report["script"])[0]+".json")
+    with open(value, "w") as f:
+        json.dump(report, f, indent=1)
+
+
+if PROFILE and PROFILE_MEMORY:
+    tracemalloc.start()
+if PROFILE:
+    atexit.register(_write_profile)
+
 
 def Phi_Mstar(Mstar):
     """
@@ -10,42 +182,421 @@ def Phi_Mstar(Mstar):
     return 1.54*np.log10(Mstar) + 42.
 
 
-def IMF(masses, profile="Kroupa"):
-    if profile == "Kroupa":
-        IMF = []
+def stellar_properties(Mstar):
+    """
+    Return the radius (Rsun) and luminosity (Lsun) of stars of mass Mstar
+    (Msun), from the power laws STAR_RADIUS and STAR_LUMINOSITY.
+    """
+    Mstar = np.asarray(Mstar, dtype=float)
+    return (STAR_RADIUS[0]*Mstar**STAR_RADIUS[1],
+            STAR_LUMINOSITY[0]*Mstar**STAR_LUMINOSITY[1])
+
 
-        for i in range(len(masses)):
-            if masses[i] < 0.5:
-                IMF.append([masses[i], masses[i]**(-1.3)])
-            elif masses[i] >= 0.5:
-                IMF.append([masses[i], masses[i]**(-2.3)])
+@phase("sampling")
+def sample_Phi(Mstar, scatter=0.25, rng=None):
+    """
+    Draw log10(Phi) for an array of stellar masses, normally distributed
+    around Phi_Mstar with a scatter in dex.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    return rng.normal(Phi_Mstar(Mstar), scatter)
 
-        IMF = np.array(IMF)
+
+def seed_sequence(*key, seed=None):
+    """
+    Return the SeedSequence of the random stream named by key.
+
+    key is any number of integers or strings (e.g. the script and the drawn
+    quantity, or a model index), seed the root seed (default SEED). The same
+    key always gives the same stream and different keys independent ones.
+    """
+    entropy = [SEED if seed is None else seed]
+    for k in key:
+        entropy.append(int(k) if isinstance(k, numbers.Integral)
+                       else zlib.crc32(str(k).encode()))
+    return np.random.SeedSequence(entropy)
+
+
+def make_rng(*key, seed=None):
+    """
+    Return a numpy Generator on the random stream named by key, see
+    seed_sequence, to pass as rng to the sampling functions.
+    """
+    return np.random.default_rng(seed_sequence(*key, seed=seed))
+
+
+def chunk_streams(size, chunk_size, *key, seed=None):
+    """
+    Split size draws in chunks of chunk_size, each with its own stream.
+
+    Returns a list of (start, stop, SeedSequence), the streams spawned from
+    seed_sequence(*key, seed=seed). The streams depend only on the chunk
+    index, so draws made chunk by chunk in any number of processes, in any
+    order, are identical to a serial run with the same chunk_size.
+    """
+    children = seed_sequence(*key, seed=seed).spawn(-(-size//chunk_size))
+    return [(i*chunk_size, min((i+1)*chunk_size, size), seed_seq)
+            for i, seed_seq in enumerate(children)]
+
+
+@phase("load")
+def load_XLF(data_path="../data/"):
+    """
+    Return the inverse cumulative X-ray luminosity functions of the COUP bins.
+
+    Each entry is (upper mass edge, reference mass, cdf, log10(Lx)) with the
+    cdf sorted in increasing order, ready to be used by np.interp.
+    """
+    XLF = []
+    for Mmax, Mref, fname in COUP_BINS:
+        lxs, cdf = np.loadtxt(data_path+fname, unpack=True, comments='#')
+        order = np.argsort(cdf, kind="stable")
+        XLF.append((Mmax, Mref, cdf[order], lxs[order]))
+    return XLF
+
+
+def _interp_extrapolate(x, xp, fp):
+    """
+    Linear interpolation as np.interp, but linearly extrapolated outside xp.
+
+    Mimics interp1d(..., fill_value="extrapolate") used in the figure scripts.
+    """
+    y = np.interp(x, xp, fp)
+    low = x < xp[0]
+    if np.any(low):
+        slope = (fp[1]-fp[0])/(xp[1]-xp[0])
+        y[low] = fp[0] + slope*(x[low]-xp[0])
+    high = x > xp[-1]
+    if np.any(high):
+        slope = (fp[-1]-fp[-2])/(xp[-1]-xp[-2])
+        y[high] = fp[-1] + slope*(x[high]-xp[-1])
+    return y
+
+
+@phase("sampling")
+def sample_Lx(Mstar, XLF=None, data_path="../data/", rng=None):
+    """
+    Draw log10(Lx) for an array of stellar masses from the COUP XLFs.
+
+    Stars are grouped in the COUP mass bins and sampled by inverting the
+    cumulative distribution of each bin with a single interpolation. The
+    Lx-Mstar scaling of Güdel et al. (2007) is applied as the additive offset
+    1.54*log10(Mstar/Mref).
+    """
+    if XLF is None:
+        XLF = load_XLF(data_path)
+    if rng is None:
+        rng = np.random.default_rng()
+
+    Mstar = np.atleast_1d(np.asarray(Mstar, dtype=float))
+    Lx = np.empty_like(Mstar)
+    u = rng.random(Mstar.size)
+
+    Mmin = -np.inf
+    for Mmax, Mref, cdf, lxs in XLF:
+        in_bin = (Mstar > Mmin) & (Mstar <= Mmax)
+        Lx[in_bin] = (_interp_extrapolate(u[in_bin], cdf, lxs)
+                      + 1.54*np.log10(Mstar[in_bin]/Mref))
+        Mmin = Mmax
+    return Lx
+
+
+def IMF(masses, profile="Kroupa"):
+    if profile == "Kroupa":
+        masses = np.asarray(masses)
+        weights = np.where(masses < 0.5, masses**(-1.3), masses**(-2.3))
+        IMF = np.array([masses, weights]).T
         return IMF
     else:
         print("IMF profile not defined.\n")
     return 0
 
 
+def _IMF_segments(mass_ini, mass_end, breaks, slopes, continuous):
+    """
+    Return edges, slopes, coefficients and cumulative weights of a broken
+    power law m**(-slope) between mass_ini and mass_end.
+
+    The segments are those of the breaks, with one slope each; the ones
+    outside (mass_ini, mass_end) are dropped and the ones containing the
+    limits are cut there, so the continuity coefficients do not depend on
+    the mass range.
+    """
+    if not mass_ini < mass_end:
+        raise ValueError("The IMF needs mass_ini < mass_end.")
+    breaks = np.asarray(breaks, dtype=float)
+    slopes = np.asarray(slopes, dtype=float)
+    if slopes.size != breaks.size+1:
+        raise ValueError("Need one slope per IMF segment.")
+
+    # continuity coefficients, otherwise each segment is a bare m**(-slope)
+    # as in lib.IMF
+    coeff = np.ones_like(slopes)
+    if continuous:
+        for i in range(1, slopes.size):
+            coeff[i] = coeff[i-1]*breaks[i-1]**(slopes[i]-slopes[i-1])
+
+    a = np.clip(np.concatenate(([mass_ini], breaks)), mass_ini, mass_end)
+    b = np.clip(np.concatenate((breaks, [mass_end])), mass_ini, mass_end)
+    keep = b > a
+    a, b, slopes, coeff = a[keep], b[keep], slopes[keep], coeff[keep]
+    edges = np.concatenate((a[:1], b))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        integral = np.where(slopes == 1., np.log(b/a),
+                            (b**(1.-slopes) - a**(1.-slopes))/(1.-slopes))
+    cumulative = np.concatenate(([0.], np.cumsum(coeff*integral)))
+    return edges, slopes, coeff, cumulative/cumulative[-1]
+
+
+@phase("sampling")
+def sample_IMF(size, mass_ini=0.1, mass_end=1.1, breaks=(0.5,),
+               slopes=(1.3, 2.3), continuous=False, rng=None):
+    """
+    Draw stellar masses from a broken power-law IMF by analytic inversion.
+
+    The default parameters reproduce lib.IMF (Kroupa 2001 slopes between 0.1
+    and 1.1 Msun without continuity coefficients); any mass range, number of
+    segments and slopes can be given, and continuous=True joins the segments
+    continuously at the breaks.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+
+    edges, slopes, coeff, cumulative = _IMF_segments(mass_ini, mass_end,
+                                                     breaks, slopes, continuous)
+
+    u = rng.random(size)
+    masses = np.empty_like(u)
+    for i in range(slopes.size):
+        in_seg = (u >= cumulative[i]) & (u < cumulative[i+1])
+        # fraction of the probability inside the segment
+        v = (u[in_seg] - cumulative[i])/(cumulative[i+1] - cumulative[i])
+        a, b, k = edges[i], edges[i+1], 1.-slopes[i]
+        if k == 0.:
+            masses[in_seg] = a*(b/a)**v
+        else:
+            masses[in_seg] = (a**k + v*(b**k - a**k))**(1./k)
+    return masses
+
+
+def iter_IMF(size, chunk_size=1000000, rng=None, **kwargs):
+    """
+    Yield size stellar masses from sample_IMF in chunks of chunk_size.
+
+    Keeps the memory footprint fixed when drawing very large populations.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    for start in range(0, size, chunk_size):
+        yield sample_IMF(min(chunk_size, size-start), rng=rng, **kwargs)
+
+
 def mask_accretion(data, value):
     mask = (data["mdot_acc"] > value)
     output = data[mask]
     return output
 
 
-def load_data(path, profile_name="Full sample", mask=True, mask_val=1.e-11):
+def _source_stat(fname):
+    # size and modification time of the text column a binary column mirrors
+    stat = os.stat(fname)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def write_manifest(path, rows, dtypes, sources=(), **meta):
+    """
+    Write the manifest of the binary columns of a population.
+
+    dtypes maps every column to its numpy dtype; extra keyword arguments are
+    stored as they are (e.g. how a synthetic population was generated). For
+    the columns in sources the size and modification time of their .dat text
+    file are recorded, so that read_column can tell when the text file has
+    changed since.
+    """
+    manifest = {"rows": int(rows),
+                "columns": {col: {"file": col+".npy", "dtype": np.dtype(dtype).str}
+                            for col, dtype in dtypes.items()}}
+    for col in sources:
+        manifest["columns"][col]["source"] = _source_stat(path+col+".dat")
+    manifest.update(meta)
+    with open(path+MANIFEST, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def write_population(path, columns, text=False, sort_by=None, sources=(),
+                     **meta):
+    """
+    Write the columns of a population as .npy files with their manifest.
+
+    columns is a dict of equally long arrays. With text=True the .dat text
+    columns read by the original scripts are written as well, and recorded
+    as the sources of the binary columns (see write_manifest). With sort_by
+    (e.g. "Mstar") the rows are sorted by that column, keeping the order of
+    equal values, and the manifest records it so that a range of the column
+    is a slice of rows (see sorted_rows).
+    """
+    os.makedirs(path, exist_ok=True)
+    if sort_by is not None:
+        order = np.argsort(columns[sort_by], kind="stable")
+        columns = {col: np.asarray(arr)[order] for col, arr in columns.items()}
+        meta["sorted_by"] = sort_by
+    rows = None
+    for col, arr in columns.items():
+        arr = np.asarray(arr)
+        np.save(path+col+".npy", arr)
+        if text:
+            np.savetxt(path+col+".dat", arr)
+        if rows is None:
+            rows = arr.size
+        elif rows != arr.size:
+            raise ValueError(f"Column {col} in {path} has {arr.size} rows, "
+                             f"expected {rows}.")
+
+    if text:
+        sources = list(columns)
+    return write_manifest(path, rows, {col: np.asarray(arr).dtype
+                                       for col, arr in columns.items()},
+                          sources=sources, **meta)
+
+
+def convert_population(path, columns=None, dtype=np.float64):
+    """
+    Convert the text columns of a population to one .npy file per column.
+
+    A small manifest listing the columns, their dtype, the number of rows and
+    the size and modification time of the text files is written next to
+    them, so that read_column can memory-map them instead of parsing the text
+    files again, as long as the text files have not changed.
+    """
+    if columns is None:
+        columns = [col for col in POPULATION_COLUMNS
+                   if os.path.exists(path+col+".dat")]
+
+    arrays = {col: np.loadtxt(path+col+".dat", dtype=dtype, ndmin=1)
+              for col in columns}
+    return write_population(path, arrays, sources=columns)
+
+
+def read_manifest(path):
+    """
+    Return the manifest of a converted population, or None if there is none.
+    """
+    if not os.path.exists(path+MANIFEST):
+        return None
+    with open(path+MANIFEST) as f:
+        return json.load(f)
+
+
+def sorted_rows(path, Mmin=None, Mmax=None, column="Mstar"):
+    """
+    Return the rows of a population with Mmin < column <= Mmax.
+
+    If the population was written sorted by column (write_population) this is
+    a slice found by binary search on the memory-mapped column, without
+    reading the rest of it; otherwise it is a boolean mask.
+    """
+    manifest = read_manifest(path)
+    values = read_column(path, column, rows=slice(None))
+    lo = -np.inf if Mmin is None else Mmin
+    hi = np.inf if Mmax is None else Mmax
+    if manifest is not None and manifest.get("sorted_by") == column:
+        return slice(int(np.searchsorted(values, lo, side="right")),
+                     int(np.searchsorted(values, hi, side="right")))
+    return (values > lo) & (values <= hi)
+
+
+def _column_file(path, name, manifest):
+    # file read_column reads a column from: the binary column, unless there is
+    # none or the text file it was converted from has changed since
+    text = path+name+".dat"
+    if manifest is None or name not in manifest["columns"]:
+        return text
+    column = manifest["columns"][name]
+    source = column.get("source")
+    if (source is not None and os.path.exists(text)
+            and _source_stat(text) != source):
+        warnings.warn(f"{text} changed after it was converted, reading it "
+                      "instead of the binary column (run convert_population "
+                      "again).")
+        return text
+    return path+column["file"]
+
+
+@phase("load")
+def read_column(path, name, rows=None):
+    """
+    Return a column of a population, memory-mapped if it has been converted.
+
+    Falls back to parsing the text file when no binary column is available,
+    or when the text file the binary column was converted from has changed
+    size or modification time since (with a warning). rows can be a slice or
+    an index array, in which case only those rows are read from disk. In
+    draft mode only every DRAFT_STRIDE-th row is read by default.
+    """
+    if rows is None and DRAFT_STRIDE > 1:
+        rows = slice(None, None, DRAFT_STRIDE)
+    fname = _column_file(path, name, read_manifest(path))
+    if fname.endswith(".npy"):
+        arr = np.load(fname, mmap_mode='r')
+    else:
+        arr = np.loadtxt(fname, ndmin=1)
+    if rows is not None:
+        arr = arr[rows]
+    return arr
+
+
+@phase("load")
+def load_data(path, profile_name="Full sample", mask=True, mask_val=1.e-11,
+              rows=None, dtype=np.float64, binary_fraction=BINARY_FRACTION,
+              Mmin=None, Mmax=None):
+    """
+    Load a population as a DataFrame with mdot_acc, disk_fraction and age.
+
+    Accretion rates below 1e-13 Msun/yr (and below mask_val if mask is True)
+    are removed in a single pass over the memory-mapped columns, so each
+    column is copied only once, already filtered and cast to dtype. The disc
+    fraction is scaled by 1 - binary_fraction. profile is stored as a
+    categorical column with a single category.
+
+    With Mmin or Mmax only the discs with Mmin < Mstar <= Mmax are loaded
+    (see sorted_rows), and their disc fraction is computed from their own
+    dispersal times, so any stellar-mass bin can be read from the full sample
+    of a population that has the Mstar and t_disp columns.
+    """
     import pandas as pd
-    Macc_arr = np.loadtxt(path+"Macc.dat")
-    age_arr = np.loadtxt(path+"age.dat")
-    disk_frac = np.loadtxt(path+"frac.dat")
+    in_bin = Mmin is not None or Mmax is not None
+    if in_bin:
+        if rows is not None:
+            raise ValueError("rows cannot be combined with Mmin and Mmax.")
+        rows = sorted_rows(path, Mmin, Mmax)
+        if DRAFT_STRIDE > 1:
+            # every DRAFT_STRIDE-th disc of the bin, as read_column does
+            if isinstance(rows, slice):
+                rows = slice(rows.start, rows.stop, DRAFT_STRIDE)
+            else:
+                rows = np.flatnonzero(rows)[::DRAFT_STRIDE]
+    Macc_arr = read_column(path, "Macc", rows=rows)
 
-    arr_stacked = np.array([age_arr/1e6, disk_frac, Macc_arr]).T
+    threshold = max(1.e-13, mask_val) if mask is True else 1.e-13
+    keep = Macc_arr > threshold
 
-    age = arr_stacked[:, 0]
-    frac = arr_stacked[:, 1]*0.86
-    mdot_acc = arr_stacked[:, 2]
+    mdot_acc = np.asarray(Macc_arr[keep], dtype=dtype)
+    age = np.asarray(read_column(path, "age", rows=rows)[keep], dtype=dtype)
+    if in_bin:
+        # every disc has the same number of rows, so the fraction of rows
+        # with t_disp beyond an age is the fraction of discs
+        t_disp = read_column(path, "t_disp", rows=rows)
+        frac = np.asarray(disc_fraction(t_disp, age), dtype=dtype)
+    else:
+        frac = np.asarray(read_column(path, "frac", rows=rows)[keep],
+                          dtype=dtype)
+    age /= 1e6
+    frac *= 1.-binary_fraction
 
-    profile = np.array([profile_name] * np.size(arr_stacked[:, 1]))
+    profile = pd.Categorical.from_codes(np.zeros(mdot_acc.size, dtype=np.int8),
+                                        categories=[profile_name])
 
     data = pd.DataFrame(
         {
@@ -53,12 +604,695 @@ def load_data(path, profile_name="Full sample", mask=True, mask_val=1.e-11):
             "disk_fraction": frac,
             "age": age,
             "profile": profile
-        }
+        },
+        copy=False
     )
 
-    data = mask_accretion(data, 1.e-13)
+    return data
+
+
+@phase("load")
+def load_populations(selectors, data_path="../data/", mask=True,
+                     mask_val=1.e-11, max_workers=None, dtype=np.float64,
+                     binary_fraction=BINARY_FRACTION, bins=None):
+    """
+    Load several populations at once into a single long-format DataFrame.
+
+    selectors is a list of (model, mass bin) pairs, e.g. ("EUV", "03Msun"),
+    with the mass bins defined in MASS_BINS. The populations are read
+    concurrently with load_data, masked while loading, and returned with
+    categorical "profile" (model) and "mass_bin" columns that share their
+    categories, so concatenating them does not fall back to object strings.
+
+    bins gives other mass bins, {key: (..., Mmin, Mmax)} as MASS_BINS; they
+    are read from the full sample of the populations by stellar mass instead
+    of from the subfolders.
+    """
+    import pandas as pd
+    from concurrent.futures import ThreadPoolExecutor
+
+    models = list(dict.fromkeys(model for model, _ in selectors))
+    mass_bins = list(MASS_BINS if bins is None else bins)
+
+    def _load(selector):
+        model, mass_bin = selector
+        if bins is None:
+            path = data_path+"pop_"+model+"/"+MASS_BINS[mass_bin][0]
+            limits = {}
+        else:
+            path = data_path+"pop_"+model+"/"
+            limits = {"Mmin": bins[mass_bin][-2], "Mmax": bins[mass_bin][-1]}
+        data = load_data(path, mask=mask, mask_val=mask_val, dtype=dtype,
+                         binary_fraction=binary_fraction, **limits)
+        codes = np.ones(len(data), dtype=np.int8)
+        data["profile"] = pd.Categorical.from_codes(
+            codes*models.index(model), categories=models)
+        data["mass_bin"] = pd.Categorical.from_codes(
+            codes*mass_bins.index(mass_bin), categories=mass_bins)
+        return data
 
-    if mask is True:
-        data = mask_accretion(data, mask_val)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        frames = list(pool.map(_load, selectors))
 
+    data = pd.concat(frames, ignore_index=True)
     return data
+
+
+def disc_fraction(t_disp, ages):
+    """
+    Return the percentage of discs still present at the given ages.
+
+    t_disp are the dispersal times of the discs (np.inf for discs surviving
+    the whole run), in the same units as ages.
+    """
+    t_disp = np.sort(np.asarray(t_disp))
+    return 100.*(1.-np.searchsorted(t_disp, ages, side="right")/t_disp.size)
+
+
+def dispersal_times(Macc, times, threshold=1.e-11):
+    """
+    Return the times at which the accretion rates of discs first fall below
+    threshold (the disc lifetime of Section 3), np.inf if they never do.
+
+    Macc is a (disc x time) array of accretion histories at times, e.g. the
+    result of disc.evolve_discs; the crossing is interpolated in log Macc
+    between the two outputs around it.
+    """
+    Macc = np.asarray(Macc, dtype=float)
+    times = np.asarray(times, dtype=float)
+    below = Macc < threshold
+    i = np.argmax(below, axis=1)
+    crossed = below[np.arange(len(Macc)), i]
+    t_disp = np.where(crossed, times[i], np.inf)
+
+    # log interpolation where the rate just before is known and both are > 0
+    rows = np.flatnonzero(crossed & (i > 0))
+    before, after = Macc[rows, i[rows]-1], Macc[rows, i[rows]]
+    ok = after > 0.
+    rows, before, after = rows[ok], before[ok], after[ok]
+    f = np.log(before/threshold)/np.log(before/after)
+    t0, t1 = times[i[rows]-1], times[i[rows]]
+    t_disp[rows] = t0 + f*(t1-t0)
+    return t_disp
+
+
+def disc_fraction_curves(t_disp, ages, Mstar=None, bins=None,
+                         binary_fraction=BINARY_FRACTION, n_boot=0,
+                         quantiles=(0.16, 0.84), rng=None):
+    """
+    Return the disc fraction (%) at ages of the discs of every stellar-mass
+    bin, scaled by 1 - binary_fraction.
+
+    t_disp are the dispersal times of the discs (see dispersal_times), in the
+    units of ages. With Mstar the discs are grouped in bins, {key: (..., Mmin,
+    Mmax)} as MASS_BINS (the default); without it there is a single "full"
+    group. Returns {key: {"frac": ...}}, with the quantiles of n_boot
+    bootstrap resamplings of the discs as "low" and "high" if n_boot > 0.
+
+    The dispersal times of each group are sorted once: a resampling only
+    counts how many times each disc is drawn, and its curve is a cumulative
+    sum of these counts read at the positions of the ages.
+    """
+    t_disp = np.asarray(t_disp, dtype=float)
+    if Mstar is None:
+        groups = {"full": np.ones(t_disp.size, dtype=bool)}
+    else:
+        Mstar = np.asarray(Mstar, dtype=float)
+        groups = {key: (Mstar > b[-2]) & (Mstar <= b[-1])
+                  for key, b in (MASS_BINS if bins is None else bins).items()}
+    if n_boot and rng is None:
+        rng = np.random.default_rng()
+
+    scale = 100.*(1.-binary_fraction)
+    curves = {}
+    for key, in_group in groups.items():
+        t = np.sort(t_disp[in_group])
+        n = t.size
+        if not n:
+            curves[key] = {"frac": np.full(np.shape(ages), np.nan)}
+            continue
+        pos = np.searchsorted(t, ages, side="right")
+        curves[key] = {"frac": scale*(1.-pos/n)}
+        if n_boot:
+            boot = np.empty((n_boot,)+np.shape(ages))
+            for b in range(n_boot):
+                counts = np.bincount(rng.integers(0, n, n), minlength=n)
+                dispersed = np.concatenate(([0], np.cumsum(counts)))[pos]
+                boot[b] = scale*(1.-dispersed/n)
+            curves[key]["low"], curves[key]["high"] = np.quantile(
+                boot, quantiles, axis=0)
+    return curves
+
+
+def _synthetic_lifetimes(model, Mstar, rng):
+    # disc lifetimes in years, lognormal around a median scaling with Mstar
+    median, width, slope = SYNTHETIC_LIFETIMES[model]
+    return 1.e6*median*(Mstar/0.3)**slope*10**rng.normal(0., width, Mstar.size)
+
+
+def _synthetic_chunk(model, size, seed_seq, XLF=None):
+    # the stellar masses are the first draw of the chunk generator, so that
+    # they can be drawn again alone to count the discs of every mass bin
+    rng = np.random.default_rng(seed_seq)
+    Mstar = sample_IMF(size, rng=rng)
+    age = rng.uniform(0., SYNTHETIC_AGE_MAX, size)
+    t_disp = _synthetic_lifetimes(model, Mstar, rng)
+
+    # viscous similarity solution (Lynden-Bell & Pringle 1974), switched off
+    # once the disc has been dispersed
+    Macc0 = 10**rng.normal(-7.5, 0.4, size)*Mstar**2
+    t_nu = 10**rng.uniform(5., 6., size)
+    Macc = np.where(age < t_disp, Macc0*(1.+age/t_nu)**(-1.5), 0.)
+
+    columns = {"Macc": Macc, "age": age, "Mstar": Mstar, "t_disp": t_disp}
+    if model == "FUV":
+        # ranges of the parameter space of Table 2: R1 in au, disc mass in
+        # units of Mstar
+        columns["r1"] = rng.uniform(10., 100., size)
+        columns["md"] = rng.uniform(0.01, 0.1, size)
+        columns["alpha"] = 10**rng.uniform(-4., -2., size)
+    # log Lx for XEUV and log Phi otherwise, as run_population.draw_discs
+    if model == "XEUV":
+        columns["flux"] = sample_Lx(Mstar, XLF, rng=rng)
+    else:
+        columns["flux"] = sample_Phi(Mstar, rng=rng)
+    return Mstar, columns
+
+
+def write_synthetic_population(path, model, size, seed=0, text=False,
+                               binary=True, XLF=None, data_path="../data/"):
+    """
+    Write a synthetic stand-in for the population of a photoevaporation model.
+
+    path is the pop_<model>/ folder, which gets the full sample and the
+    03Msun/06Msun/1Msun subfolders (Macc, age and frac, plus Mstar, flux and
+    t_disp in the full sample, and r1, md and alpha for FUV) as text columns
+    if text is True and as binary columns with their manifest if binary is
+    True. Stellar masses follow sample_IMF, ages are uniform up to
+    SYNTHETIC_AGE_MAX, the accretion rates follow a viscous similarity
+    solution until a lognormal disc lifetime (SYNTHETIC_LIFETIMES), flux is
+    log Lx from the XLFs (XLF, or read from data_path) for XEUV and log Phi
+    otherwise, and frac is the disc fraction of the model (in the
+    stellar-mass range of the folder) at that age. The discs are generated
+    in blocks of SYNTHETIC_BLOCK, each with its own seed spawned from seed,
+    and streamed to the subfolders; the full sample is gathered to be written
+    sorted by stellar mass, as the populations of run_population.py, so that
+    mass ranges are slices of it (see sorted_rows).
+    """
+    model_index = MODELS.index(model)
+    if model == "XEUV" and XLF is None:
+        XLF = load_XLF(data_path)
+    streams = chunk_streams(size, SYNTHETIC_BLOCK, model_index, seed=seed)
+    chunks = [seed_seq for _, _, seed_seq in streams]
+    sizes = [stop-start for start, stop, _ in streams]
+
+    # percentage of discs still there as a function of age in every mass bin,
+    # from a reference sample of lifetimes
+    ref_rng = make_rng(model_index, 1, seed=seed)
+    M_ref = sample_IMF(100000, rng=ref_rng)
+    t_ref = _synthetic_lifetimes(model, M_ref, ref_rng)
+    ages = np.linspace(0., SYNTHETIC_AGE_MAX, 201)
+    fractions = {}
+    for key, (_, _, Mmin, Mmax) in MASS_BINS.items():
+        in_bin = (M_ref > Mmin) & (M_ref <= Mmax)
+        fractions[key] = disc_fraction(t_ref[in_bin], ages)
+
+    # first pass over the stellar masses only, for the rows of each mass bin
+    counts = dict.fromkeys(MASS_BINS, 0)
+    for seed_seq, n in zip(chunks, sizes):
+        Mstar = sample_IMF(n, rng=np.random.default_rng(seed_seq))
+        for key, (_, _, Mmin, Mmax) in MASS_BINS.items():
+            in_bin = (Mstar > Mmin) & (Mstar <= Mmax)
+            counts[key] += int(np.count_nonzero(in_bin))
+
+    columns = ["Macc", "age", "frac"]
+    full = columns + ["Mstar", "flux", "t_disp"]
+    if model == "FUV":
+        full = full + ["r1", "md", "alpha"]
+    gathered = {col: [] for col in full}
+    outputs = {}
+    for key, (subfolder, _, _, _) in MASS_BINS.items():
+        folder = path+subfolder
+        os.makedirs(folder, exist_ok=True)
+        if os.path.exists(folder+MANIFEST):
+            os.remove(folder+MANIFEST)
+        if not subfolder:
+            # the full sample is written once gathered, sorted by Mstar
+            continue
+        outputs[key] = {
+            col: (np.lib.format.open_memmap(folder+col+".npy", mode="w+",
+                                            dtype=np.float64,
+                                            shape=(counts[key],))
+                  if binary else None,
+                  open(folder+col+".dat", "w") if text else None)
+            for col in columns}
+
+    offsets = dict.fromkeys(MASS_BINS, 0)
+    try:
+        for seed_seq, n in zip(chunks, sizes):
+            Mstar, chunk = _synthetic_chunk(model, n, seed_seq, XLF)
+            for key, (_, _, Mmin, Mmax) in MASS_BINS.items():
+                in_bin = (Mstar > Mmin) & (Mstar <= Mmax)
+                chunk["frac"] = np.interp(chunk["age"], ages, fractions[key])
+                if key not in outputs:
+                    for col, arrays in gathered.items():
+                        arrays.append(chunk[col][in_bin])
+                    continue
+                start, stop = offsets[key], offsets[key]+np.count_nonzero(in_bin)
+                for col, (arr, f) in outputs[key].items():
+                    if arr is not None:
+                        arr[start:stop] = chunk[col][in_bin]
+                    if f is not None:
+                        np.savetxt(f, chunk[col][in_bin], fmt="%.10e")
+                offsets[key] = stop
+    finally:
+        for cols in outputs.values():
+            for arr, f in cols.values():
+                if arr is not None:
+                    arr.flush()
+                if f is not None:
+                    f.close()
+
+    synthetic = {"model": model, "size": size, "seed": seed}
+    gathered = {col: np.concatenate(arrays)
+                for col, arrays in gathered.items()}
+    if binary:
+        write_population(path, gathered, text=text, sort_by="Mstar",
+                         synthetic=synthetic)
+        for key, (subfolder, _, _, _) in MASS_BINS.items():
+            if key in outputs:
+                write_manifest(path+subfolder, counts[key],
+                               dict.fromkeys(outputs[key], np.float64),
+                               sources=list(outputs[key]) if text else (),
+                               synthetic=synthetic)
+    else:
+        order = np.argsort(gathered["Mstar"], kind="stable")
+        for col, arr in gathered.items():
+            np.savetxt(path+col+".dat", arr[order], fmt="%.10e")
+    return counts
+
+
+def _source_key(paths):
+    """
+    Return a string identifying the size and modification time of files.
+    """
+    key = []
+    for path in paths:
+        stat = os.stat(path)
+        key.append([os.path.basename(path), stat.st_size, stat.st_mtime_ns])
+    return json.dumps(key)
+
+
+def _column_files(path, names):
+    """
+    Return the files read by read_column for the given columns of a population.
+    """
+    manifest = read_manifest(path)
+    return [_column_file(path, name, manifest) for name in names]
+
+
+@phase("binning")
+def density_cube(model, data_path="../data/", age_step=0.1*20./6.,
+                 lmdot_step=0.1, lmdot_min=-13., mass_step=0.01, cache=True):
+    """
+    Return the age x log10(Mdot_acc) x Mstar histogram of a population.
+
+    The histogram is computed once on fixed edges (age in Myr starting at 0,
+    log10(Mdot_acc) starting at lmdot_min, and Mstar in bins (m, m+mass_step]
+    starting at 0) from the full sample of pop_<model>/ and its per-disc
+    Mstar column, so that density_panel can serve any mass range on these
+    edges; populations without an Mstar column are binned from their
+    stellar-mass subfolders, which then define the Mstar axis. The
+    full-sample histogram is stored separately in "full". The result is
+    cached in pop_<model>/density_cube.npz and recomputed only when the
+    population files change.
+    """
+    path = data_path+"pop_"+model+"/"
+    has_mstar = os.path.exists(_column_files(path, ["Mstar"])[0])
+    if has_mstar:
+        mass_bins = []
+        files = _column_files(path, ["Macc", "age", "Mstar"])
+    else:
+        mass_bins = [key for key in MASS_BINS if key != "full"]
+        files = [f for p in [path]+[path+MASS_BINS[key][0]
+                                    for key in mass_bins]
+                 for f in _column_files(p, ["Macc", "age"])]
+    source = _source_key(files)
+    cache_file = path+"density_cube.npz"
+
+    if cache and os.path.exists(cache_file):
+        cube = dict(np.load(cache_file))
+        if (str(cube["source"]) == source and cube["age_edges"][1] == age_step
+                and np.isclose(cube["lmdot_edges"][1]-cube["lmdot_edges"][0], lmdot_step)
+                and cube["lmdot_edges"][0] == lmdot_min
+                and float(cube.get("mass_step", np.nan)) == mass_step):
+            return cube
+
+    columns = []
+    for p in [path]+[path+MASS_BINS[key][0] for key in mass_bins]:
+        Macc = read_column(p, "Macc", rows=slice(None))
+        keep = Macc > 10**lmdot_min
+        columns.append((read_column(p, "age", rows=slice(None))[keep]/1e6,
+                        np.log10(Macc[keep])))
+
+    age_max = max(np.max(age, initial=0.) for age, _ in columns)
+    lmdot_max = max(np.max(lmdot, initial=lmdot_min) for _, lmdot in columns)
+    age_edges = age_step*np.arange(np.floor(age_max/age_step)+2)
+    lmdot_edges = lmdot_min + lmdot_step*np.arange(
+        np.floor((lmdot_max-lmdot_min)/lmdot_step)+2)
+
+    hists = [np.histogram2d(age, lmdot, bins=(age_edges, lmdot_edges))[0]
+             for age, lmdot in columns]
+    if has_mstar:
+        Mstar = read_column(path, "Mstar", rows=slice(None))
+        Mstar = Mstar[read_column(path, "Macc", rows=slice(None))
+                      > 10**lmdot_min]
+        mass_edges = np.round(mass_step*np.arange(
+            np.ceil(np.max(Mstar, initial=0.)/mass_step)+1), 10)
+        # bins (m, m+mass_step], as the stellar-mass bins of MASS_BINS
+        index = np.maximum(np.searchsorted(mass_edges, Mstar)-1, 0)
+        age, lmdot = columns[0]
+        counts = np.histogramdd(
+            (age, lmdot, index),
+            bins=(age_edges, lmdot_edges, np.arange(mass_edges.size)-0.5))[0]
+        counts = np.moveaxis(counts, -1, 0)
+    else:
+        mass_edges = np.array([MASS_BINS[mass_bins[0]][2]]
+                              + [MASS_BINS[key][3] for key in mass_bins])
+        counts = np.array(hists[1:])
+
+    cube = {
+        "age_edges": age_edges,
+        "lmdot_edges": lmdot_edges,
+        "mass_edges": mass_edges,
+        "mass_step": np.array(mass_step),
+        "counts": counts,
+        "full": hists[0],
+        "source": np.array(source),
+    }
+    if cache:
+        np.savez_compressed(cache_file, **cube)
+    return cube
+
+
+@phase("binning")
+def density_panel(cube, Mmin=None, Mmax=None, mask_val=None):
+    """
+    Return the stat='density' 2D histogram of a mass range of a density cube.
+
+    The stellar-mass bins of the cube in (Mmin, Mmax] are summed; with no
+    mass limits the full-sample histogram is returned. The limits must fall
+    on the mass edges of the cube (or beyond its range), otherwise
+    ValueError is raised. Accretion rates below mask_val are removed before
+    normalising, as mask_accretion would.
+    """
+    mass_edges = cube["mass_edges"]
+    if Mmin is None and Mmax is None:
+        counts = cube["full"].copy()
+    else:
+        Mmin = -np.inf if Mmin is None else Mmin
+        Mmax = np.inf if Mmax is None else Mmax
+        if mass_edges.size > 6:
+            edges = (f"{mass_edges[0]:g}-{mass_edges[-1]:g} Msun in steps of "
+                     f"{np.diff(mass_edges).min():g}")
+        else:
+            edges = ", ".join(f"{edge:g}" for edge in mass_edges)+" Msun"
+        for limit in (Mmin, Mmax):
+            inside = mass_edges[0] < limit < mass_edges[-1]
+            if inside and not np.isclose(mass_edges, limit).any():
+                raise ValueError(
+                    f"The mass range {Mmin:g}-{Mmax:g} Msun does not fall on "
+                    f"the stellar-mass edges of the density cube ({edges}).")
+        tol = 1.e-9
+        in_range = ((mass_edges[:-1] >= Mmin-tol)
+                    & (mass_edges[1:] <= Mmax+tol))
+        if not in_range.any():
+            raise ValueError(f"No stellar-mass bin of the density cube in "
+                             f"{Mmin:g}-{Mmax:g} Msun.")
+        counts = cube["counts"][in_range].sum(axis=0)
+
+    lmdot_edges = cube["lmdot_edges"]
+    if mask_val is not None:
+        counts[:, lmdot_edges[:-1] < np.log10(mask_val)-1.e-9] = 0.
+
+    area = np.outer(np.diff(cube["age_edges"]), np.diff(lmdot_edges))
+    return counts/(counts.sum()*area)
+
+
+def plot_density_panel(ax, cube, density, **kwargs):
+    """
+    Draw a density_panel on ax with age on x and Mdot_acc (log axis) on y.
+
+    Empty cells are left transparent as in sns.histplot.
+    """
+    return ax.pcolormesh(cube["age_edges"], 10**cube["lmdot_edges"],
+                         np.ma.masked_less_equal(density.T, 0.), **kwargs)
+
+
+def kde_bandwidth(x, bw_method="scott"):
+    """
+    Return the covariance (d, d) of the Gaussian kernel of a sample (n, d).
+
+    As scipy.stats.gaussian_kde (and so seaborn), this is the sample
+    covariance times the square of the Scott or Silverman factor; a scalar
+    bw_method is used as the factor. The bandwidth along each axis is the
+    square root of the diagonal.
+    """
+    x = np.asarray(x, dtype=float)
+    if x.ndim == 1:
+        x = x[:, None]
+    n, d = x.shape
+    if bw_method == "scott":
+        factor = n**(-1./(d+4))
+    elif bw_method == "silverman":
+        factor = (n*(d+2)/4.)**(-1./(d+4))
+    else:
+        factor = float(bw_method)
+    return factor**2*np.atleast_2d(np.cov(x, rowvar=False))
+
+
+def _linear_binning(x, grid):
+    """
+    Distribute each sample of x linearly between its two nearest grid points.
+
+    x is (n, d) and grid a list of d regularly spaced axes; returns the counts
+    on the grid.
+    """
+    shape = tuple(g.size for g in grid)
+    counts = np.zeros(shape)
+    index, frac = [], []
+    for k, g in enumerate(grid):
+        pos = (x[:, k] - g[0])/(g[1] - g[0])
+        i = np.clip(np.floor(pos).astype(np.int64), 0, g.size-2)
+        index.append(i)
+        frac.append(np.clip(pos - i, 0., 1.))
+
+    # loop over the 2**d corners of the cell holding each sample
+    for corner in np.ndindex(*(2,)*len(grid)):
+        weight = np.ones(x.shape[0])
+        flat = np.zeros(x.shape[0], dtype=np.int64)
+        for k, c in enumerate(corner):
+            weight *= frac[k] if c else 1. - frac[k]
+            flat = flat*shape[k] + index[k] + c
+        counts += np.bincount(flat, weights=weight,
+                              minlength=counts.size).reshape(shape)
+    return counts
+
+
+@phase("kde")
+def binned_kde(x, gridsize=200, bw_method="scott", bw_adjust=1.,
+               log_scale=False, cut=3., clip=None):
+    """
+    Gaussian KDE of a 1D or 2D sample evaluated by binning and FFT convolution.
+
+    The sample is linearly binned on a regular grid extending cut bandwidths
+    beyond the data and convolved with the Gaussian kernel of kde_bandwidth,
+    with the full covariance of the sample like gaussian_kde and truncated
+    at four bandwidths along each axis, so the cost is O(n + grid log grid)
+    instead of O(n x grid).
+    Axes with log_scale are estimated in log10 space, as seaborn does. The
+    binning and the convolution are done on the grid padded by four
+    bandwidths (and up to the whole sample), and the density is normalised
+    there by n times the kernel integral before cropping it to the grid, so
+    that like gaussian_kde it integrates to one over the whole space and not
+    over the grid, whatever cut and clip.
+
+    Returns the grid axes (in data units) and the density on the grid.
+    """
+    from scipy.signal import fftconvolve
+
+    x = np.asarray(x, dtype=float)
+    if x.ndim == 1:
+        x = x[:, None]
+    d = x.shape[1]
+    gridsize = np.broadcast_to(gridsize, d)
+    log_scale = np.broadcast_to(log_scale, d)
+
+    x = np.array([np.log10(col) if log else col
+                  for col, log in zip(x.T, log_scale)]).T
+    x = x[np.all(np.isfinite(x), axis=1)]
+    cov = bw_adjust**2*kde_bandwidth(x, bw_method)
+    bw = np.sqrt(np.diag(cov))
+
+    grid, padded, crop = [], [], []
+    for k in range(d):
+        lo, hi = x[:, k].min() - cut*bw[k], x[:, k].max() + cut*bw[k]
+        if clip is not None and clip[k] is not None:
+            lo, hi = max(lo, clip[k][0]), min(hi, clip[k][1])
+        grid.append(np.linspace(lo, hi, gridsize[k]))
+        # same spacing, extended to four bandwidths beyond the sample
+        dx = grid[k][1] - grid[k][0]
+        below = max(int(np.ceil((lo - x[:, k].min() + 4.*bw[k])/dx)), 0)
+        above = max(int(np.ceil((x[:, k].max() + 4.*bw[k] - hi)/dx)), 0)
+        padded.append(lo + dx*np.arange(-below, gridsize[k]+above))
+        crop.append(slice(below, below+gridsize[k]))
+
+    counts = _linear_binning(x, padded)
+
+    # kernel on the offsets of the grid, exp(-v.cov^-1.v/2)
+    offsets = []
+    for k, g in enumerate(padded):
+        dx = g[1] - g[0]
+        half = min(int(np.ceil(4.*bw[k]/dx)), g.size-1)
+        offsets.append(dx*np.arange(-half, half+1))
+    v = np.stack(np.meshgrid(*offsets, indexing="ij"), axis=-1)
+    kernel = np.exp(-0.5*np.einsum("...i,ij,...j", v, np.linalg.inv(cov), v))
+
+    density = np.clip(fftconvolve(counts, kernel, mode='same'), 0., None)
+    cell = np.prod([g[1] - g[0] for g in padded])
+    density = density[tuple(crop)]/(x.shape[0]*kernel.sum()*cell)
+
+    grid = [10**g if log else g for g, log in zip(grid, log_scale)]
+    return grid, density
+
+
+def kde_levels(density, levels=10, thresh=0.05):
+    """
+    Return density contour levels enclosing evenly spaced probability masses.
+
+    Mirrors the iso-proportion levels of sns.kdeplot: the lowest level leaves
+    out the thresh fraction of the probability mass.
+    """
+    values = np.sort(density.ravel())
+    cumulative = np.cumsum(values)
+    cumulative /= cumulative[-1]
+    quantiles = np.linspace(thresh, 1., levels)
+    idx = np.clip(np.searchsorted(cumulative, quantiles), 0, values.size-1)
+    return np.unique(values[idx])
+
+
+@phase("kde")
+def kde_curves(x, hue=None, gridsize=200, bw_method="scott", bw_adjust=1.,
+               log_scale=False, cut=0., common_norm=True):
+    """
+    Return 1D binned KDE curves of a sample, optionally split in hue groups.
+
+    Matches the kde=True line of sns.histplot(stat='density'): the curves
+    are densities (per dex for log_scale) cut at the data range by default,
+    and with common_norm each group is weighted by its share of the sample.
+    Returns a dict {group: (grid, density)} in order of appearance, with a
+    single None group when hue is not given.
+    """
+    x = np.asarray(x, dtype=float)
+    if hue is None:
+        groups = {None: x}
+    else:
+        hue = np.asarray(hue)
+        groups = {key: x[hue == key] for key in dict.fromkeys(hue)}
+
+    n_total = sum(np.count_nonzero(np.isfinite(g)) for g in groups.values())
+    curves = {}
+    for key, sample in groups.items():
+        sample = sample[np.isfinite(sample)]
+        if sample.size < 2:
+            continue
+        (grid,), density = binned_kde(sample, gridsize=gridsize,
+                                      bw_method=bw_method, bw_adjust=bw_adjust,
+                                      log_scale=log_scale, cut=cut)
+        if common_norm:
+            density *= sample.size/n_total
+        curves[key] = (grid, density)
+    return curves
+
+
+def plot_kde_curves(ax, curves, colors=None, **kwargs):
+    """
+    Overlay kde_curves on ax, cycling through colors (the current palette by
+    default) in the same order as the hue groups of sns.histplot.
+    """
+    import seaborn as sns
+    if colors is None:
+        colors = sns.color_palette()
+    lines = []
+    for color, (grid, density) in zip(colors, curves.values()):
+        lines += ax.plot(grid, density, color=color, **kwargs)
+    return lines
+
+
+def setup_plots():
+    """
+    Switch to draft rendering if requested; call after setting the rc params.
+
+    In draft mode the Agg backend is used and LaTeX is replaced by mathtext,
+    otherwise nothing changes.
+    """
+    if DRAFT:
+        import matplotlib.pyplot as plt
+        plt.switch_backend("Agg")
+        plt.rcParams["text.usetex"] = False
+
+
+def rasterize_dense(fig, threshold=1000):
+    """
+    Mark the dense layers of a figure to be rasterized in vector output.
+
+    Meshes (2D histograms), filled contours and any collection or marker line
+    with more than threshold points or vertices are rasterized, while axes,
+    text and light artists stay vector.
+    """
+    from matplotlib.collections import Collection, QuadMesh
+    from matplotlib.lines import Line2D
+
+    for artist in fig.findobj(lambda a: isinstance(a, (Collection, Line2D))):
+        if isinstance(artist, QuadMesh):
+            size = np.inf
+        elif isinstance(artist, Line2D):
+            size = (len(artist.get_xdata())
+                    if artist.get_marker() not in (None, "None", "", " ")
+                    else 0)
+        else:
+            size = max(len(artist.get_offsets()),
+                       sum(len(path.vertices) for path in artist.get_paths()))
+        if size > threshold:
+            artist.set_rasterized(True)
+
+
+@phase("savefig")
+def savefig(fig, fname, **kwargs):
+    """
+    Save a figure as fig.savefig does, or as a low-DPI draft.
+
+    Drafts are written next to the final figure with a _draft suffix, with
+    the labels made mathtext-compatible (LaTeX accepts a doubled backslash
+    before a command, mathtext does not). If FORMATS is set the figure is
+    written in those formats instead of the one of fname; for vector formats
+    the dense layers are rasterized at the requested dpi (rasterize_dense).
+    """
+    root, ext = os.path.splitext(fname)
+    formats = FORMATS or [kwargs.get("format") or ext[1:]]
+
+    if DRAFT:
+        from matplotlib.text import Text
+        for text in fig.findobj(Text):
+            label = text.get_text()
+            if "\\\\" in label:
+                text.set_text(label.replace("\\\\", "\\"))
+        root += "_draft"
+        kwargs["dpi"] = DRAFT_DPI
+
+    if any(fmt in VECTOR_FORMATS for fmt in formats):
+        rasterize_dense(fig)
+
+    for fmt in formats:
+        kwargs["format"] = fmt
+        fig.savefig(root+"."+fmt, **kwargs)
@@ -0,0 +1,370 @@
+"""
+Script to build all the figures of the paper in parallel.
+
+Each figure script is run in its own process from the scripts/ folder, as
+they expect, once the inputs it shares with other figures (the density cubes
+of the populations) have been computed. Independent figures run concurrently
+and the wall time of every step is reported at the end.
+
+A figure is rebuilt only when the content hash of its data inputs, of its
+script or of the lib functions it uses has changed since the last build
+(recorded in figures/build_hashes.json), or when its output is missing;
+the reason is printed for every rebuilt figure. Figures writing the same
+file (figure_7 and figure_72 both write Fig7.png, figure_72 last) are rebuilt
+together whenever one of them is, so the file is always the output of the
+last one. --force rebuilds everything.
+--draft renders quick low-DPI previews (Fig*_draft.png, see lib.DRAFT),
+which are always rebuilt and never recorded. --format pdf (or svg, or a comma
+separated list) writes the figures in those formats instead of png, with the
+dense layers rasterized (see lib.savefig); each format is tracked separately.
+
+    python make_figures.py [-j N] [--force] [--draft] [--format pdf]
+                           [figure_1 figure_61 ...]
+"""
+import argparse
+import ast
+import glob
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+scripts_path = os.path.dirname(os.path.abspath(__file__))+"/"
+data_path = scripts_path+"../data/"
+fig_path = scripts_path+"../figures/"
+hash_file = fig_path+"build_hashes.json"
+
+LX_TABLES = ["LxfuncONC025.dat", "LxfuncONC05.dat", "LxfuncONC1.dat"]
+LOW_ACC = ["low_accretors.dat"]
+MAMAJEK = ["disc_fraction_Mamajek2009.csv"]
+
+
+def _pops(models, columns, bins=("", "03Msun/", "06Msun/", "1Msun/")):
+    return ["pop_"+model+"/"+sub+col+".*"
+            for model in models for sub in bins for col in columns]
+
+
+# inputs are glob patterns relative to data/, "after" lists the steps that
+# must be finished first (shared caches, or scripts writing the same file)
+FIGURES = {
+    "figure_1": {"inputs": LX_TABLES + LOW_ACC + MAMAJEK,
+                 "outputs": ["Fig1.png"]},
+    "figure_2": {"inputs": LX_TABLES, "outputs": ["Fig2.png"]},
+    "figure_3": {"inputs": LX_TABLES, "outputs": ["Fig3.png"]},
+    "figure_4": {"inputs": LX_TABLES, "outputs": ["Fig4.png"]},
+    "figure_5": {"inputs": _pops(["FUV"], ["r1", "md", "alpha"], bins=("",)),
+                 "outputs": ["Fig51.png"]},
+    "figure_6": {"inputs": _pops(["EUV", "XEUV"], ["Macc", "age"]) + LOW_ACC,
+                 "outputs": ["Fig6.png"],
+                 "after": ["cube_EUV", "cube_XEUV"]},
+    "figure_61": {"inputs": _pops(["EUV", "XEUV"], ["Macc", "age"]) + LOW_ACC,
+                  "outputs": ["Fig61.png"],
+                  "after": ["cube_EUV", "cube_XEUV"]},
+    "Figure_62": {"inputs": _pops(["EUV", "XEUV", "FUV"], ["Macc", "age"])
+                  + LOW_ACC,
+                  "outputs": ["Fig62.png"],
+                  "after": ["cube_EUV", "cube_XEUV", "cube_FUV"]},
+    "figure_7": {"inputs": _pops(["EUV", "XEUV", "FUV"], ["Macc", "age"])
+                 + LOW_ACC,
+                 "outputs": ["Fig7.png"]},
+    "figure_72": {"inputs": _pops(["EUV", "XEUV"], ["Macc", "age"]) + LOW_ACC,
+                  "outputs": ["Fig7.png"],
+                  "after": ["figure_7"]},
+    "figure_8": {"inputs": _pops(["EUV", "XEUV", "FUV"], ["Macc", "age", "frac"])
+                 + MAMAJEK,
+                 "outputs": ["Fig81.png"]},
+}
+
+# steps computing data shared by several figures
+SHARED = {
+    "cube_"+model: {"inputs": _pops([model], ["Macc", "age"]), "model": model}
+    for model in ["EUV", "XEUV", "FUV"]
+}
+
+
+def input_files(step):
+    """
+    Return the data files matched by the input patterns of a step.
+    """
+    files = []
+    for pattern in step["inputs"]:
+        files += sorted(glob.glob(data_path+pattern))
+    return files
+
+
+def missing_inputs(step):
+    """
+    Return the input patterns of a step that match no file.
+    """
+    return [pattern for pattern in step["inputs"]
+            if not glob.glob(data_path+pattern)]
+
+
+def file_hash(path, known=None):
+    """
+    Return the sha256 of a file, reusing the hash stored in known when the
+    size and modification time of the file did not change.
+    """
+    stat = os.stat(path)
+    if known is not None:
+        entry = known.get(path)
+        if entry and entry[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return entry[2]
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    digest = sha.hexdigest()
+    if known is not None:
+        known[path] = [stat.st_size, stat.st_mtime_ns, digest]
+    return digest
+
+
+def lib_sources():
+    """
+    Return the source and the referenced names of every top-level definition
+    of lib.py.
+    """
+    with open(scripts_path+"lib.py") as f:
+        source = f.read()
+    defs = {}
+    for node in ast.parse(source).body:
+        if isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+            names = [node.name]
+        elif isinstance(node, ast.Assign):
+            names = [t.id for t in node.targets if isinstance(t, ast.Name)]
+        else:
+            continue
+        used = {n.id for n in ast.walk(node) if isinstance(n, ast.Name)}
+        for name in names:
+            defs[name] = (ast.get_source_segment(source, node), used)
+    return defs
+
+
+def lib_dependencies(script, defs):
+    """
+    Return the lib definitions a script imports, and those they use in turn.
+    """
+    with open(scripts_path+script+".py") as f:
+        tree = ast.parse(f.read())
+    todo = [alias.name for node in ast.walk(tree)
+            if isinstance(node, ast.ImportFrom) and node.module == "lib"
+            for alias in node.names]
+    deps = set()
+    while todo:
+        name = todo.pop()
+        if name in deps or name not in defs:
+            continue
+        deps.add(name)
+        todo += [used for used in defs[name][1] if used in defs]
+    return sorted(deps)
+
+
+def figure_hashes(name, defs, known=None):
+    """
+    Return the hash of every component a figure depends on: its script, the
+    lib definitions it uses and its data files.
+    """
+    hashes = {"script "+name+".py": file_hash(scripts_path+name+".py", known)}
+    for dep in lib_dependencies(name, defs):
+        hashes["lib."+dep] = hashlib.sha256(defs[dep][0].encode()).hexdigest()
+    for path in input_files(FIGURES[name]):
+        hashes["data/"+os.path.relpath(path, data_path)] = file_hash(path, known)
+    return hashes
+
+
+def outputs(name, formats=None):
+    """
+    Return the files a figure writes, in the given formats if any.
+    """
+    if not formats:
+        return FIGURES[name]["outputs"]
+    return [os.path.splitext(out)[0]+"."+fmt
+            for out in FIGURES[name]["outputs"] for fmt in formats]
+
+
+def shared_outputs(name):
+    """
+    Return the other figures writing one of the files a figure writes.
+    """
+    return [other for other in FIGURES if other != name and
+            set(FIGURES[other]["outputs"]) & set(FIGURES[name]["outputs"])]
+
+
+def rebuild_reasons(name, hashes, record, formats=None):
+    """
+    Return why a figure has to be rebuilt, or an empty list if it is current.
+    """
+    missing = [out for out in outputs(name, formats)
+               if not os.path.exists(fig_path+out)]
+    if missing:
+        return ["missing output "+", ".join(missing)]
+    if record is None:
+        return ["no previous build recorded"]
+    reasons = [key+" changed" for key in hashes
+               if key in record and record[key] != hashes[key]]
+    reasons += [key+" added" for key in hashes if key not in record]
+    reasons += [key+" removed" for key in record if key not in hashes]
+    return reasons
+
+
+def _run_figure(name, env=None):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, name+".py"], cwd=scripts_path,
+                            capture_output=True, text=True, env=env)
+    return result.returncode, result.stderr, time.perf_counter()-start
+
+
+def _run_shared(name):
+    start = time.perf_counter()
+    sys.path.insert(0, scripts_path)
+    from lib import density_cube
+    try:
+        density_cube(SHARED[name]["model"], data_path=data_path)
+    except Exception as err:
+        return 1, repr(err), time.perf_counter()-start
+    return 0, "", time.perf_counter()-start
+
+
+def build(names, jobs=None, env=None, verbose=True):
+    """
+    Build the given figures, running independent steps in a process pool.
+
+    Returns {step: (return code, stderr, wall time)} for every step that ran.
+    """
+    steps = {}
+    for name in names:
+        after = [dep for dep in FIGURES[name].get("after", [])
+                 if dep in SHARED or dep in names]
+        steps[name] = after
+        for dep in after:
+            if dep in SHARED:
+                steps[dep] = []
+
+    results = {}
+    skipped = set()
+    for name in steps:
+        step = FIGURES.get(name, SHARED.get(name))
+        missing = missing_inputs(step)
+        if missing:
+            skipped.add(name)
+            results[name] = (None, "missing inputs: "+", ".join(missing), 0.)
+
+    pending = {name: deps for name, deps in steps.items() if name not in skipped}
+    running = {}
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        while pending or running:
+            for name, deps in list(pending.items()):
+                # a failed figure only orders the next one, a failed shared
+                # step leaves its dependants without input
+                if any(dep in SHARED and (dep in skipped or
+                                          (dep in results and results[dep][0]))
+                       for dep in deps):
+                    skipped.add(name)
+                    results[name] = (None, "a prerequisite failed", 0.)
+                    del pending[name]
+                elif all(dep in results for dep in deps):
+                    if name in SHARED:
+                        running[pool.submit(_run_shared, name)] = name
+                    else:
+                        running[pool.submit(_run_figure, name, env)] = name
+                    del pending[name]
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name] = future.result()
+                if verbose:
+                    code, err, wall = results[name]
+                    status = "ok" if code == 0 else "FAILED"
+                    print(f"{name:12s} {status:7s} {wall:8.2f} s", flush=True)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("figures", nargs="*", default=list(FIGURES),
+                        help="figure scripts to build (default: all)")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of parallel processes")
+    parser.add_argument("--force", action="store_true",
+                        help="rebuild figures even if they are up to date")
+    parser.add_argument("--draft", action="store_true",
+                        help="render low-DPI drafts without LaTeX")
+    parser.add_argument("--format", default="",
+                        help="comma separated output formats, e.g. pdf,svg")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.figures if name not in FIGURES]
+    if unknown:
+        parser.error("unknown figures: "+", ".join(unknown))
+
+    if os.path.exists(hash_file):
+        with open(hash_file) as f:
+            cache = json.load(f)
+    else:
+        cache = {"files": {}, "figures": {}}
+
+    formats = [fmt for fmt in args.format.split(",") if fmt]
+    # builds in other formats than png are recorded as figure.format
+    suffix = "".join("."+fmt for fmt in formats)
+
+    defs = lib_sources()
+    hashes, todo = {}, []
+    for name in args.figures:
+        if missing_inputs(FIGURES[name]):
+            todo.append(name)
+            continue
+        hashes[name] = figure_hashes(name, defs, cache["files"])
+        reasons = rebuild_reasons(name, hashes[name],
+                                  cache["figures"].get(name+suffix), formats)
+        if args.force or args.draft:
+            reasons = ["--draft" if args.draft else "--force"]
+        if reasons:
+            print(f"{name}: rebuilding, "+"; ".join(reasons))
+            todo.append(name)
+        else:
+            print(f"{name}: up to date")
+
+    # figures sharing an output are rebuilt as one unit, in FIGURES order so
+    # that the "after" ordering between them holds
+    for name in list(todo):
+        for other in shared_outputs(name):
+            if other not in todo:
+                print(f"{other}: rebuilding with {name}, both write "
+                      + ", ".join(outputs(other, formats)))
+                todo.append(other)
+                if not missing_inputs(FIGURES[other]):
+                    hashes[other] = figure_hashes(other, defs, cache["files"])
+    todo.sort(key=list(FIGURES).index)
+
+    env = dict(os.environ)
+    if args.draft:
+        env["LOW_ACCRETORS_DRAFT"] = "1"
+    env["LOW_ACCRETORS_FORMAT"] = ",".join(formats)
+
+    start = time.perf_counter()
+    results = build(todo, jobs=args.jobs, env=env)
+
+    for name, (code, err, wall) in results.items():
+        if code == 0 and name in hashes and not args.draft:
+            cache["figures"][name+suffix] = hashes[name]
+    os.makedirs(fig_path, exist_ok=True)
+    with open(hash_file, "w") as f:
+        json.dump(cache, f, indent=1)
+
+    print(f"\n{'step':12s} {'status':7s} {'wall':>10s}")
+    for name, (code, err, wall) in results.items():
+        status = "skipped" if code is None else ("ok" if code == 0 else "FAILED")
+        print(f"{name:12s} {status:7s} {wall:8.2f} s")
+        if code:
+            print("    "+err.strip().splitlines()[-1] if err.strip() else "")
+        elif code is None:
+            print("    "+err)
+    print(f"total wall time {time.perf_counter()-start:.2f} s")
+
+    sys.exit(any(code for code, _, _ in results.values()))
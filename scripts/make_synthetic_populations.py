@@ -0,0 +1,56 @@
+"""
+Script to write synthetic stand-ins for the population synthesis outputs.
+
+The pop_EUV, pop_XEUV and pop_FUV folders read by the figure scripts are not
+part of the repository; this writes statistically plausible replacements of
+any size (see lib.write_synthetic_population) in the text layout, the binary
+layout of convert_populations.py, or both, so that every figure can be built
+and benchmarked locally. Folders without the synthetic tag in their manifest
+(real populations, or synthetic ones written as text only) are not
+overwritten unless --force is given.
+
+    python make_synthetic_populations.py [--size 1e6] [--seed 0] [--text]
+                                         [--no-binary] [--models EUV FUV]
+                                         [--data-path ../data/] [--force]
+"""
+import argparse
+import os
+import sys
+import time
+
+from lib import MODELS, read_manifest, write_synthetic_population
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--size", type=float, default=1e4,
+                        help="number of discs of each population")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--text", action="store_true",
+                        help="also write the .dat text columns")
+    parser.add_argument("--no-binary", action="store_true",
+                        help="do not write the .npy binary columns")
+    parser.add_argument("--models", nargs="*", default=MODELS, choices=MODELS)
+    parser.add_argument("--data-path", default="../data/")
+    parser.add_argument("--force", action="store_true",
+                        help="overwrite populations that are not synthetic")
+    args = parser.parse_args()
+
+    if args.no_binary and not args.text:
+        parser.error("nothing to write with --no-binary and without --text")
+
+    for model in args.models:
+        path = args.data_path+"pop_"+model+"/"
+        manifest = read_manifest(path)
+        real = os.path.isdir(path) and (manifest is None
+                                        or "synthetic" not in manifest)
+        if real and os.listdir(path) and not args.force:
+            print(path, "holds a population that is not synthetic, "
+                  "use --force to overwrite it", file=sys.stderr)
+            sys.exit(1)
+
+        start = time.perf_counter()
+        counts = write_synthetic_population(
+            path, model, int(args.size), seed=args.seed, text=args.text,
+            binary=not args.no_binary, data_path=args.data_path)
+        print(path, ", ".join(f"{key} {rows}" for key, rows in counts.items()),
+              f"({time.perf_counter()-start:.1f} s)")
@@ -0,0 +1,222 @@
+"""
+Script to run the population synthesis of a photoevaporation model.
+
+The discs of a population are drawn from the population spec of the paper
+(stellar masses from the IMF, log Lx from the COUP XLFs for XEUV and log Phi
+around Phi_Mstar otherwise, the radius and luminosity of the stars from
+lib.stellar_properties, and alpha, R1 and the disc mass from the relations of
+Table 2), split in chunks of --chunk-size discs and evolved with disc.py and
+the winds of winds.py in a pool of --workers processes. Every finished chunk
+is saved to the work folder (pop_<model>.chunks/ next to the output by
+default), so that an interrupted run started again with the same options only
+evolves the missing chunks. The chunks are then merged into the pop_<model>
+layout read by lib.load_data (full sample sorted by stellar mass, with the
+per-disc Mstar, flux, Rstar, Lstar, r1, md, alpha and t_disp, and the
+stellar-mass subfolders). Each chunk has its own random stream spawned from
+--seed, so the population does not depend on the number of workers.
+
+    python run_population.py EUV [--size 10000] [--chunk-size 100]
+                             [--workers 8] [--seed 0] [--data-path ../data/]
+                             [--scheme crank-nicolson] [--text] [--force]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from disc import (evolve_discs_lbp, lbp_accretion, radial_grid, viscosity,
+                  write_disc_population)
+from lib import (MODELS, chunk_streams, load_XLF, read_manifest, sample_IMF,
+                 sample_Lx, sample_Phi, stellar_properties)
+from winds import (euv_profile, euv_wind, fuv_luminosity, fuv_profile,
+                   fuv_wind, wind_rate, xray_profile)
+
+# output times of the accretion histories (yr)
+TIMES = np.linspace(0., 2.e7, 201)
+
+
+def draw_discs(model, size, seed_seq, XLF=None):
+    """
+    Draw the stars and the disc parameters of size discs of a model.
+
+    Returns a dict of per-disc arrays: Mstar (Msun), flux (log Lx for XEUV,
+    log Phi otherwise), Rstar (Rsun), Lstar (Lsun), alpha, r1 (au) and md
+    (disc mass in units of Mstar).
+    """
+    rng = np.random.default_rng(seed_seq)
+    Mstar = sample_IMF(size, rng=rng)
+    Rstar, Lstar = stellar_properties(Mstar)
+    if model == "XEUV":
+        flux = sample_Lx(Mstar, XLF, rng=rng)
+    else:
+        flux = sample_Phi(Mstar, rng=rng)
+
+    if model == "EUV":
+        # eq. (r1_alpha)
+        alpha = 10**rng.uniform(-4., -2., size)
+        md = rng.uniform(0.01, 0.1, size)
+        r1 = 60.4*alpha + 3009.7*md + 226.6
+    elif model == "XEUV":
+        alpha = 10**rng.uniform(-4., -2., size)
+        r1 = rng.uniform(10., 100., size)
+        md = np.full(size, 0.1)
+    elif model == "FUV":
+        # eq. (r1_alpha_Md)
+        r1 = rng.uniform(10., 100., size)
+        md = rng.uniform(0.01, 0.1, size)
+        alpha = 10**(-9.41 + 1.678*np.log10(r1) - 1.211*np.log10(md))
+    else:
+        raise ValueError(f"Unknown model {model}.")
+    return {"Mstar": Mstar, "flux": flux, "Rstar": Rstar, "Lstar": Lstar,
+            "alpha": alpha, "r1": r1, "md": md}
+
+
+def model_wind(model, grid, discs):
+    """
+    Return the wind of the discs of a model for evolve_discs, and its
+    integrated rate (Msun/yr) while the discs are primordial.
+
+    discs holds the per-disc arrays of draw_discs. The FUV wind depends on
+    the accretion rate of the disc and on the radius Rstar (Rsun) and
+    luminosity Lstar (Lsun) of the stars (see winds.fuv_wind); its rate
+    while primordial is the one at the initial accretion rate, the largest.
+    """
+    R, edges = grid
+    Mstar = discs["Mstar"]
+    if model == "EUV":
+        return (euv_wind(R, Mstar, discs["flux"]),
+                wind_rate(euv_profile(R, Mstar, discs["flux"]), edges))
+    if model == "XEUV":
+        wind = xray_profile(R, edges, Mstar, discs["flux"])
+        return wind, wind_rate(wind, edges)
+    Rstar, Lstar = discs["Rstar"], discs["Lstar"]
+    wind = fuv_wind(R, edges, Mstar, viscosity(R, discs["alpha"], Mstar),
+                    Rstar, Lstar)
+    Macc = lbp_accretion([0.], discs["md"]*Mstar, discs["r1"], discs["alpha"],
+                         Mstar)[0][:, 0]
+    L_FUV = fuv_luminosity(Mstar, Macc, Rstar, Lstar)
+    return wind, wind_rate(fuv_profile(R, edges, Mstar, L_FUV), edges)
+
+
+def run_chunk(model, size, seed_seq, fname, XLF=None, scheme="crank-nicolson"):
+    """
+    Draw and evolve a chunk of discs and save them to fname (.npz).
+
+    The file is written under a temporary name and renamed once complete, so
+    a chunk file always holds a finished chunk.
+    """
+    discs = draw_discs(model, size, seed_seq, XLF)
+    grid = radial_grid()
+    wind, Mdot_wind = model_wind(model, grid, discs)
+    result = evolve_discs_lbp(discs["md"]*discs["Mstar"], discs["r1"],
+                              discs["alpha"], discs["Mstar"], wind,
+                              Mdot_wind=Mdot_wind, times=TIMES, grid=grid,
+                              scheme=scheme)
+    with open(fname+".part", "wb") as f:
+        np.savez(f, Macc=result["Macc"], Md=result["Md"],
+                 t_disp=result["t_disp"], **discs)
+    os.replace(fname+".part", fname)
+    return fname
+
+
+def merge_chunks(path, fnames, text=False, **meta):
+    """
+    Merge the chunk files into the pop_* folder path, see
+    disc.write_disc_population. Returns the number of rows of every folder.
+    """
+    chunks = [np.load(fname) for fname in fnames]
+    merged = {key: np.concatenate([chunk[key] for chunk in chunks])
+              for key in chunks[0].files}
+    result = {"times": TIMES, "Macc": merged["Macc"], "Md": merged["Md"],
+              "t_disp": merged["t_disp"]}
+    params = {key: merged[key]
+              for key in ("flux", "Rstar", "Lstar", "r1", "md", "alpha")}
+    return write_disc_population(path, result, merged["Mstar"], params=params,
+                                 text=text, **meta)
+
+
+def run_population(path, model, size, chunk_size=100, seed=0, workers=None,
+                   work_path=None, scheme="crank-nicolson", text=False,
+                   data_path="../data/", verbose=True):
+    """
+    Run the population synthesis of a model in a process pool and write it
+    to the pop_* folder path, resuming from the chunks already in work_path.
+
+    work_path keeps the spec of the run (spec.json) and one file per chunk; a
+    run with a different spec in the same work_path raises ValueError.
+    """
+    if work_path is None:
+        work_path = path.rstrip("/")+".chunks/"
+    spec = {"model": model, "size": size, "chunk_size": chunk_size,
+            "seed": seed, "scheme": scheme}
+    os.makedirs(work_path, exist_ok=True)
+    if os.path.exists(work_path+"spec.json"):
+        with open(work_path+"spec.json") as f:
+            if json.load(f) != spec:
+                raise ValueError(f"{work_path} holds chunks of another run.")
+    else:
+        with open(work_path+"spec.json", "w") as f:
+            json.dump(spec, f, indent=1)
+
+    streams = chunk_streams(size, chunk_size, MODELS.index(model), seed=seed)
+    sizes = [stop-start for start, stop, _ in streams]
+    seeds = [seed_seq for _, _, seed_seq in streams]
+    fnames = [work_path+f"chunk_{i:06d}.npz" for i in range(len(sizes))]
+    todo = [i for i, fname in enumerate(fnames) if not os.path.exists(fname)]
+    if verbose and len(todo) < len(fnames):
+        print(f"{len(fnames)-len(todo)} of {len(fnames)} chunks already done")
+
+    XLF = load_XLF(data_path) if model == "XEUV" else None
+    start = time.perf_counter()
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(run_chunk, model, sizes[i], seeds[i], fnames[i],
+                               XLF, scheme) for i in todo]
+        for done, future in enumerate(as_completed(futures), 1):
+            future.result()
+            if verbose:
+                print(f"chunk {done}/{len(todo)} "
+                      f"({time.perf_counter()-start:.0f} s)", flush=True)
+    return merge_chunks(path, fnames, text=text, run=spec)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("model", choices=MODELS)
+    parser.add_argument("--size", type=float, default=1e4,
+                        help="number of discs of the population")
+    parser.add_argument("--chunk-size", type=int, default=100,
+                        help="discs evolved together and saved per chunk")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes (default: one per core)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scheme", default="crank-nicolson",
+                        choices=["explicit", "crank-nicolson", "implicit"])
+    parser.add_argument("--data-path", default="../data/")
+    parser.add_argument("--work-path", default=None,
+                        help="folder of the chunks (default: pop_<model>.chunks/)")
+    parser.add_argument("--text", action="store_true",
+                        help="also write the .dat text columns")
+    parser.add_argument("--force", action="store_true",
+                        help="overwrite a population that was not run here")
+    args = parser.parse_args()
+
+    path = args.data_path+"pop_"+args.model+"/"
+    manifest = read_manifest(path)
+    ours = manifest is not None and "run" in manifest
+    if os.path.isdir(path) and os.listdir(path) and not ours and not args.force:
+        print(path, "holds a population that was not written by this script, "
+              "use --force to overwrite it", file=sys.stderr)
+        sys.exit(1)
+
+    start = time.perf_counter()
+    counts = run_population(path, args.model, int(args.size),
+                            chunk_size=args.chunk_size, seed=args.seed,
+                            workers=args.workers, work_path=args.work_path,
+                            scheme=args.scheme, text=args.text,
+                            data_path=args.data_path)
+    print(path, ", ".join(f"{key} {rows}" for key, rows in counts.items()),
+          f"({time.perf_counter()-start:.1f} s)")
@@ -0,0 +1,345 @@
+"""
+Photoevaporative wind profiles for the disc evolution of disc.py.
+
+Every profile is the surface mass-loss rate Sigma_w (Msun/au^2/yr) of N discs
+on a radial grid, a (disc x radius) array. It is split into a normalisation
+per star, computed once from Mstar and log Phi or log Lx, and a dimensionless
+radial shape on the grid, cached, so that evaluating the wind at every step of
+evolve_discs costs a multiplication:
+
+- EUV: the diffuse field of Hollenbach et al. (1994) and Font et al. (2004)
+  while the disc is primordial, and the direct field of Alexander et al.
+  (2006) once the inner disc has drained (euv_wind, a function of the surface
+  density);
+- X-ray: the profiles fitted by Picogna et al. (2021) for 0.1, 0.3, 0.5 and
+  1 Msun, with the total rate of Ercolano et al. (2021) (xray_profile);
+- FUV: an approximation of the profile of Komaki et al. (2021) for a 1 Msun
+  star, a tapered power law whose rate grows with the FUV luminosity of the
+  star, the sum of the accretion and chromospheric components of eqs.
+  (fuvacc) and (fuvchr), scaled as Mstar^2.06 (fuv_wind, a function of the
+  accretion rate of the disc).
+"""
+import numpy as np
+
+from disc import AU, GM_SUN, M_H, YR, diffusion_operator, sound_speed2
+
+# Msun in g and the conversion of a rate in g/cm^2/s to Msun/au^2/yr
+M_SUN = 1.98847e33
+CGS_RATE = AU**2*YR/M_SUN
+
+# EUV: mean molecular weight and sound speed (cm/s) of the ionised gas, case-B
+# recombination coefficient (cm^3/s), and the constants of the diffuse
+# (C1, A, B, D) and direct (C2, a) fits
+MU_ION = 1.35
+CS_ION = 1.e6
+ALPHA_B = 2.6e-13
+EUV_C1 = 0.14
+EUV_A = 0.3423
+EUV_B = 0.3612
+EUV_D = 0.2457
+EUV_C2 = 0.235
+EUV_SLOPE = 2.42
+# column density (Msun/au^2) below which the gas is optically thin to the
+# ionising photons, m_H/sigma_13.6eV
+SIGMA_THIN = M_H/6.3e-18*AU**2/M_SUN
+
+# X-ray: total rate of a 1 Msun star, the fit of the rate to the soft X-ray
+# luminosity, and the coefficients a...g of log(Mdot(<R)/Mdot_w) as a
+# polynomial of log R for the stellar masses of Picogna et al. (2021)
+XRAY_MDOT_1MSUN = 3.93e-8
+XRAY_LSOFT = (-1.947e17, -1.572e-4, -0.2866, -6.694)
+XRAY_PROFILES = {
+    0.1: (-3.8337, 22.9100, -55.1282, 67.8919, -45.0138, 16.2977, -3.5426),
+    0.3: (-1.3206, 13.0475, -53.6990, 117.6027, -144.3769, 94.7854, -26.7363),
+    0.5: (-1.2320, 10.8505, -38.6939, 71.2489, -71.4279, 37.8707, -9.3508),
+    1.0: (-0.6344, 6.3587, -26.1445, 56.4477, -67.7403, 43.9212, -13.2316),
+}
+
+# FUV: luminosity (Lsun) of the accretion hot spots for Mstar = 1 Msun,
+# Rstar = 1 Rsun and an accretion rate of 1e-8 Msun/yr, fraction of the
+# stellar luminosity emitted by the chromosphere, and stellar-mass slope of
+# the total rate
+FUV_ACC = 1.e-2
+FUV_CHR = 10**-3.3
+FUV_MASS_SLOPE = 2.06
+# FUV profile, an approximation of eq. A1 of Komaki et al. (2021), whose
+# Table 3 coefficients are not reproduced here: total rate (Msun/yr) of a
+# 1 Msun star at the FUV luminosity FUV_LUM_REF (Lsun), about the
+# chromospheric one, and its slope with L_FUV; sound speed (cm/s) of the
+# FUV-heated gas; and the shape Sigma_w ~ x^-FUV_SLOPE exp(-x) of x = R/Rg
+# outside FUV_X_MIN, with Rg the gravitational radius of the heated gas
+FUV_MDOT_1MSUN = 3.e-8
+FUV_LUM_REF = 1.e-3
+FUV_LUM_SLOPE = 0.5
+FUV_CS = 3.e5
+FUV_SLOPE = 1.5
+FUV_X_MIN = 0.03
+
+# radial shapes already computed on a grid, by (profile, grid, parameter)
+_SHAPES = {}
+
+
+def _cached_shape(name, R, key, func):
+    """
+    Return func(R) for the named shape, computed once per grid and key.
+    """
+    cache_key = (name, R.size, R[0], R[-1], R.data.tobytes(), key)
+    if cache_key not in _SHAPES:
+        _SHAPES[cache_key] = func(R)
+    return _SHAPES[cache_key]
+
+
+def _normalise(shape, edges):
+    """
+    Return shape normalised to a total rate of 1 on the grid, row by row.
+    """
+    area = np.pi*(edges[1:]**2 - edges[:-1]**2)
+    total = (shape*area).sum(axis=-1, keepdims=True)
+    return shape/np.where(total > 0., total, 1.)
+
+
+def gravitational_radius(Mstar):
+    """
+    Return the gravitational radius G Mstar/cs^2 (au) of the ionised gas.
+    """
+    return GM_SUN*np.asarray(Mstar, dtype=float)/(CS_ION*YR/AU)**2
+
+
+def euv_diffuse_shape(R, Mstar):
+    """
+    Return the diffuse EUV profile per unit Phi^1/2 (s^1/2), one row per disc.
+
+    Sigma_w = 2 mu m_H n0(R) u_l(R) outside 0.1 Rg, with the base density
+    n0 = C1 (3 Phi/(4 pi alpha_B Rg^3))^1/2 (2/(x^15/2 + x^25/2))^1/5 and the
+    launch velocity u_l = cs A exp(B (x-0.1)) (x-0.1)^D, x = R/Rg. The fit of
+    u_l grows exponentially and is capped at cs, which it reaches near 2.5 Rg.
+    """
+    Rg = gravitational_radius(Mstar)[:, None]
+    x = R/Rg
+    y = np.maximum(x-0.1, 0.)
+    n0 = EUV_C1*np.sqrt(3./(4.*np.pi*ALPHA_B*(Rg*AU)**3)) \
+        * (2./(x**7.5 + x**12.5))**0.2
+    u_l = CS_ION*np.minimum(EUV_A*np.exp(EUV_B*np.minimum(y, 10.))*y**EUV_D, 1.)
+    return 2.*MU_ION*M_H*n0*u_l*CGS_RATE
+
+
+def euv_direct_rate(R_in, Mstar, logPhi):
+    """
+    Return the direct EUV rate at the hole edge R_in (au), in Msun/au^2/yr.
+
+    Sigma_w = 2 C2 mu m_H cs (Phi/(4 pi alpha_B h R_in^3))^1/2 (R/R_in)^-a, with
+    h = H/R of the disc at R_in; multiply by (R/R_in)^-a for the profile.
+    """
+    R_in = np.asarray(R_in, dtype=float)
+    h = np.sqrt(sound_speed2(R_in)*R_in/(GM_SUN*np.asarray(Mstar)))
+    return 2.*EUV_C2*MU_ION*M_H*CS_ION*CGS_RATE*np.sqrt(
+        10.**np.asarray(logPhi)/(4.*np.pi*ALPHA_B*h*(R_in*AU)**3))
+
+
+def euv_profile(R, Mstar, logPhi):
+    """
+    Return the diffuse EUV wind of primordial discs (Msun/au^2/yr).
+    """
+    return euv_diffuse_shape(R, Mstar)*np.sqrt(10.**np.asarray(logPhi))[:, None]
+
+
+def inner_hole(R, sigma):
+    """
+    Return the radii (au) where the discs first become optically thin to the
+    ionising photons, R_thin, and the inner edge of the outer disc beyond,
+    R_in (np.inf without a gap or without an outer disc).
+    """
+    thin = sigma < SIGMA_THIN
+    first = np.argmax(thin, axis=1)
+    gap = thin[np.arange(len(sigma)), first]
+    outer = ~thin & (np.arange(R.size) > first[:, None])
+    edge = np.argmax(outer, axis=1)
+    has_outer = gap & outer[np.arange(len(sigma)), edge]
+    R_thin = np.where(gap, R[first], np.inf)
+    R_in = np.where(has_outer, R[edge], np.inf)
+    return R_thin, R_in
+
+
+def euv_wind(R, Mstar, logPhi):
+    """
+    Return the EUV wind of evolving discs as a function wind(t, sigma, rows)
+    for evolve_discs.
+
+    The diffuse field, diluted to Phi R_thin/R_in once a gap opens inside the
+    critical radius 1.4 Mstar au, is the cached diffuse shape times a scale;
+    the direct field of the star irradiates the outer disc beyond R_in once
+    the inner disc has drained, tapered by 1/(1 + exp(-(R-R_in)/H_in)) at the
+    edge. The hole is only searched for in discs that have a gap.
+    """
+    Mstar = np.asarray(Mstar, dtype=float)
+    logPhi = np.broadcast_to(np.asarray(logPhi, dtype=float), Mstar.shape)
+    diffuse = euv_diffuse_shape(R, Mstar)
+    sqrt_phi = np.sqrt(10.**logPhi)
+    direct = _cached_shape("euv_direct", R, None, lambda R: R**-EUV_SLOPE)
+    R_crit = 1.4*Mstar
+
+    def wind(t, sigma, rows):
+        scale = sqrt_phi[rows]
+        out = diffuse[rows]
+        gap = (sigma < SIGMA_THIN).any(axis=1)
+        if not gap.any():
+            return out*scale[:, None]
+        R_thin, R_in = inner_hole(R, sigma[gap])
+        opened = np.isfinite(R_in)
+        dilute = opened & (R_thin < R_crit[rows][gap])
+        scale = scale.copy()
+        scale[np.flatnonzero(gap)[dilute]] *= np.sqrt(R_thin/R_in)[dilute]
+        out = out*scale[:, None]
+
+        # direct field on the outer discs of drained inner discs
+        drained = opened & (R_thin == R[0])
+        if drained.any():
+            idx = np.flatnonzero(gap)[drained]
+            R_in = R_in[drained][:, None]
+            H_in = np.sqrt(sound_speed2(R_in)*R_in**3
+                           / (GM_SUN*Mstar[rows[idx]][:, None]))
+            rate = euv_direct_rate(R_in[:, 0], Mstar[rows[idx]],
+                                   logPhi[rows[idx]])*R_in[:, 0]**EUV_SLOPE
+            out[idx] += rate[:, None]*direct \
+                / (1.+np.exp(-np.clip((R-R_in)/H_in, -50., 50.)))
+        return out
+    return wind
+
+
+def xray_rate(Mstar, logLx):
+    """
+    Return the total X-ray photoevaporation rate (Msun/yr).
+
+    Mdot = 3.93e-8 Mstar Mdot(Lsoft)/Mdot(Lsoft,mean), with
+    log Mdot(L) = aL exp((ln log L - bL)^2/cL) + dL, the soft luminosity
+    log Lsoft = 0.95 log Lx + 1.19 and the mean log Lx = 1.54 log Mstar + 30.31.
+    """
+    aL, bL, cL, dL = XRAY_LSOFT
+    Mstar = np.asarray(Mstar, dtype=float)
+
+    def log_mdot(logLx):
+        logL = 0.95*logLx + 1.19
+        return aL*np.exp((np.log(logL)-bL)**2/cL) + dL
+    return XRAY_MDOT_1MSUN*Mstar*10.**(
+        log_mdot(np.asarray(logLx)) - log_mdot(1.54*np.log10(Mstar)+30.31))
+
+
+def xray_shape(R, edges, Mtab):
+    """
+    Return the X-ray profile of Picogna et al. (2021) for the tabulated stellar
+    mass Mtab, normalised to a total rate of 1 on the grid.
+
+    Mdot(<R)/Mdot_w = 10^P(log R) with P the polynomial of XRAY_PROFILES, so
+    Sigma_w = dMdot(<R)/dR/(2 pi R) = P'(log R) 10^P/(2 pi R^2); the fit is
+    used up to the radius where Mdot(<R) peaks.
+    """
+    def shape(R):
+        coeffs = XRAY_PROFILES[Mtab]
+        logR = np.log10(R)
+        P = np.polyval(coeffs, logR)
+        dP = np.polyval(np.polyder(coeffs), logR)
+        sigma = np.maximum(dP, 0.)*10.**np.minimum(P, 0.)/(2.*np.pi*R**2)
+        sigma[R > R[np.argmax(P)]] = 0.
+        return _normalise(sigma, edges)
+    return _cached_shape("xray", R, Mtab, shape)
+
+
+def xray_profile(R, edges, Mstar, logLx):
+    """
+    Return the X-ray wind of primordial discs (Msun/au^2/yr), using for every
+    star the profile of the nearest tabulated stellar mass (in log) scaled to
+    its total rate xray_rate.
+    """
+    Mstar = np.asarray(Mstar, dtype=float)
+    masses = np.array(sorted(XRAY_PROFILES))
+    shapes = np.array([xray_shape(R, edges, Mtab) for Mtab in masses])
+    nearest = np.argmin(np.abs(np.log10(Mstar)[:, None]-np.log10(masses)),
+                        axis=1)
+    return shapes[nearest]*xray_rate(Mstar, logLx)[:, None]
+
+
+def fuv_luminosity(Mstar, Macc, Rstar, Lstar):
+    """
+    Return the FUV luminosity (Lsun) of stars of mass Mstar (Msun), radius
+    Rstar (Rsun) and luminosity Lstar (Lsun) accreting Macc (Msun/yr).
+
+    L_FUV = 1e-2 Lsun (Mstar/Msun) (Rstar/Rsun)^-1 (Macc/1e-8 Msun/yr)
+    + 10^-3.3 Lstar, the accretion luminosity as a 9000 K black body (Gorti
+    et al. 2009) and the chromospheric emission of weak-line T Tauri stars
+    (Valenti et al. 2003), eqs. (fuvacc) and (fuvchr).
+    """
+    Mstar, Macc, Rstar, Lstar = (np.asarray(x, dtype=float)
+                                 for x in (Mstar, Macc, Rstar, Lstar))
+    return FUV_ACC*Mstar/Rstar*(Macc/1.e-8) + FUV_CHR*Lstar
+
+
+def fuv_rate(Mstar, L_FUV):
+    """
+    Return the total FUV photoevaporation rate (Msun/yr) of stars of mass
+    Mstar (Msun) and FUV luminosity L_FUV (Lsun).
+
+    Mdot = 3e-8 (L_FUV/1e-3 Lsun)^0.5 (Mstar/Msun)^2.06 Msun/yr, with the
+    stellar-mass dependence of Komaki et al. (2021).
+    """
+    Mstar = np.asarray(Mstar, dtype=float)
+    L_FUV = np.asarray(L_FUV, dtype=float)
+    return FUV_MDOT_1MSUN*(L_FUV/FUV_LUM_REF)**FUV_LUM_SLOPE \
+        * Mstar**FUV_MASS_SLOPE
+
+
+def fuv_shape(R, edges, Mstar):
+    """
+    Return the FUV profile normalised to a total rate of 1 on the grid, one
+    row per disc.
+
+    Sigma_w is proportional to x^-1.5 exp(-x) with x = R/Rg, Rg = G Mstar/cs^2
+    the gravitational radius of the FUV-heated gas (about 100 au for a 1 Msun
+    star), from 0.03 Rg (3 au for 1 Msun) outwards, so that the mass is lost
+    over the outer disc up to about Rg.
+    """
+    Rg = GM_SUN*np.asarray(Mstar, dtype=float)[:, None]/(FUV_CS*YR/AU)**2
+    x = R/Rg
+    shape = np.where(x > FUV_X_MIN, x**-FUV_SLOPE*np.exp(-x), 0.)
+    return _normalise(shape, edges)
+
+
+def fuv_profile(R, edges, Mstar, L_FUV):
+    """
+    Return the FUV wind of discs (Msun/au^2/yr) around stars of mass Mstar
+    (Msun) with FUV luminosity L_FUV (Lsun).
+    """
+    Mstar = np.asarray(Mstar, dtype=float)
+    return fuv_shape(R, edges, Mstar)*fuv_rate(Mstar, L_FUV)[..., None]
+
+
+def fuv_wind(R, edges, Mstar, nu, Rstar, Lstar):
+    """
+    Return the FUV wind of evolving discs as a function wind(t, sigma, rows)
+    for evolve_discs.
+
+    nu is the viscosity of the discs on the grid (disc.viscosity), from which
+    the accretion rate onto the star is computed at every step as in
+    evolve_discs, giving the FUV luminosity of the star (fuv_luminosity) and
+    the rate of the wind (fuv_rate), on the shape fuv_shape computed once.
+    Rstar (Rsun) and Lstar (Lsun) are the radius and luminosity of the stars
+    (see lib.stellar_properties).
+    """
+    Mstar, Rstar, Lstar = np.broadcast_arrays(
+        *(np.asarray(x, dtype=float) for x in (Mstar, Rstar, Lstar)))
+    shape = fuv_shape(R, edges, Mstar)
+    _, _, _, w, k_in = diffusion_operator(R, edges, nu)
+    Macc_rate = k_in*w[:, 0]
+
+    def wind(t, sigma, rows):
+        Macc = Macc_rate[rows]*sigma[:, 0]
+        L_FUV = fuv_luminosity(Mstar[rows], Macc, Rstar[rows], Lstar[rows])
+        return shape[rows]*fuv_rate(Mstar[rows], L_FUV)[:, None]
+    return wind
+
+
+def wind_rate(wind, edges):
+    """
+    Return the integrated rate (Msun/yr) of a (disc x radius) wind profile.
+    """
+    area = np.pi*(edges[1:]**2 - edges[:-1]**2)
+    return (np.asarray(wind)*area).sum(axis=1)